@@ -0,0 +1,134 @@
+"""
+Fixtures for the benchmarks of the contents managers against local stand-ins
+of the storage backends: a moto server for S3, started here, and
+fake-gcs-server for GCS, used when STORAGE_EMULATOR_HOST is set.
+"""
+
+import os
+import socket
+import subprocess
+import sys
+import time
+import tracemalloc
+import urllib.request
+import uuid
+
+import pytest
+
+BUCKET = "benchmarks"
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture(scope="session")
+def moto_endpoint():
+    """Endpoint of a moto server running in a subprocess, so its memory is not
+    counted in the peak memory of the benchmarks"""
+    port = free_port()
+    endpoint = "http://127.0.0.1:{}".format(port)
+    process = subprocess.Popen(
+        [sys.executable, "-m", "moto.server", "-H", "127.0.0.1", "-p", str(port)],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 30
+    while True:
+        try:
+            urllib.request.urlopen(endpoint + "/moto-api/")
+            break
+        except OSError:
+            if time.monotonic() > deadline or process.poll() is not None:
+                process.kill()
+                raise RuntimeError("The moto server didn't start")
+            time.sleep(0.1)
+    request = urllib.request.Request(endpoint + "/" + BUCKET, method="PUT")
+    urllib.request.urlopen(request)
+    yield endpoint
+    process.terminate()
+    process.wait()
+
+
+def make_s3_contents_manager(endpoint, prefix):
+    from s3contents import S3ContentsManager
+
+    return S3ContentsManager(
+        access_key_id="access-key",
+        secret_access_key="secret-key",
+        endpoint_url=endpoint,
+        bucket=BUCKET,
+        prefix=prefix,
+    )
+
+
+def make_gcs_contents_manager(prefix):
+    import gcsfs
+
+    from s3contents.gcs import GCSContentsManager
+
+    fs = gcsfs.GCSFileSystem(token="anon")
+    if not fs.exists(BUCKET):
+        fs.mkdir(BUCKET)
+    return GCSContentsManager(
+        project="benchmarks", token="anon", bucket=BUCKET, prefix=prefix
+    )
+
+
+@pytest.fixture(params=["s3", "gcs"])
+def contents_manager(request):
+    # Every benchmark works under its own prefix
+    prefix = uuid.uuid4().hex
+    if request.param == "s3":
+        cm = make_s3_contents_manager(request.getfixturevalue("moto_endpoint"), prefix)
+    else:
+        if not os.environ.get("STORAGE_EMULATOR_HOST"):
+            pytest.skip("STORAGE_EMULATOR_HOST is not set, see `just fake-gcs`")
+        cm = make_gcs_contents_manager(prefix)
+    yield cm
+    cm.fs.fs.rm(cm.fs.path(""), recursive=True)
+
+
+class Recorder:
+    """Count the backend requests made while recording"""
+
+    def __init__(self, contents_manager):
+        self.requests = 0
+        self.recording = False
+        contents_manager.fs.add_request_listener(self.on_request)
+
+    def on_request(self, operation):
+        if self.recording:
+            self.requests += 1
+
+
+@pytest.fixture
+def measure(benchmark, contents_manager):
+    """Benchmark `func` and record the backend requests and the peak memory
+    (Python allocations) of one more call in the `extra_info` of the results.
+
+    `setup` is called before each call, e.g. to create the directory a
+    benchmark deletes.
+    """
+    recorder = Recorder(contents_manager)
+
+    def measure(func, setup=None, rounds=5):
+        benchmark.pedantic(func, setup=setup, rounds=rounds, iterations=1)
+        if setup is not None:
+            setup()
+        recorder.requests = 0
+        recorder.recording = True
+        tracemalloc.start()
+        try:
+            func()
+            _, peak_memory = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+            recorder.recording = False
+        benchmark.extra_info["requests"] = recorder.requests
+        benchmark.extra_info["peak_memory"] = peak_memory
+
+    yield measure
+    contents_manager.fs.remove_request_listener(recorder.on_request)
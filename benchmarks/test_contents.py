@@ -0,0 +1,87 @@
+"""
+Latency, peak memory and backend requests of the contents manager operations.
+
+    pytest benchmarks --no-cov --benchmark-autosave
+"""
+
+import base64
+
+import pytest
+
+from s3contents.ipycompat import new_code_cell, new_notebook
+
+FILES_IN_DIRECTORY = 100
+CHUNK_SIZE = 1024 * 1024
+UPLOAD_SIZE = 100 * CHUNK_SIZE
+
+
+def notebook_model():
+    cells = [new_code_cell("print({})".format(i), outputs=[]) for i in range(200)]
+    return {"type": "notebook", "content": new_notebook(cells=cells)}
+
+
+def populate(cm, path, count):
+    """Create the directory `path` with `count` small files"""
+    cm.fs.mkdir(path)
+    contents = {
+        cm.fs.path(path, "file{:05d}.txt".format(i)): b"x" * 100 for i in range(count)
+    }
+    cm.fs.fs.pipe(contents)
+    cm.fs.fs.invalidate_cache()
+
+
+def test_get(contents_manager, measure):
+    cm = contents_manager
+    cm.save(notebook_model(), "notebook.ipynb")
+    measure(lambda: cm.get("notebook.ipynb"))
+
+
+def test_save(contents_manager, measure):
+    cm = contents_manager
+    model = notebook_model()
+    cm.save(model, "notebook.ipynb")
+    measure(lambda: cm.save(model, "notebook.ipynb"))
+
+
+@pytest.mark.parametrize("entries", [10, 1000, 10000])
+def test_list_directory(contents_manager, measure, entries):
+    cm = contents_manager
+    populate(cm, "directory", entries)
+    measure(lambda: cm.get("directory"), rounds=3)
+
+
+def test_rename_directory(contents_manager, measure):
+    cm = contents_manager
+
+    def setup():
+        if cm.dir_exists("renamed"):
+            cm.delete_file("renamed")
+        populate(cm, "directory", FILES_IN_DIRECTORY)
+
+    measure(lambda: cm.rename_file("directory", "renamed"), setup=setup)
+
+
+def test_delete_directory(contents_manager, measure):
+    cm = contents_manager
+    measure(
+        lambda: cm.delete_file("directory"),
+        setup=lambda: populate(cm, "directory", FILES_IN_DIRECTORY),
+    )
+
+
+def test_chunked_upload(contents_manager, measure):
+    cm = contents_manager
+    chunk = base64.b64encode(b"x" * CHUNK_SIZE).decode("ascii")
+    count = UPLOAD_SIZE // CHUNK_SIZE
+
+    def upload():
+        for i in range(1, count + 1):
+            model = {
+                "type": "file",
+                "format": "base64",
+                "chunk": -1 if i == count else i,
+                "content": chunk,
+            }
+            cm.save(model, "upload.bin")
+
+    measure(upload, rounds=1)
@@ -0,0 +1,49 @@
+"""
+CPU time of saving and loading large notebooks with each notebook serializer,
+against the in-memory backend so only the serialization is measured.
+
+    pytest benchmarks/test_serializers.py --no-cov --benchmark-group-by=func
+"""
+
+import pytest
+
+from s3contents.ipycompat import new_code_cell, new_notebook, new_output
+from s3contents.memorymanager import MemoryContentsManager
+
+SERIALIZERS = ["json", "orjson"]
+
+
+def large_notebook_model():
+    """About 5MB notebook, 500 cells with 10KB of outputs each"""
+    cells = [
+        new_code_cell(
+            "df.describe()  # {}".format(i),
+            outputs=[
+                new_output("stream", text="{:>10}\n".format(i) * 500),
+                new_output("execute_result", data={"text/html": "<td>x</td>" * 500}),
+            ],
+        )
+        for i in range(500)
+    ]
+    return {"type": "notebook", "content": new_notebook(cells=cells)}
+
+
+def contents_manager(serializer):
+    if serializer == "orjson":
+        pytest.importorskip("orjson")
+    return MemoryContentsManager(notebook_serializer=serializer)
+
+
+@pytest.mark.parametrize("serializer", SERIALIZERS)
+def test_save_large_notebook(benchmark, serializer):
+    cm = contents_manager(serializer)
+    model = large_notebook_model()
+    benchmark(cm.save, model, "notebook.ipynb")
+    benchmark.extra_info["size"] = len(cm.fs.files["notebook.ipynb"][0])
+
+
+@pytest.mark.parametrize("serializer", SERIALIZERS)
+def test_load_large_notebook(benchmark, serializer):
+    cm = contents_manager(serializer)
+    cm.save(large_notebook_model(), "notebook.ipynb")
+    benchmark(cm.get, "notebook.ipynb")
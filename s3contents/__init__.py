@@ -2,6 +2,12 @@ from s3contents.__about__ import __version__
 
 from .s3manager import S3ContentsManager  # noqa
 
+try:
+    from .asyncs3manager import AsyncS3ContentsManager  # noqa
+except ImportError:
+    # AsyncContentsManager is only available in jupyter_server
+    pass
+
 __all__ = [
     "__version__",
 ]
@@ -0,0 +1,47 @@
+"""
+Asynchronous version of the bucket checkpoints for AsyncGenericContentsManager
+"""
+
+from s3contents.checkpoints import GenericBucketCheckpoints
+from s3contents.genericfs import requests_of, run_on_loop
+from s3contents.ipycompat import AsyncCheckpoints
+
+if AsyncCheckpoints is None:
+    raise ImportError(
+        "AsyncGenericBucketCheckpoints requires jupyter_server. "
+        "Install it with: pip install jupyter_server"
+    )
+
+
+class AsyncGenericBucketCheckpoints(GenericBucketCheckpoints, AsyncCheckpoints):
+    async def create_checkpoint(self, contents_mgr, path):
+        # The checkpoint is a copy of the object in the bucket
+        await contents_mgr.flush_writes(path)
+        return await self._run(self._create_checkpoint(path))
+
+    async def restore_checkpoint(self, contents_mgr, checkpoint_id, path):
+        await contents_mgr.flush_writes(path)
+        await self._run(self._restore_checkpoint(checkpoint_id, path))
+
+    async def rename_checkpoint(self, checkpoint_id, old_path, new_path):
+        await self._run(self._rename_checkpoint(checkpoint_id, old_path, new_path))
+
+    async def delete_checkpoint(self, checkpoint_id, path):
+        await self._run(self._delete_checkpoint(checkpoint_id, path))
+
+    async def list_checkpoints(self, path):
+        return await self._run(self._list_checkpoints(path))
+
+    async def rename_all_checkpoints(self, old_path, new_path):
+        await self._run(self._rename_all_checkpoints(old_path, new_path))
+
+    async def delete_all_checkpoints(self, path):
+        await self._run(self._delete_all_checkpoints(path))
+
+    async def _run(self, coro):
+        with requests_of(self.fs):
+            return await run_on_loop(self.fs.fs.loop, coro)
+
+
+class AsyncS3Checkpoints(AsyncGenericBucketCheckpoints):
+    last_modified_key = "LastModified"
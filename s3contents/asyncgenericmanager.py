@@ -0,0 +1,465 @@
+"""
+Asynchronous version of GenericContentsManager for jupyter_server.
+
+Every call to the file system is awaited so slow S3/GCS requests don't block
+the Jupyter server event loop and concurrent requests overlap.
+"""
+
+import asyncio
+import mimetypes
+
+from s3contents.coalesce import Coalescer
+from s3contents.genericfs import BulkOperationError, GenericFSError, NoSuchFile
+from s3contents.genericmanager import (
+    GenericContentsManager,
+    base_directory_model,
+    base_model,
+)
+from s3contents.ipycompat import (
+    AsyncContentsManager,
+    AsyncGenericFileCheckpoints,
+    from_dict,
+)
+
+if AsyncContentsManager is None:
+    raise ImportError(
+        "AsyncGenericContentsManager requires jupyter_server. "
+        "Install it with: pip install jupyter_server"
+    )
+
+
+class AsyncGenericContentsManager(
+    AsyncContentsManager,
+    GenericContentsManager,
+):
+    def __init__(self, *args, **kwargs):
+        super(AsyncGenericContentsManager, self).__init__(*args, **kwargs)
+        # Concurrent saves of a path make one upload in flight and one queued
+        self.save_coalescer = Coalescer()
+
+    def _checkpoints_class_default(self):
+        return AsyncGenericFileCheckpoints
+
+    async def already_exists(self, path):
+        thing = "File" if await self.file_exists(path) else "Directory"
+        self.do_error(
+            "{thing} already exists: [{path}]".format(thing=thing, path=path),
+            409,
+        )
+
+    async def guess_type(self, path, allow_directory=True, stat=None):
+        """
+        Guess the type of a file.
+        If allow_directory is False, don't consider the possibility that the
+        file is a directory.
+        """
+        self.log.debug(
+            "guess_type with path=%s and allow_directory=%s",
+            path,
+            allow_directory,
+        )
+        if path.endswith(".ipynb"):
+            return "notebook"
+        elif allow_directory and stat is not None:
+            return "directory" if stat["type"] == "directory" else "file"
+        elif allow_directory and await self.dir_exists(path):
+            return "directory"
+        else:
+            return "file"
+
+    async def file_exists(self, path):
+        # Does a file exist at the given path?
+        self.log.debug(
+            "S3contents.AsyncGenericManager.file_exists: ('%s')",
+            path,
+        )
+        journal = self.journal
+        if journal is not None and journal.pending_stat(path.strip("/")):
+            return True
+        return await self.fs._isfile(path)
+
+    async def dir_exists(self, path):
+        # Does a directory exist at the given path?
+        self.log.debug(
+            "S3contents.AsyncGenericManager.dir_exists: path('%s')",
+            path,
+        )
+        return await self.fs._isdir(path)
+
+    async def get(
+        self,
+        path,
+        content=True,
+        type=None,
+        format=None,
+        require_hash=False,
+    ):
+        # Get a file or directory model.
+        self.log.debug(
+            "S3contents.AsyncGenericManager.get: '%s' type(%s) format(%s)",
+            path,
+            type,
+            format,
+        )
+
+        path = path.strip("/")
+
+        model = self._get_journaled(path, content, type, format, require_hash)
+        if model is not None:
+            return model
+
+        # The stat is built once and threaded through the model builders
+        stat = None
+        if type is None:
+            if not path.endswith(".ipynb"):
+                stat = await self.fs._stat(path)
+            type = await self.guess_type(path, stat=stat)
+        try:
+            func = {
+                "directory": self._get_directory,
+                "notebook": self._get_notebook,
+                "file": self._get_file,
+            }[type]
+        except KeyError:
+            raise ValueError("Unknown type passed: '%s'" % type) from None
+
+        return await func(
+            path=path,
+            content=content,
+            format=format,
+            require_hash=require_hash,
+            stat=stat,
+        )
+
+    async def _get_directory(
+        self, path, content=True, format=None, require_hash=False, stat=None
+    ):
+        return await self._directory_model_from_path(
+            path,
+            content=content,
+            stat=stat,
+        )
+
+    async def _get_notebook(
+        self, path, content=True, format=None, require_hash=False, stat=None
+    ):
+        return await self._notebook_model_from_path(
+            path,
+            content=content,
+            format=format,
+            require_hash=require_hash,
+            stat=stat,
+        )
+
+    async def _get_file(
+        self, path, content=True, format=None, require_hash=False, stat=None
+    ):
+        return await self._file_model_from_path(
+            path,
+            content=content,
+            format=format,
+            require_hash=require_hash,
+            stat=stat,
+        )
+
+    async def _directory_model_from_path(self, path, content=False, stat=None):
+        self.log.debug(
+            "S3contents.AsyncGenericManager._directory_model_from_path: "
+            "path('%s') type(%s)",
+            path,
+            content,
+        )
+        model = base_directory_model(path)
+        if stat is None:
+            stat = await self.fs._stat(path)
+        if stat["type"] == "directory" and stat["ST_MTIME"]:
+            model["created"] = model["last_modified"] = stat["ST_MTIME"]
+        if content:
+            if stat["type"] != "directory":
+                self.no_such_entity(path)
+            model["format"] = "json"
+            model["content"] = self._with_journaled(
+                path,
+                [
+                    self._model_from_entry(entry)
+                    for entry in await self.fs._list_details(path)
+                ],
+            )
+        return model
+
+    async def _notebook_model_from_path(
+        self, path, content=False, format=None, require_hash=False, stat=None
+    ):
+        """
+        Build a notebook model from database record.
+        """
+        model = base_model(path)
+        model["type"] = "notebook"
+
+        bytes_content = None
+        if content:
+            try:
+                if stat is None:
+                    # One GET gives us both the content and the stat
+                    (
+                        file_content,
+                        _,
+                        bytes_content,
+                        stat,
+                    ) = await self.fs._read_with_stat(path, format)
+                else:
+                    file_content, _, bytes_content = await self.fs._read(
+                        path,
+                        format,
+                    )
+            except NoSuchFile:
+                self.no_such_entity(path)
+            # Before checking the signature, computed with the outputs
+            if self._has_blobs(file_content):
+                nb_content = await asyncio.to_thread(
+                    self._read_notebook, path, file_content
+                )
+            else:
+                nb_content = self._read_notebook(path, file_content)
+            self.mark_trusted_cells(nb_content, path)
+            model["format"] = "json"
+            model["content"] = nb_content
+            self.validate_notebook_model(model)
+        elif stat is None:
+            stat = await self.fs._stat(path)
+
+        self._update_model_from_stat(model, stat)
+
+        if require_hash:
+            if bytes_content is None:
+                # Stored at write time, without downloading the file
+                digest = stat.get("SHA256") or await self.fs._hash(path)
+                model.update(hash=digest, hash_algorithm="sha256")
+            else:
+                model.update(**self._get_hash(bytes_content))
+
+        return model
+
+    async def _file_model_from_path(
+        self, path, content=False, format=None, require_hash=False, stat=None
+    ):
+        """
+        Build a file model from database record.
+        """
+        model = base_model(path)
+        model["type"] = "file"
+
+        bytes_content = None
+        if content:
+            try:
+                if stat is None:
+                    (
+                        content,
+                        format_,
+                        bytes_content,
+                        stat,
+                    ) = await self.fs._read_with_stat(path, format)
+                else:
+                    content, format_, bytes_content = await self.fs._read(
+                        path,
+                        format,
+                    )
+            except NoSuchFile as e:
+                self.no_such_entity(e.path)
+            except GenericFSError as e:
+                self.do_error(str(e), 500)
+            model["format"] = format_
+            model["content"] = content
+            model["mimetype"] = mimetypes.guess_type(path)[0] or "text/plain"
+        elif stat is None:
+            stat = await self.fs._stat(path)
+
+        self._update_model_from_stat(model, stat)
+
+        if require_hash:
+            if bytes_content is None:
+                # Stored at write time, without downloading the file
+                digest = stat.get("SHA256") or await self.fs._hash(path)
+                model.update(hash=digest, hash_algorithm="sha256")
+            else:
+                model.update(**self._get_hash(bytes_content))
+
+        return model
+
+    async def save(self, model, path):
+        """Save a file or directory model to path."""
+
+        # Not formatted unless logged, models hold the whole notebook
+        self.log.debug("save with path=%s, model=%s", path, model)
+
+        chunk = model.get("chunk", None)
+        if chunk is not None:
+            return await self._save_large_file(
+                chunk,
+                model,
+                path,
+                model.get("format"),
+            )
+
+        if "type" not in model:
+            self.do_error("No model type provided", 400)
+        if "content" not in model and model["type"] != "directory":
+            self.do_error("No file content provided", 400)
+
+        if model["type"] not in ("file", "directory", "notebook"):
+            self.do_error("Unhandled contents type: %s" % model["type"], 400)
+
+        self.run_pre_save_hook(model=model, path=path)
+
+        try:
+            if model["type"] == "notebook":
+                validation_message = await self._save_notebook(model, path)
+            elif model["type"] == "file":
+                validation_message = await self._save_file(model, path)
+            else:
+                validation_message = await self._save_directory(path)
+        except Exception as e:
+            self.log.error(
+                "Error while saving file: %s %s",
+                path,
+                e,
+                exc_info=True,
+            )
+            self.do_error(
+                "Unexpected error while saving file: %s %s" % (path, e),
+                500,
+            )
+
+        model = await self.get(path, type=model["type"], content=False)
+
+        self.run_post_save_hook(model=model, s3_path=model["path"])
+
+        if validation_message is not None:
+            model["message"] = validation_message
+        return model
+
+    async def _save_large_file(self, chunk, model, path, format):
+        if "type" not in model:
+            self.do_error("No file type provided", 400)
+        if model["type"] != "file":
+            error = 'File type "{}" is not supported for large file transfer'
+            self.do_error(error.format(model["type"]), 400)
+        if "content" not in model and model["type"] != "directory":
+            self.do_error("No file content provided", 400)
+
+        if format not in {"text", "base64"}:
+            self.do_error(
+                "Must specify format of file contents as 'text' or 'base64'",
+                400,
+            )
+
+        try:
+            if chunk == 1:
+                # A journaled save uploaded later would overwrite the file
+                await self.flush_writes(path)
+                self.run_pre_save_hook(model=model, path=path)
+            # The file system stores the chunk, the last one writes the file
+            await self.fs._write_chunk(path, chunk, model["content"], format)
+        except Exception as e:
+            self.log.error(
+                "S3contents.AsyncGenericManager._save_large_file: "
+                "error while saving file: %s %s",
+                path,
+                e,
+                exc_info=True,
+            )
+            self.do_error(f"Unexpected error while saving file: {path} {e}")
+
+        return await self.get(path, content=False)
+
+    async def _save_notebook(self, model, path):
+        nb_contents = from_dict(model["content"])
+        self.check_and_sign(nb_contents, path)
+
+        async def write():
+            # Not serialized at all if replaced by a newer save
+            if self.offload_outputs_threshold or self.cell_storage:
+                # Blobs are uploaded without blocking the event loop
+                file_contents = await asyncio.to_thread(
+                    self._notebook_to_store, model["content"]
+                )
+            else:
+                file_contents = self.serializer.dumps(model["content"])
+            if not await self._write_behind_async(path, file_contents, "text"):
+                await self.fs._writenotebook(path, file_contents)
+
+        await self.save_coalescer.run(path.strip("/"), write)
+        self.validate_notebook_model(model)
+        return model.get("message")
+
+    async def _save_file(self, model, path):
+        content = model["content"]
+        format_ = model.get("format")
+
+        async def write():
+            if not await self._write_behind_async(path, content, format_):
+                await self.fs._write(path, content, format_)
+
+        await self.save_coalescer.run(path.strip("/"), write)
+
+    async def _save_directory(self, path):
+        await self.fs._mkdir(path)
+
+    async def rename_file(self, old_path, new_path):
+        """Rename a file or directory."""
+        self.log.debug(
+            "S3contents.AsyncGenericManager.rename_file: '%s' to '%s'",
+            old_path,
+            new_path,
+        )
+        await self.flush_writes(old_path)
+        await self.flush_writes(new_path)
+        if await self.exists(new_path):
+            await self.already_exists(new_path)
+        elif await self.exists(old_path):
+            try:
+                await self.fs._mv(old_path, new_path)
+            except BulkOperationError as e:
+                self.do_error(str(e), 500)
+        else:
+            self.no_such_entity(old_path)
+
+    async def delete_file(self, path):
+        """Delete the file or directory at path."""
+        self.log.debug("S3contents.AsyncGenericManager.delete_file '%s'", path)
+        await self.flush_writes(path)
+        if await self.exists(path):
+            try:
+                await self.fs._rm(path)
+            except BulkOperationError as e:
+                self.do_error(str(e), 500)
+        else:
+            self.no_such_entity(path)
+
+    async def flush_writes(self, path=""):
+        """Upload the saves of `path`, and everything under it, that are still
+        in the write-behind journal"""
+        if self.journal is None:
+            return
+        try:
+            await asyncio.to_thread(self.journal.flush, path)
+        except Exception as e:
+            self.do_error(
+                "Unexpected error while uploading %s: %s" % (path, e),
+                500,
+            )
+
+    async def _write_behind_async(self, path, content, format):
+        if self.journal is None:
+            return False
+        # Journal writes are fsynced, don't block the event loop
+        return await asyncio.to_thread(
+            self._write_behind,
+            path,
+            content,
+            format,
+        )
+
+    async def is_hidden(self, path):
+        """Is path a hidden directory or file?"""
+        return False
@@ -0,0 +1,9 @@
+from s3contents.asyncgenericmanager import AsyncGenericContentsManager
+from s3contents.s3manager import S3ContentsManager
+
+
+class AsyncS3ContentsManager(AsyncGenericContentsManager, S3ContentsManager):
+    """S3ContentsManager implementing jupyter_server's AsyncContentsManager API.
+
+    Accepts the same configuration as S3ContentsManager.
+    """
@@ -0,0 +1,164 @@
+"""
+Content-addressed blobs holding the big outputs of notebooks.
+
+With `offload_outputs_threshold` the output data (e.g. a base64 PNG) of that
+size or bigger is stored once in a blob named after its SHA-256 and replaced
+in the notebook object by a reference to it. Saving a notebook whose plots
+didn't change uploads a small notebook object and no blob.
+"""
+
+import base64
+import concurrent.futures
+import contextvars
+import hashlib
+
+from s3contents.cache import LRUCache
+
+REFERENCE_PREFIX = "s3contents-blob:sha256:"
+
+
+def offload(nb, threshold):
+    """Replace the output data of `threshold` characters or more of `nb` by
+    blob references.
+
+    Returns the notebook, a copy if anything was replaced, and the blobs
+    `{digest: content}` referenced.
+    """
+    contents = {}
+    cells = []
+    for cell in nb.get("cells", []):
+        if cell.get("outputs"):
+            outputs = [
+                _offload_output(output, threshold, contents)
+                for output in cell["outputs"]
+            ]
+            cell = dict(cell, outputs=outputs)
+        cells.append(cell)
+    if not contents:
+        return nb, contents
+    return dict(nb, cells=cells), contents
+
+
+def _offload_output(output, threshold, contents):
+    if not output.get("data"):
+        return output
+    data = {}
+    for mimetype, value in output["data"].items():
+        if isinstance(value, str) and len(value) >= threshold:
+            content = value.encode("utf-8")
+            digest = hashlib.sha256(content).hexdigest()
+            contents[digest] = content
+            value = REFERENCE_PREFIX + digest
+        data[mimetype] = value
+    return dict(output, data=data)
+
+
+def references(nb):
+    """Digests of the blobs referenced by `nb`"""
+    return {
+        value[len(REFERENCE_PREFIX) :]
+        for data in _output_data(nb)
+        for value in data.values()
+        if _is_reference(value)
+    }
+
+
+def inflate(nb, contents):
+    """Replace in place the blob references of `nb` by their `{digest: content}`"""
+    for data in _output_data(nb):
+        for mimetype, value in data.items():
+            if _is_reference(value):
+                digest = value[len(REFERENCE_PREFIX) :]
+                data[mimetype] = contents[digest].decode("utf-8")
+
+
+def _output_data(nb):
+    for cell in nb.get("cells", []):
+        for output in cell.get("outputs", []):
+            if output.get("data"):
+                yield output["data"]
+
+
+def _is_reference(value):
+    return isinstance(value, str) and value.startswith(REFERENCE_PREFIX)
+
+
+class BlobStore:
+    """Blobs stored under `<internal_dir>/blobs` of a file system.
+
+    Blobs are immutable, the ones read or written are kept in an in-memory
+    LRU cache and the ones known to be stored are not uploaded again.
+    """
+
+    def __init__(self, fs, concurrency=16, cache_maxsize=128):
+        self.fs = fs
+        self.concurrency = concurrency
+        # Digest -> content
+        self.cache = LRUCache(maxsize=cache_maxsize)
+        # Digests of the blobs known to be stored
+        self.stored = LRUCache(maxsize=65536)
+
+    def path(self, digest):
+        return "{}/blobs/{}".format(self.fs.internal_dir, digest)
+
+    def put_many(self, contents):
+        """Store the blobs `{digest: content}` not stored yet"""
+        items = [item for item in contents.items() if item[0] not in self.stored]
+        self._map(self._put, items)
+
+    def _put(self, item):
+        digest, content = item
+        path = self.path(digest)
+        if not self.fs.isfile(path):
+            self.fs.write(path, base64.b64encode(content).decode("ascii"), "base64")
+        self.stored.set(digest, True)
+        self.cache.set(digest, content)
+
+    def digests(self):
+        """Digests of the stored blobs"""
+        prefix = "{}/blobs".format(self.fs.internal_dir)
+        if not self.fs.isdir(prefix):
+            return []
+        names = [path.rsplit("/", 1)[-1] for path in self.fs.ls(prefix)]
+        return [name for name in names if name != self.fs.dir_keep_file]
+
+    def delete_many(self, digests):
+        """Delete the blobs `digests`"""
+        self._map(self._delete, list(digests))
+
+    def _delete(self, digest):
+        self.fs.rm(self.path(digest))
+        self.stored.pop(digest)
+        self.cache.pop(digest)
+
+    def get_many(self, digests):
+        """Return the content of the blobs `digests` as `{digest: content}`.
+        Raises NoSuchFile if one is missing."""
+        contents, missing = {}, []
+        for digest in digests:
+            content = self.cache.get(digest)
+            if content is None:
+                missing.append(digest)
+            else:
+                contents[digest] = content
+        contents.update(zip(missing, self._map(self._get, missing)))
+        return contents
+
+    def _get(self, digest):
+        _, _, content = self.fs.read(self.path(digest), "base64")
+        self.stored.set(digest, True)
+        self.cache.set(digest, content)
+        return content
+
+    def _map(self, func, items):
+        """`[func(item) for item in items]` with up to `concurrency` calls in
+        flight, each in a copy of the current context"""
+        if len(items) <= 1:
+            return [func(item) for item in items]
+        workers = min(max(1, self.concurrency), len(items))
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(contextvars.copy_context().run, func, item)
+                for item in items
+            ]
+            return [future.result() for future in futures]
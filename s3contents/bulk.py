@@ -0,0 +1,61 @@
+"""
+Helpers to run many backend requests concurrently, e.g. to copy or delete
+every object under a prefix
+"""
+
+import asyncio
+
+
+class BulkResult:
+    """Outcome of a bulk operation: how many items succeeded and which failed"""
+
+    def __init__(self, operation, total):
+        self.operation = operation
+        self.total = total
+        self.succeeded = 0
+        self.failed = []  # (item, exception) tuples
+
+    @property
+    def done(self):
+        return self.succeeded + len(self.failed)
+
+    @property
+    def ok(self):
+        return not self.failed
+
+    def __repr__(self):
+        return "<BulkResult {}: {}/{} succeeded, {} failed>".format(
+            self.operation, self.succeeded, self.total, len(self.failed)
+        )
+
+
+async def run_bounded(operation, func, items, concurrency, on_progress=None):
+    """Call the coroutine function `func(item)` for every item with at most
+    `concurrency` calls in flight.
+
+    Failures don't stop the other calls, they are collected in the returned
+    BulkResult. `on_progress(result)` is called after every item.
+    """
+    items = list(items)
+    result = BulkResult(operation, len(items))
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def run_one(item):
+        async with semaphore:
+            try:
+                await func(item)
+            except Exception as e:
+                result.failed.append((item, e))
+            else:
+                result.succeeded += 1
+        if on_progress is not None:
+            on_progress(result)
+
+    await asyncio.gather(*[run_one(item) for item in items])
+    return result
+
+
+def batched(items, size):
+    """Split `items` in lists of at most `size` elements"""
+    items = list(items)
+    return [items[i : i + size] for i in range(0, len(items), size)]
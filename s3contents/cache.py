@@ -0,0 +1,244 @@
+"""
+Caches used by the file system abstractions
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class LRUCache:
+    """Bounded least-recently-used cache with an optional time-to-live.
+
+    Parameters
+    ----------
+    maxsize : int
+        Maximum number of entries kept. ``0`` disables the cache: nothing is
+        stored and every lookup is a miss.
+    ttl : float or None
+        Seconds an entry stays valid after being stored. ``None`` means
+        entries only leave the cache through eviction or invalidation.
+    """
+
+    def __init__(self, maxsize=1024, ttl=None, timer=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.timer = timer
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.RLock()
+
+    @property
+    def enabled(self):
+        return self.maxsize > 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING, count=False) is not _MISSING
+
+    def get(self, key, default=None, count=True):
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is not _MISSING:
+                expires_at, value = entry
+                if expires_at is None or expires_at > self.timer():
+                    self._data.move_to_end(key)
+                    if count:
+                        self.hits += 1
+                    return value
+                del self._data[key]
+            if count:
+                self.misses += 1
+            return default
+
+    def set(self, key, value):
+        if not self.enabled:
+            return
+        expires_at = None if self.ttl is None else self.timer() + self.ttl
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def get_or_set(self, key, func):
+        """Return the cached value for `key`, calling `func()` to fill it on a miss"""
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = func()
+            self.set(key, value)
+        return value
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._data.pop(key, _MISSING)
+        return default if entry is _MISSING else entry[1]
+
+    def invalidate_if(self, predicate):
+        """Drop every entry whose key matches `predicate(key)`"""
+        with self._lock:
+            stale = [key for key in self._data if predicate(key)]
+            for key in stale:
+                del self._data[key]
+        return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+        }
+
+
+class DiskCache:
+    """Cache of object contents on the local disk, bounded by the total size
+    of the entries with least-recently-used eviction.
+
+    Each entry is stored with a small metadata dictionary, e.g. the ETag of
+    the object, that the caller uses to revalidate it before trusting the
+    content. Entries left by a previous process are reused.
+
+    Parameters
+    ----------
+    directory : str
+        Directory to store the entries, created if it doesn't exist.
+    max_bytes : int
+        Maximum total size of the cached contents.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = os.path.expanduser(directory)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._sizes = OrderedDict()  # name -> size, least recently used first
+        self._total = 0
+        self._lock = threading.RLock()
+        os.makedirs(self.directory, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".data"):
+                continue
+            try:
+                st = os.stat(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, name[: -len(".data")], st.st_size))
+        for _, name, size in sorted(entries):
+            self._add(name, size)
+        self._evict()
+
+    @property
+    def size(self):
+        return self._total
+
+    def _name(self, key):
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+    def _paths(self, name):
+        base = os.path.join(self.directory, name)
+        return base + ".json", base + ".data"
+
+    def get(self, key):
+        """Return the `(metadata, content)` stored for `key` or None"""
+        name = self._name(key)
+        meta_path, data_path = self._paths(name)
+        with self._lock:
+            try:
+                with open(meta_path) as f:
+                    meta = json.load(f)
+                with open(data_path, "rb") as f:
+                    data = f.read()
+            except (OSError, ValueError):
+                self.misses += 1
+                return None
+            if meta.get("key") != key:
+                self.misses += 1
+                return None
+            os.utime(data_path)
+            self._add(name, len(data))
+            self.hits += 1
+        return meta["metadata"], data
+
+    def set(self, key, metadata, data):
+        if len(data) > self.max_bytes:
+            self.pop(key)
+            return
+        name = self._name(key)
+        meta_path, data_path = self._paths(name)
+        with self._lock:
+            self._write(data_path, data)
+            self._write(
+                meta_path,
+                json.dumps({"key": key, "metadata": metadata}).encode("utf-8"),
+            )
+            self._add(name, len(data))
+            self._evict()
+
+    def _write(self, path, data):
+        # Write and rename so readers never see partial entries
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def pop(self, key):
+        with self._lock:
+            self._remove(self._name(key))
+
+    def _add(self, name, size):
+        self._total += size - self._sizes.pop(name, 0)
+        self._sizes[name] = size
+
+    def _remove(self, name):
+        self._total -= self._sizes.pop(name, 0)
+        for path in self._paths(name):
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+    def _evict(self):
+        while self._sizes and self._total > self.max_bytes:
+            name = next(iter(self._sizes))
+            self._remove(name)
+
+    def clear(self):
+        with self._lock:
+            for name in list(self._sizes):
+                self._remove(name)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "size": self.size,
+            "max_bytes": self.max_bytes,
+            "entries": len(self._sizes),
+        }
@@ -0,0 +1,50 @@
+"""
+Notebooks stored cell by cell.
+
+With `cell_storage` the object of a notebook is a small index: the notebook
+metadata and the SHA-256 of each of its cells, stored as blobs next to the
+offloaded outputs. Saving a notebook where one cell changed uploads that cell
+and the index, the other cells are already stored.
+
+The index is not a valid notebook on purpose, tools reading the bucket
+directly fail instead of seeing an empty notebook.
+"""
+
+import hashlib
+import json
+
+LAYOUT_KEY = "s3contents_layout"
+LAYOUT = "cells"
+
+
+def split(nb):
+    """Return the index of the notebook `nb` and its cells as `{digest: content}`"""
+    contents, digests = {}, []
+    for cell in nb.get("cells", []):
+        content = json.dumps(cell, sort_keys=True).encode("utf-8")
+        digest = hashlib.sha256(content).hexdigest()
+        contents[digest] = content
+        digests.append(digest)
+    index = {key: value for key, value in nb.items() if key != "cells"}
+    index.update({LAYOUT_KEY: LAYOUT, "cells": digests})
+    return index, contents
+
+
+def parse_index(file_content):
+    """Return the index stored in `file_content`, None if it's a plain notebook"""
+    if LAYOUT_KEY not in file_content:
+        return None
+    try:
+        index = json.loads(file_content)
+    except ValueError:
+        return None
+    if isinstance(index, dict) and index.get(LAYOUT_KEY) == LAYOUT:
+        return index
+    return None
+
+
+def join(index, contents):
+    """Notebook dictionary of an `index` and its cells `{digest: content}`"""
+    nb = {key: value for key, value in index.items() if key != LAYOUT_KEY}
+    nb["cells"] = [json.loads(contents[digest]) for digest in index["cells"]]
+    return nb
@@ -0,0 +1,179 @@
+"""
+Checkpoints stored in the bucket next to the notebooks.
+
+Checkpoints are created and restored with server-side copies, no bytes go
+through the Jupyter server, and they survive server restarts.
+"""
+
+from fsspec.asyn import sync
+from tornado.web import HTTPError
+
+from s3contents.bulk import run_bounded
+from s3contents.genericfs import BulkOperationError, requests_of
+from s3contents.ipycompat import Checkpoints, Unicode
+
+
+class GenericBucketCheckpoints(Checkpoints):
+    """Checkpoints stored as objects in the bucket of the contents manager.
+
+    The checkpoint `checkpoint_id` of `path` is stored at
+    `<prefix>/<checkpoint_dir>/<path>/<checkpoint_id>`, the checkpoints of a
+    file or of all the files in a directory share a prefix and are listed
+    with a single request.
+    """
+
+    checkpoint_dir = Unicode(
+        ".s3contents/checkpoints",
+        help="Directory in the bucket (relative to the prefix) to store the checkpoints",
+    ).tag(config=True)
+
+    # Jupyter only uses one checkpoint per file
+    checkpoint_id = "checkpoint"
+
+    # Key of the last modified date in the fsspec file info
+    last_modified_key = None
+
+    @property
+    def fs(self):
+        return self.parent.fs
+
+    def checkpoint_path(self, checkpoint_id, path):
+        """Full path of a checkpoint object"""
+        return self.fs.path(self.checkpoint_dir, path.strip("/"), checkpoint_id)
+
+    def checkpoints_prefix(self, path):
+        """Full path of the prefix holding all the checkpoints under `path`"""
+        return self.fs.path(self.checkpoint_dir, path.strip("/"))
+
+    def no_such_checkpoint(self, path, checkpoint_id):
+        raise HTTPError(
+            404, "Checkpoint does not exist: {}@{}".format(path, checkpoint_id)
+        )
+
+    def checkpoint_model(self, checkpoint_id, info):
+        return {"id": checkpoint_id, "last_modified": info[self.last_modified_key]}
+
+    #  Checkpoints API --------------------------------------------------------
+
+    def create_checkpoint(self, contents_mgr, path):
+        # The checkpoint is a copy of the object in the bucket
+        contents_mgr.flush_writes(path)
+        return self._sync(self._create_checkpoint, path)
+
+    def restore_checkpoint(self, contents_mgr, checkpoint_id, path):
+        contents_mgr.flush_writes(path)
+        self._sync(self._restore_checkpoint, checkpoint_id, path)
+
+    def rename_checkpoint(self, checkpoint_id, old_path, new_path):
+        self._sync(self._rename_checkpoint, checkpoint_id, old_path, new_path)
+
+    def delete_checkpoint(self, checkpoint_id, path):
+        self._sync(self._delete_checkpoint, checkpoint_id, path)
+
+    def list_checkpoints(self, path):
+        return self._sync(self._list_checkpoints, path)
+
+    def rename_all_checkpoints(self, old_path, new_path):
+        self._sync(self._rename_all_checkpoints, old_path, new_path)
+
+    def delete_all_checkpoints(self, path):
+        self._sync(self._delete_all_checkpoints, path)
+
+    def _sync(self, coro_func, *args):
+        with requests_of(self.fs):
+            return sync(self.fs.fs.loop, coro_func, *args)
+
+    #  Coroutines running on the fsspec event loop ----------------------------
+
+    async def _create_checkpoint(self, path):
+        path_ = self.fs.path(path)
+        checkpoint_path_ = self.checkpoint_path(self.checkpoint_id, path)
+        self.log.debug(
+            "S3contents.Checkpoints: Creating checkpoint `%s`", checkpoint_path_
+        )
+        try:
+            await self.fs.fs._cp_file(path_, checkpoint_path_)
+        except FileNotFoundError:
+            raise HTTPError(
+                404, "No such entity: [{path}]".format(path=path)
+            ) from None
+        self.fs.fs.invalidate_cache(checkpoint_path_)
+        info = await self.fs.fs._info(checkpoint_path_)
+        return self.checkpoint_model(self.checkpoint_id, info)
+
+    async def _restore_checkpoint(self, checkpoint_id, path):
+        path_ = self.fs.path(path)
+        checkpoint_path_ = self.checkpoint_path(checkpoint_id, path)
+        self.log.debug(
+            "S3contents.Checkpoints: Restoring checkpoint `%s`", checkpoint_path_
+        )
+        try:
+            await self.fs.fs._cp_file(checkpoint_path_, path_)
+        except FileNotFoundError:
+            self.no_such_checkpoint(path, checkpoint_id)
+        self.fs.fs.invalidate_cache(path_)
+        self.fs.invalidate(path_)
+        if getattr(self.fs, "use_manifests", False):
+            # The restored file replaces the one in the manifest of its directory
+            stat = await self.fs._fetch_stat(path)
+            await self.fs._manifest_add(path, stat)
+
+    async def _rename_checkpoint(self, checkpoint_id, old_path, new_path):
+        old_path_ = self.checkpoint_path(checkpoint_id, old_path)
+        new_path_ = self.checkpoint_path(checkpoint_id, new_path)
+        try:
+            await self.fs.fs._cp_file(old_path_, new_path_)
+        except FileNotFoundError:
+            self.no_such_checkpoint(old_path, checkpoint_id)
+        await self.fs.fs._rm(old_path_)
+
+    async def _delete_checkpoint(self, checkpoint_id, path):
+        checkpoint_path_ = self.checkpoint_path(checkpoint_id, path)
+        # Deleting a missing object is not an error on S3
+        if not await self.fs.fs._exists(checkpoint_path_):
+            self.no_such_checkpoint(path, checkpoint_id)
+        await self.fs.fs._rm(checkpoint_path_)
+
+    async def _list_checkpoints(self, path):
+        prefix_ = self.checkpoints_prefix(path)
+        try:
+            infos = await self.fs.fs._ls(prefix_, detail=True, refresh=True)
+        except FileNotFoundError:
+            return []
+        return [
+            self.checkpoint_model(info["name"].rsplit("/", 1)[-1], info)
+            for info in infos
+            if info["type"] == "file"
+        ]
+
+    async def _rename_all_checkpoints(self, old_path, new_path):
+        # Also moves the checkpoints of the files inside a renamed directory
+        old_prefix_ = self.checkpoints_prefix(old_path)
+        new_prefix_ = self.checkpoints_prefix(new_path)
+        self.fs.fs.invalidate_cache(old_prefix_)
+        sources = await self.fs.fs._find(old_prefix_)
+
+        async def copy(source):
+            await self.fs.fs._cp_file(source, new_prefix_ + source[len(old_prefix_) :])
+
+        result = await run_bounded("copy", copy, sources, self.fs.bulk_concurrency)
+        self.fs.fs.invalidate_cache(new_prefix_)
+        if not result.ok:
+            raise BulkOperationError(result)
+        if sources:
+            await self.fs.fs._rm(sources)
+
+    async def _delete_all_checkpoints(self, path):
+        prefix_ = self.checkpoints_prefix(path)
+        self.fs.fs.invalidate_cache(prefix_)
+        sources = await self.fs.fs._find(prefix_)
+        if sources:
+            await self.fs.fs._rm(sources)
+
+
+class S3Checkpoints(GenericBucketCheckpoints):
+    last_modified_key = "LastModified"
+
+
+class GCSCheckpoints(GenericBucketCheckpoints):
+    last_modified_key = "mtime"
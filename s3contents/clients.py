@@ -0,0 +1,40 @@
+"""
+Process-wide registry of the fsspec file systems used to reach the buckets.
+
+Contents managers configured with the same endpoint, credentials and client
+settings, e.g. several prefixes mounted with hybridcontents, share one file
+system: the credentials are resolved and its connection pool is filled once.
+"""
+
+import os
+import threading
+
+from fsspec.utils import tokenize
+
+_lock = threading.Lock()
+# Token of the process, class and arguments -> file system
+_clients = {}
+
+
+def get_client(cls, **kwargs):
+    """Return the `cls(**kwargs)` file system shared by the callers passing the
+    same arguments"""
+    # boto3 sessions have the same repr whatever their credentials, they are
+    # told apart by identity. A forked process doesn't reuse the event loop and
+    # connections of its parent.
+    session = kwargs.get("session")
+    arguments = {k: v for k, v in kwargs.items() if k != "session"}
+    key = tokenize(os.getpid(), cls, arguments, id(session) if session else None)
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            # fsspec's own instance cache is per thread
+            client = cls(skip_instance_cache=True, **kwargs)
+            _clients[key] = client
+        return client
+
+
+def clear():
+    """Forget the shared file systems, the next `get_client` creates new ones"""
+    with _lock:
+        _clients.clear()
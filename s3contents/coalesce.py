@@ -0,0 +1,55 @@
+"""
+Coalescing of the writes of the same path, e.g. autosaves of a notebook
+edited collaboratively that arrive faster than they are uploaded
+"""
+
+import asyncio
+
+
+class Coalescer:
+    """Run at most one write per key at a time.
+
+    A write requested while another one of the same key is in flight is
+    queued, a newer write of that key replaces the queued one instead of
+    stacking after it. Callers whose write was replaced wait for the write
+    that replaced it, so every caller returns once its content or a newer one
+    is written.
+    """
+
+    def __init__(self):
+        # Key -> [queued write or None, future of the queued write]
+        self._queues = {}
+
+    def __len__(self):
+        return len(self._queues)
+
+    async def run(self, key, write):
+        """Call the coroutine function `write()` for `key`, or a newer one"""
+        queue = self._queues.get(key)
+        if queue is None:
+            future = asyncio.get_running_loop().create_future()
+            queue = self._queues[key] = [write, future]
+            asyncio.ensure_future(self._drain(key, queue))
+        elif queue[0] is None:
+            # A write is in flight and none is queued
+            future = asyncio.get_running_loop().create_future()
+            queue[:] = [write, future]
+        else:
+            future = queue[1]
+            queue[0] = write
+        # The write is shared with other callers, it's not cancelled with this one
+        return await asyncio.shield(future)
+
+    async def _drain(self, key, queue):
+        try:
+            while queue[0] is not None:
+                write, future = queue
+                queue[0] = None
+                try:
+                    result = await write()
+                except Exception as e:
+                    future.set_exception(e)
+                else:
+                    future.set_result(result)
+        finally:
+            del self._queues[key]
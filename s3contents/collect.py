@@ -0,0 +1,119 @@
+"""
+Delete the blobs (offloaded outputs and cells) that no notebook references
+anymore:
+
+    python -m s3contents.collect --config=jupyter_server_config.py
+
+The notebooks and their checkpoints in the bucket are read to find the blobs
+they reference. Servers remember which blobs are stored and don't upload them
+again, run it while no server is using the bucket.
+"""
+
+import json
+
+from traitlets.config import Application
+
+from s3contents import blobs, cells
+from s3contents.checkpoints import GenericBucketCheckpoints
+from s3contents.genericfs import NoSuchFile
+from s3contents.ipycompat import Unicode, default, import_item
+
+
+class CollectBlobsApp(Application):
+    name = "s3contents-collect"
+    description = "Delete the blobs no notebook references anymore"
+
+    config_file = Unicode(
+        "", help="Jupyter config file with the contents manager configuration"
+    ).tag(config=True)
+    contents_manager_class = Unicode(
+        "s3contents.S3ContentsManager", help="Contents manager of the notebooks"
+    ).tag(config=True)
+
+    @default("log_level")
+    def _log_level_default(self):
+        return "INFO"
+
+    aliases = {
+        "config": "CollectBlobsApp.config_file",
+        "contents-manager-class": "CollectBlobsApp.contents_manager_class",
+        "log-level": "Application.log_level",
+    }
+
+    def initialize(self, argv=None):
+        super(CollectBlobsApp, self).initialize(argv)
+        if self.config_file:
+            self.load_config_file(self.config_file)
+            # Command line options take precedence over the config file
+            self.update_config(self.cli_config)
+
+    def start(self):
+        contents_manager = import_item(self.contents_manager_class)(parent=self)
+        count = collect(contents_manager)
+        self.log.info("Deleted %s unreferenced blobs", count)
+
+
+def collect(contents_manager):
+    """Delete the blobs referenced by no notebook or checkpoint, returns how
+    many were deleted"""
+    store = contents_manager.blob_store
+    digests = store.digests()
+    if not digests:
+        return 0
+    referenced = set()
+    for path in notebooks(contents_manager, ""):
+        for stored_path in [path] + checkpoint_paths(contents_manager, path):
+            referenced.update(references(contents_manager, stored_path))
+    unreferenced = [digest for digest in digests if digest not in referenced]
+    store.delete_many(unreferenced)
+    return len(unreferenced)
+
+
+def notebooks(contents_manager, path):
+    """Paths of the notebooks under the directory `path`"""
+    model = contents_manager.get(path, content=True)
+    for item in model["content"]:
+        if item["type"] == "directory":
+            yield from notebooks(contents_manager, item["path"])
+        elif item["type"] == "notebook":
+            yield item["path"]
+
+
+def checkpoint_paths(contents_manager, path):
+    """Paths of the checkpoints of `path` stored in the bucket"""
+    checkpoints = contents_manager.checkpoints
+    if not isinstance(checkpoints, GenericBucketCheckpoints):
+        return []
+    return [
+        "{}/{}/{}".format(checkpoints.checkpoint_dir, path, checkpoint["id"])
+        for checkpoint in checkpoints.list_checkpoints(path)
+    ]
+
+
+def references(contents_manager, path):
+    """Digests of the blobs referenced by the stored notebook `path`"""
+    try:
+        file_content, _, _ = contents_manager.fs.read(path, "text")
+    except NoSuchFile:
+        # Deleted since it was listed
+        return set()
+    index = cells.parse_index(file_content)
+    if index is not None:
+        # The cells are blobs, their outputs can reference other blobs
+        digests = set(index["cells"])
+        contents = contents_manager.blob_store.get_many(digests)
+        nb = {"cells": [json.loads(content) for content in contents.values()]}
+        return digests | blobs.references(nb)
+    if blobs.REFERENCE_PREFIX not in file_content:
+        return set()
+    return blobs.references(contents_manager.serializer.loads(file_content))
+
+
+def main(argv=None):
+    app = CollectBlobsApp()
+    app.initialize(argv)
+    app.start()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""
+Compression of the objects stored in the bucket.
+
+Compressed objects are stored with a Content-Encoding, objects without one
+are read as they are.
+"""
+
+import gzip
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+ENCODINGS = ("gzip", "zstd")
+
+# Object metadata holding the size of the content of a compressed object
+SIZE_METADATA = "uncompressed-size"
+
+
+def check_encoding(encoding):
+    """Raise ValueError if `encoding` can't be used to compress objects"""
+    if encoding not in ENCODINGS:
+        raise ValueError(
+            "Unknown compression {!r}, use one of: {}".format(
+                encoding, ", ".join(ENCODINGS)
+            )
+        )
+    if encoding == "zstd" and zstandard is None:
+        raise ValueError("zstd compression requires zstandard: pip install zstandard")
+
+
+def compress(data, encoding):
+    if encoding == "gzip":
+        # No timestamp in the header so the same content gives the same object
+        return gzip.compress(data, mtime=0)
+    return zstandard.ZstdCompressor().compress(data)
+
+
+def decompressor(encoding):
+    """Decompression object with a `decompress(data)` method, to decompress an
+    object read in parts"""
+    if encoding == "gzip":
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    if zstandard is None:
+        raise ImportError("Reading zstd compressed objects requires zstandard")
+    return zstandard.ZstdDecompressor().decompressobj()
+
+
+def decompress(data, encoding):
+    if encoding == "gzip":
+        return gzip.decompress(data)
+    if zstandard is None:
+        raise ImportError("Reading zstd compressed objects requires zstandard")
+    return zstandard.ZstdDecompressor().decompressobj().decompress(data)
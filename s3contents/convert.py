@@ -0,0 +1,74 @@
+"""
+Convert the notebooks between the plain .ipynb layout and the cell by cell
+layout of `cell_storage`:
+
+    python -m s3contents.convert --config=jupyter_server_config.py --to=cells [path]
+"""
+
+from traitlets import Enum
+from traitlets.config import Application
+
+from s3contents.ipycompat import Unicode, default, import_item
+
+
+class ConvertNotebooksApp(Application):
+    name = "s3contents-convert"
+    description = "Convert the notebooks to or from the cell by cell layout"
+
+    config_file = Unicode(
+        "", help="Jupyter config file with the contents manager configuration"
+    ).tag(config=True)
+    contents_manager_class = Unicode(
+        "s3contents.S3ContentsManager", help="Contents manager of the notebooks"
+    ).tag(config=True)
+    to = Enum(
+        ["cells", "ipynb"], "cells", help="Layout to convert the notebooks to"
+    ).tag(config=True)
+
+    @default("log_level")
+    def _log_level_default(self):
+        return "INFO"
+
+    aliases = {
+        "config": "ConvertNotebooksApp.config_file",
+        "contents-manager-class": "ConvertNotebooksApp.contents_manager_class",
+        "to": "ConvertNotebooksApp.to",
+        "log-level": "Application.log_level",
+    }
+
+    def initialize(self, argv=None):
+        super(ConvertNotebooksApp, self).initialize(argv)
+        if self.config_file:
+            self.load_config_file(self.config_file)
+            # Command line options take precedence over the config file
+            self.update_config(self.cli_config)
+
+    def start(self):
+        path = self.extra_args[0] if self.extra_args else ""
+        contents_manager = import_item(self.contents_manager_class)(parent=self)
+        count = convert(contents_manager, path, self.to == "cells")
+        self.log.info("Converted %s notebooks under `%s`", count, path or "/")
+
+
+def convert(contents_manager, path, cell_storage):
+    """Convert the notebooks under `path`, returns how many were converted"""
+    model = contents_manager.get(path, content=False)
+    if model["type"] == "notebook":
+        return int(contents_manager.convert_notebook(path, cell_storage))
+    if model["type"] != "directory":
+        return 0
+    model = contents_manager.get(path, content=True)
+    return sum(
+        convert(contents_manager, item["path"], cell_storage)
+        for item in model["content"]
+    )
+
+
+def main(argv=None):
+    app = ConvertNotebooksApp()
+    app.initialize(argv)
+    app.start()
+
+
+if __name__ == "__main__":
+    main()
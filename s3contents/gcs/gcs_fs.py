@@ -1,12 +1,28 @@
+import asyncio
 import base64
+import hashlib
 import os
 
 import gcsfs
+from fsspec.asyn import sync
 from tornado.web import HTTPError
 
-from s3contents.genericfs import GenericFS, NoSuchFile
+from s3contents import clients
+from s3contents.bulk import BulkResult, batched, run_bounded
+from s3contents.genericfs import (
+    HASH_CHUNK_SIZE,
+    HASH_METADATA,
+    BulkOperationError,
+    GenericFS,
+    NoSuchFile,
+    makes_requests,
+    notify_request,
+)
 from s3contents.ipycompat import Unicode
 
+# Maximum number of operations in one GCS batch request
+DELETE_BATCH_SIZE = 100
+
 
 class GCSFS(GenericFS):
     project = Unicode(help="GCP Project", allow_none=True, default_value=None).tag(
@@ -39,25 +55,110 @@ class GCSFS(GenericFS):
         token = self.token
         if token:
             token = os.path.expanduser(self.token)
-        self.fs = gcsfs.GCSFileSystem(project=self.project, token=token)
-
-        self.init()
+        # Shared with the other instances using the same project and token
+        self.fs = clients.get_client(
+            gcsfs.GCSFileSystem, project=self.project, token=token
+        )
+
+        self.init_future = None
+        if self.lazy_init:
+            self.init_future = self.start_lazy_init(self._lazy_init())
+        else:
+            self.init()
 
+    @makes_requests
     def init(self):
         self.mkdir("")
         self.ls("")
         assert self.isdir(""), "The root directory should exists"
 
+    async def _lazy_init(self):
+        """One request for the root dir_keep_file, created if it's missing"""
+        path_ = self.path(self.dir_keep_file)
+        try:
+            await self.fs._info(path_)
+        except FileNotFoundError:
+            self.log.debug("S3contents.GCSFS: Making dir (touch): `%s`", path_)
+            await self.fs._pipe_file(path_, b"")
+            self.invalidate(path_)
+
+    def install_request_hook(self):
+        # Every gcsfs request goes through `_call`, wrapped once per client
+        call = self.fs._call
+        if getattr(call, "notifies_requests", False):
+            return
+
+        async def _call(method, path, *args, **kwargs):
+            notify_request(method)
+            return await call(method, path, *args, **kwargs)
+
+        _call.notifies_requests = True
+        self.fs._call = _call
+
     #  GenericFS methods ------------------------------------------------------
 
+    @makes_requests
     def ls(self, path):
         path_ = self.path(path)
         self.log.debug("S3contents.GCSFS: Listing directory: `%s`", path_)
         files = self.fs.ls(path_)
         return self.remove_prefix(files)
 
+    @makes_requests
+    def list_details(self, path):
+        return sync(self.fs.loop, self._list_directory, self.strip(path))
+
+    async def _list_directory(self, path):
+        """Entries of a directory from one detailed listing, the date of each
+        subdirectory comes from its dir_keep_file"""
+        path_ = self.path(path)
+        self.log.debug("S3contents.GCSFS: Listing details: `%s`", path_)
+        try:
+            infos = await self.fs._ls(path_, detail=True, refresh=True)
+        except FileNotFoundError:
+            return []
+        semaphore = asyncio.Semaphore(max(1, self.listing_concurrency))
+        entries, directories = [], []
+        for info in infos:
+            child = self.remove_prefix(info["name"])
+            name = child.rsplit(self.separator, 1)[-1]
+            if name == self.dir_keep_file or child in (path, self.internal_dir):
+                continue
+            if info["type"] == "directory":
+                directories.append(self._directory_entry(child, semaphore))
+            else:
+                entries.append(self._file_entry(child, info))
+        entries.extend(await asyncio.gather(*directories))
+        return sorted(entries, key=lambda entry: entry["path"])
+
+    def _file_entry(self, path, info):
+        stat = self._stat_from_info("file", info)
+        self.metadata_cache.set(("stat", self.path(path)), stat)
+        return dict(stat, path=path)
+
+    async def _directory_entry(self, path, semaphore):
+        # Every prefix is listed, like S3FS, with or without a dir_keep_file
+        entry = {"path": path, "type": "directory", "ST_MTIME": None, "SIZE": 0}
+        if self.skip_directory_mtimes:
+            return entry
+        async with semaphore:
+            try:
+                # One request, `_info` also looks for a directory of that name
+                info = await self.fs._get_object(self.path(path, self.dir_keep_file))
+            except FileNotFoundError:
+                return entry
+        stat = self._stat_from_info("directory", info)
+        self.metadata_cache.set(("stat", self.path(path)), stat)
+        return dict(stat, path=path)
+
+    @makes_requests
     def isfile(self, path):
         path_ = self.path(path)
+        is_file = self.cached("isfile", path_, lambda: self._is_file_object(path_))
+        self.log.debug("S3contents.GCSFS: `%s` is a file: %s", path_, is_file)
+        return is_file
+
+    def _is_file_object(self, path_):
         is_file = False
 
         exists = self.fs.exists(path_)
@@ -68,10 +169,9 @@ class GCSFS(GenericFS):
                 is_file = self.fs.info(path_)["type"] == "file"
             except FileNotFoundError:
                 pass
-
-        self.log.debug("S3contents.GCSFS: `%s` is a file: %s", path_, is_file)
         return is_file
 
+    @makes_requests
     def isdir(self, path):
         # GCSFS doesnt return exists=True for a directory with no files so
         # we need to check if the dir_keep_file exists
@@ -80,26 +180,27 @@ class GCSFS(GenericFS):
         self.log.debug("S3contents.GCSFS: `%s` is a directory: %s", path_, is_dir)
         return is_dir
 
+    @makes_requests
     def mv(self, old_path, new_path):
         self.log.debug("S3contents.GCSFS: Move file `%s` to `%s`", old_path, new_path)
         self.cp(old_path, new_path)
         self.rm(old_path)
 
+    @makes_requests
     def cp(self, old_path, new_path):
         old_path_, new_path_ = self.path(old_path), self.path(new_path)
         self.log.debug("S3contents.GCSFS: Coping `%s` to `%s`", old_path_, new_path_)
 
         if self.isdir(old_path):
-            old_dir_path, new_dir_path = old_path_, new_path_
-            for obj in self.ls(old_dir_path):
-                old_item_path = self.path(obj)
-                print("old_item_path:", old_item_path)
-                print("old: ", old_dir_path, "new:", new_dir_path)
-                new_item_path = old_item_path.replace(old_dir_path, new_dir_path, 1)
-                self.cp(old_item_path, new_item_path)
+            result = sync(self.fs.loop, self._copy_tree, old_path_, new_path_)
+            self.invalidate(new_path_)
+            if not result.ok:
+                raise BulkOperationError(result)
         elif self.isfile(old_path):
             self.fs.copy(old_path_, new_path_)
+        self.invalidate(new_path_)
 
+    @makes_requests
     def rm(self, path):
         path_ = self.path(path)
         self.log.debug("S3contents.GCSFS: Removing: `%s`", path_)
@@ -108,22 +209,98 @@ class GCSFS(GenericFS):
             self.fs.rm(path_)
         elif self.isdir(path):
             self.log.debug("S3contents.GCSFS: Removing directory: `%s`", path_)
-            dirs = self.fs.walk(path_)
-            for dir in dirs:
-                for file in dir[2]:
-                    self.fs.rm(dir[0] + self.separator + file)
-
+            result = sync(self.fs.loop, self._delete_tree, path_)
+            self.invalidate(path_)
+            if not result.ok:
+                raise BulkOperationError(result)
+        self.invalidate(path_)
+
+    async def _copy_tree(self, old_path_, new_path_):
+        """Copy every object under a prefix with one listing and concurrent
+        server-side copies"""
+        self.fs.invalidate_cache(old_path_)
+        sources = await self.fs._find(old_path_)
+
+        async def copy(source):
+            await self.fs._cp_file(source, new_path_ + source[len(old_path_) :])
+
+        result = await run_bounded(
+            "copy", copy, sources, self.bulk_concurrency, self._log_progress
+        )
+        self.fs.invalidate_cache(new_path_)
+        return result
+
+    async def _delete_tree(self, path_):
+        """Delete every object under a prefix with one listing and concurrent
+        batch requests"""
+        self.fs.invalidate_cache(path_)
+        paths_ = await self.fs._find(path_)
+        if not self.fs.on_google:
+            # Emulators don't support batch requests
+            result = await run_bounded(
+                "delete",
+                self.fs._rm_file,
+                paths_,
+                self.bulk_concurrency,
+                self._log_progress,
+            )
+        else:
+            result = BulkResult("delete", len(paths_))
+
+            async def delete_batch(batch):
+                out = await self.fs._rm_files(batch)
+                deleted = {p for p in out if isinstance(p, str)}
+                result.succeeded += len(deleted)
+                # The errors of a batch don't say which object they are about,
+                # the objects left are deleted one by one to get their own
+                for p in batch:
+                    if p in deleted:
+                        continue
+                    try:
+                        await self.fs._rm_file(p)
+                    except FileNotFoundError:
+                        result.succeeded += 1
+                    except Exception as e:
+                        result.failed.append((p, e))
+                    else:
+                        result.succeeded += 1
+                self._log_progress(result)
+
+            batch_result = await run_bounded(
+                "delete",
+                delete_batch,
+                batched(paths_, DELETE_BATCH_SIZE),
+                self.bulk_concurrency,
+            )
+            for batch, error in batch_result.failed:
+                result.failed.extend((p, error) for p in batch)
+        self.fs.invalidate_cache(path_)
+        return result
+
+    def _log_progress(self, result):
+        if result.done == result.total or result.done % 1000 == 0:
+            self.log.info(
+                "S3contents.GCSFS: %s: %s/%s objects done, %s failed",
+                result.operation,
+                result.done,
+                result.total,
+                len(result.failed),
+            )
+
+    @makes_requests
     def mkdir(self, path):
         path_ = self.path(path, self.dir_keep_file)
         self.log.debug("S3contents.GCSFS: Making dir (touch): `%s`", path_)
         self.fs.touch(path_)
+        self.invalidate(path_)
 
+    @makes_requests
     def read(self, path, format):
         path_ = self.path(path)
-        if not self.isfile(path):
-            raise NoSuchFile(path_)
-        with self.fs.open(path_, mode="rb") as f:
-            raw_content = f.read()
+        try:
+            raw_content = self._cat_file(path_)
+        except FileNotFoundError as e:
+            raise NoSuchFile(path_) from e
         if format == "base64":
             return base64.b64encode(raw_content).decode("ascii"), "base64", raw_content
         else:
@@ -135,32 +312,146 @@ class GCSFS(GenericFS):
                 if format == "text":
                     err = "{} is not UTF-8 encoded".format(path_)
                     self.log.error(err)
-                    raise HTTPError(400, err, reason="bad format")
+                    raise HTTPError(400, err, reason="bad format") from None
+                return (
+                    base64.b64encode(raw_content).decode("ascii"),
+                    "base64",
+                    raw_content,
+                )
+
+    @makes_requests
+    def read_range(self, path, start, end):
+        path_ = self.path(path)
+        try:
+            return self.fs.cat_file(path_, start=start, end=end)
+        except FileNotFoundError as e:
+            raise NoSuchFile(path_) from e
+
+    @makes_requests
+    def presign(self, path, expiration):
+        try:
+            return self.fs.sign(self.path(path), expiration=expiration)
+        except ImportError as e:
+            raise NotImplementedError(
+                "Signing GCS URLs requires google-cloud-storage"
+            ) from e
+
+    def _cat_file(self, path_):
+        if self.content_cache is None:
+            return self.fs.cat_file(path_)
+        return sync(self.fs.loop, self._cat_file_cached, path_)
+
+    async def _cat_file_cached(self, path_):
+        """GET the content of an object.
+
+        When the object is in the content cache the GET is conditional on its
+        generation and an empty 304 response means the cached content can be
+        used, the check and the download are a single request.
+        """
+        cached = self.content_cache.get(path_)
+        bucket, key, _ = self.fs.split_path(path_)
+        try:
+            headers, raw_content = await self.fs._call(
+                "GET",
+                "b/{}/o/{}",
+                bucket,
+                key,
+                alt="media",
+                ifGenerationNotMatch=cached[0]["generation"] if cached else None,
+            )
+        except FileNotFoundError:
+            self.content_cache.pop(path_)
+            raise
+        generation = headers.get("x-goog-generation")
+        if cached is not None and not raw_content:
+            if generation in (None, cached[0]["generation"]):
+                self.log.debug("S3contents.GCSFS: Content cache hit: `%s`", path_)
+                return cached[1]
+        if generation is not None:
+            self.content_cache.set(path_, {"generation": generation}, raw_content)
+        return raw_content
 
     def lstat(self, path):
-        if self.isdir(path):
-            path_ = self.path(path + self.separator + self.dir_keep_file)
-        else:
-            path_ = self.path(path)
-        info = self.fs.info(path_)
-        ret = {}
-        if "updated" in info:
-            ret["ST_MTIME"] = info["updated"]
-
-        ret["SIZE"] = info.get("size", 0)
-
-        return ret
+        stat = self.stat(path)
+        return {"ST_MTIME": stat["ST_MTIME"], "SIZE": stat["SIZE"]}
 
+    @makes_requests
+    def stat(self, path):
+        path_ = self.path(path)
+        return self.cached("stat", path_, lambda: self._fetch_stat(path))
+
+    def _fetch_stat(self, path):
+        candidates = [
+            ("file", self.path(path)),
+            ("directory", self.path(path, self.dir_keep_file)),
+        ]
+        for type_, path_ in candidates:
+            try:
+                info = self.fs.info(path_)
+            except FileNotFoundError:
+                continue
+            if info["type"] == "file":
+                return self._stat_from_info(type_, info)
+        return {"type": None, "ST_MTIME": None, "SIZE": 0}
+
+    @staticmethod
+    def _stat_from_info(type_, info):
+        stat = {
+            "type": type_,
+            "ST_MTIME": info.get("updated"),
+            "SIZE": info.get("size", 0),
+        }
+        digest = (info.get("metadata") or {}).get(HASH_METADATA)
+        if digest:
+            stat["SHA256"] = digest
+        return stat
+
+    @makes_requests
+    def hash(self, path):
+        path_ = self.path(path)
+        self.fs.invalidate_cache(path_)
+        try:
+            info = self.fs.info(path_)
+        except FileNotFoundError as e:
+            raise NoSuchFile(path_) from e
+        digest = (info.get("metadata") or {}).get(HASH_METADATA)
+        if digest:
+            return digest
+        # Written by another tool or before the hashes were stored
+        self.log.debug("S3contents.GCSFS: Hashing the content of `%s`", path_)
+        hash_ = hashlib.sha256()
+        with self.fs.open(path_, mode="rb", block_size=HASH_CHUNK_SIZE) as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+                hash_.update(chunk)
+        return hash_.hexdigest()
+
+    @makes_requests
     def write(self, path, content, format):
         path_ = self.path(self.remove_prefix(path))
         self.log.debug("S3contents.GCSFS: Writing file: `%s`", path_)
-        with self.fs.open(path_, mode="wb") as f:
-            if format == "base64":
-                b64_bytes = content.encode("ascii")
-                content_ = base64.b64decode(b64_bytes)
-            else:
-                content_ = content.encode("utf8")
+        if format == "base64":
+            b64_bytes = content.encode("ascii")
+            content_ = base64.b64decode(b64_bytes)
+        else:
+            content_ = content.encode("utf8")
+        if self.skip_unchanged_writes and self._is_unchanged(path_, content_):
+            self.log.debug("S3contents.GCSFS: Skipping unchanged write: `%s`", path_)
+            return
+        # Answers require_hash without downloading the object
+        metadata = {HASH_METADATA: hashlib.sha256(content_).hexdigest()}
+        with self.fs.open(path_, mode="wb", metadata=metadata) as f:
             f.write(content_)
+        self.invalidate(path_)
+
+    def _is_unchanged(self, path_, content_):
+        # GCS stores the MD5 of the objects, no need to remember hashes
+        self.fs.invalidate_cache(path_)
+        try:
+            md5_hash = self.fs.info(path_).get("md5Hash")
+        except FileNotFoundError:
+            return False
+        digest = base64.b64encode(hashlib.md5(content_).digest()).decode("ascii")
+        return md5_hash == digest
 
     #  Utilities --------------------------------------------------------------
 
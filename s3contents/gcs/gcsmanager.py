@@ -1,7 +1,3 @@
-import os
-
-from fsspec.asyn import sync
-
 from s3contents.gcs.gcs_fs import GCSFS
 from s3contents.genericmanager import GenericContentsManager
 from s3contents.ipycompat import Unicode
@@ -36,43 +32,15 @@ class GCSContentsManager(GenericContentsManager):
             bucket=self.bucket,
             prefix=self.prefix,
             separator=self.separator,
+            metadata_cache_ttl=self.metadata_cache_ttl,
+            metadata_cache_maxsize=self.metadata_cache_maxsize,
+            bulk_concurrency=self.bulk_concurrency,
+            content_cache_dir=self.content_cache_dir,
+            content_cache_max_bytes=self.content_cache_max_bytes,
+            skip_unchanged_writes=self.skip_unchanged_writes,
+            listing_concurrency=self.listing_concurrency,
+            skip_directory_mtimes=self.skip_directory_mtimes,
+            lazy_init=self.lazy_init,
         )
-
-    def _convert_file_records(self, gcs_paths):
-        """Convert gcs paths to models of the filetypes."""
-        models = []
-        gcs_paths = self.fs.remove_prefix(gcs_paths)
-        self.log.debug("gcs paths", gcs_paths)
-        for path in gcs_paths:
-            if os.path.basename(path) == self.fs.dir_keep_file:
-                continue
-            _type = self.guess_type(path, allow_directory=True)
-            if _type == "notebook":
-                models.append(self._notebook_model_from_path(path, False))
-            elif _type == "file":
-                models.append(self._file_model_from_path(path, False, None))
-            elif _type == "directory":
-                models.append(self._directory_model_from_path(path, False))
-            else:
-                self.do_error(
-                    "Unknown file type '%s' for file '%s'" % (_type, path), 500
-                )
-        return models
-
-    def _list_contents(self, model, prefixed_path):
-        # Specific to GCS filesystem
-        files_gcs_detail = sync(self.fs.fs.loop, self.fs.fs._ls, prefixed_path)
-        filtered_files_gcs_detail = list(
-            filter(
-                lambda detail: os.path.basename(detail) != "",
-                files_gcs_detail,
-            )
-        )
-        self.log.debug(f"listed files: {filtered_files_gcs_detail}\n")
-        for files_gcs_detail in filtered_files_gcs_detail:
-            self.log.debug(
-                f"files_tcs_detail={files_gcs_detail}\n"
-                f"lstat={self.fs.lstat(files_gcs_detail)}\n"
-            )
-        model["content"] = self._convert_file_records(filtered_files_gcs_detail)
-        return model
+        self.init_metrics()
+        self.init_journal()
@@ -2,15 +2,126 @@
 Generic FileSystem class to be used by the Content Manager
 """
 
-from s3contents.ipycompat import HasTraits
+import asyncio
+import contextlib
+import contextvars
+import functools
+import hashlib
+
+from s3contents.cache import DiskCache, LRUCache
+from s3contents.chunks import (
+    assemble_chunks,
+    delete_chunks,
+    prune_stale_chunks,
+    store_content_chunk,
+)
+from s3contents.ipycompat import Bool, Float, HasTraits, Integer, Unicode
+
+_MISSING = object()
+
+# Object metadata holding the SHA-256 of the content, set when it's written
+HASH_METADATA = "sha256"
+# Size of the parts read to hash objects written without one
+HASH_CHUNK_SIZE = 8 * 1024 * 1024
+
+# File system making the backend requests of the current context. Clients are
+# shared between file systems, their request hook is installed once and calls
+# the listeners of this one. The context is copied to the fsspec event loop.
+_current_fs = contextvars.ContextVar("s3contents_current_fs", default=None)
 
 
 class GenericFS(HasTraits):
+    metadata_cache_ttl = Float(
+        0,
+        help="""Seconds to cache isfile/isdir/lstat results for.
+        Entries are invalidated by writes, renames and deletes made through
+        this instance. 0 disables the cache.""",
+    ).tag(config=True)
+    metadata_cache_maxsize = Integer(
+        4096, help="Maximum number of entries kept in the metadata cache"
+    ).tag(config=True)
+    content_cache_dir = Unicode(
+        "",
+        help="""Local directory to cache file contents in. Cached contents are
+        revalidated with the backend before being used. Empty disables the cache.""",
+    ).tag(config=True)
+    content_cache_max_bytes = Integer(
+        1024 * 1024 * 1024, help="Maximum size of the content cache in bytes"
+    ).tag(config=True)
+    bulk_concurrency = Integer(
+        32,
+        help="Maximum number of concurrent requests when copying or deleting "
+        "the objects of a directory",
+    ).tag(config=True)
+    listing_concurrency = Integer(
+        16,
+        help="Maximum number of concurrent requests to get the metadata of the "
+        "subdirectories of a listed directory",
+    ).tag(config=True)
+    skip_directory_mtimes = Bool(
+        False,
+        help="""Don't get the last modified date of subdirectories when listing
+        a directory, saving one request per subdirectory.""",
+    ).tag(config=True)
+    skip_unchanged_writes = Bool(
+        False,
+        help="""Don't upload files whose content didn't change since they were
+        last read or written by this instance, e.g. on autosave.""",
+    ).tag(config=True)
+    internal_dir = Unicode(
+        ".s3contents",
+        help="Directory, relative to the root, where s3contents keeps its own "
+        "objects (e.g. in progress uploads). It is hidden from listings.",
+    ).tag(config=True)
+    lazy_init = Bool(
+        False,
+        help="""Don't wait for the backend when starting: the root directory is
+        checked in the background with one request and only created if it's
+        missing. Errors (e.g. access denied) are logged instead of stopping the
+        server.""",
+    ).tag(config=True)
+
+    def __init__(self, **kwargs):
+        super(GenericFS, self).__init__(**kwargs)
+        maxsize = self.metadata_cache_maxsize if self.metadata_cache_ttl > 0 else 0
+        self.metadata_cache = LRUCache(maxsize=maxsize, ttl=self.metadata_cache_ttl)
+        self.content_cache = None
+        if self.content_cache_dir:
+            self.content_cache = DiskCache(
+                self.content_cache_dir, self.content_cache_max_bytes
+            )
+        # Full path -> (sha256 of the content, ETag of the object)
+        self.content_hashes = LRUCache(
+            maxsize=self.metadata_cache_maxsize if self.skip_unchanged_writes else 0
+        )
+        self.request_listeners = []
+
     def ls(self, path=""):
         raise NotImplementedError(
             "Should be implemented by the file system abstraction"
         )
 
+    def list_details(self, path):
+        """Return the files and directories in the directory `path` as `stat`
+        dictionaries with an extra `path` key, relative to the root.
+
+        The dir_keep_file and internal_dir are not included. By default this
+        calls `stat` for every entry, file systems should override it to use
+        the details returned by the listing.
+        """
+        entries = []
+        for child in self.ls(path):
+            child = child.strip("/")
+            if (
+                child.rsplit("/", 1)[-1] == self.dir_keep_file
+                or child in (path.strip("/"), self.internal_dir)
+            ):
+                continue
+            stat = self.stat(child)
+            if stat["type"] is not None:
+                entries.append(dict(stat, path=child))
+        return entries
+
     def isfile(self, path):
         raise NotImplementedError(
             "Should be implemented by the file system abstraction"
@@ -51,11 +162,284 @@ class GenericFS(HasTraits):
             "Should be implemented by the file system abstraction"
         )
 
+    def stat(self, path):
+        """Return the type ("file", "directory" or None if `path` doesn't exist),
+        ST_MTIME and SIZE of `path`, and the SHA256 of the content of files when
+        the file system stored it at write time
+
+        File systems should override this to get everything in one round trip
+        """
+        if self.isfile(path):
+            type_ = "file"
+        elif self.isdir(path):
+            type_ = "directory"
+        else:
+            return {"type": None, "ST_MTIME": None, "SIZE": 0}
+        return dict(self.lstat(path), type=type_)
+
+    def read_with_stat(self, path, format):
+        """Same as `read` but also return the `stat` of the file read"""
+        return self.read(path, format) + (self.stat(path),)
+
+    def hash(self, path):
+        """Return the SHA-256 hexdigest of the content of the file `path`.
+
+        By default the file is read, file systems storing the hash of the files
+        they write should override it to answer from the stored one.
+        """
+        _, _, bytes_content = self.read(path, None)
+        return hashlib.sha256(bytes_content).hexdigest()
+
+    def read_range(self, path, start, end):
+        """Return the raw bytes from `start` to `end` (excluded) of a file"""
+        raise NotImplementedError(
+            "Should be implemented by the file system abstraction"
+        )
+
+    def presign(self, path, expiration):
+        """Return a URL to download a file directly from the backend, valid for
+        `expiration` seconds. Raises NotImplementedError if not supported."""
+        raise NotImplementedError(
+            "Should be implemented by the file system abstraction"
+        )
+
     def write(self, path, content, format):
         raise NotImplementedError(
             "Should be implemented by the file system abstraction"
         )
 
+    def writenotebook(self, path, content):
+        self.write(path, content, "text")
+
+    def write_chunk(self, path, chunk, content, format):
+        """Store one chunk of a chunked upload, chunks are numbered from 1 and
+        the last one is -1. The file is written once the last chunk is received.
+
+        By default the chunks are kept in memory until the last one arrives,
+        file systems that support it should upload them as they come.
+        """
+        prune_stale_chunks()
+        store_content_chunk(path, content)
+        if chunk == -1:
+            # Last chunk: combine the chunks in the registry to compose the full file content
+            content = assemble_chunks(path)
+            delete_chunks(path)
+            self.write(path, content, format)
+
+    #  Async API ---------------------------------------------------------------
+    # Coroutine versions of the methods above, used by AsyncGenericContentsManager.
+    # By default they run the blocking method in a thread so every file system
+    # works; file systems backed by an async library should override them.
+
+    async def _run_in_executor(self, func, *args):
+        loop = asyncio.get_running_loop()
+        # Run in a copy of the current context like asyncio.to_thread
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(
+            None, functools.partial(context.run, func, *args)
+        )
+
+    async def _ls(self, path=""):
+        return await self._run_in_executor(self.ls, path)
+
+    async def _list_details(self, path):
+        return await self._run_in_executor(self.list_details, path)
+
+    async def _isfile(self, path):
+        return await self._run_in_executor(self.isfile, path)
+
+    async def _isdir(self, path):
+        return await self._run_in_executor(self.isdir, path)
+
+    async def _mv(self, old_path, new_path):
+        return await self._run_in_executor(self.mv, old_path, new_path)
+
+    async def _cp(self, old_path, new_path):
+        return await self._run_in_executor(self.cp, old_path, new_path)
+
+    async def _rm(self, path):
+        return await self._run_in_executor(self.rm, path)
+
+    async def _mkdir(self, path):
+        return await self._run_in_executor(self.mkdir, path)
+
+    async def _read(self, path, format):
+        return await self._run_in_executor(self.read, path, format)
+
+    async def _read_with_stat(self, path, format):
+        return await self._run_in_executor(self.read_with_stat, path, format)
+
+    async def _hash(self, path):
+        return await self._run_in_executor(self.hash, path)
+
+    async def _read_range(self, path, start, end):
+        return await self._run_in_executor(self.read_range, path, start, end)
+
+    async def _presign(self, path, expiration):
+        return await self._run_in_executor(self.presign, path, expiration)
+
+    async def _read_chunks(self, path, start, end, chunk_size):
+        """Read the bytes `start` to `end` (excluded) of the file `path` in
+        chunks of at most `chunk_size` bytes, e.g. to stream a download"""
+        while start < end:
+            chunk_end = min(start + chunk_size, end)
+            yield await self._read_range(path, start, chunk_end)
+            start = chunk_end
+
+    async def _stat(self, path):
+        return await self._run_in_executor(self.stat, path)
+
+    async def _write(self, path, content, format):
+        return await self._run_in_executor(self.write, path, content, format)
+
+    async def _writenotebook(self, path, content):
+        return await self._run_in_executor(self.writenotebook, path, content)
+
+    async def _write_chunk(self, path, chunk, content, format):
+        return await self._run_in_executor(
+            self.write_chunk, path, chunk, content, format
+        )
+
+    def start_lazy_init(self, coro):
+        """Run the initialization coroutine `coro` on the fsspec loop of
+        `self.fs` without waiting for it. Returns its concurrent future."""
+        with requests_of(self):
+            future = asyncio.run_coroutine_threadsafe(coro, self.fs.loop)
+        future.add_done_callback(self._log_init_error)
+        return future
+
+    def _log_init_error(self, future):
+        error = future.exception()
+        if error is not None:
+            self.log.error(
+                "S3contents.%s: Initialization failed: %s",
+                type(self).__name__,
+                error,
+                exc_info=error,
+            )
+
+    def add_request_listener(self, listener):
+        """Call `listener(operation)` before each request this file system makes
+        to the backend, e.g. to count them. File systems that can't observe
+        their requests ignore it."""
+        if listener not in self.request_listeners:
+            self.request_listeners.append(listener)
+        self.install_request_hook()
+
+    def remove_request_listener(self, listener):
+        """Stop calling `listener`, added by `add_request_listener`"""
+        if listener in self.request_listeners:
+            self.request_listeners.remove(listener)
+
+    def install_request_hook(self):
+        """Make the client call `notify_request` before each request, once per
+        client"""
+
+    #  Metadata cache ----------------------------------------------------------
+
+    def cached(self, kind, path_, func):
+        """Return the cached `kind` result (e.g. isfile) for the full path `path_`,
+        calling `func()` on a miss"""
+        return self.metadata_cache.get_or_set((kind, path_), func)
+
+    async def cached_async(self, kind, path_, coro_func):
+        """Same as `cached` for a coroutine function"""
+        key = (kind, path_)
+        value = self.metadata_cache.get(key, _MISSING)
+        if value is _MISSING:
+            value = await coro_func()
+            self.metadata_cache.set(key, value)
+        return value
+
+    def invalidate(self, *paths_):
+        """Drop cached metadata for the full paths `paths_`, everything below
+        them and their parent directories"""
+        if not self.metadata_cache.enabled:
+            return
+        paths_ = [p.rstrip("/") for p in paths_]
+
+        def is_related(key):
+            cached_path = key[1].rstrip("/")
+            for path_ in paths_:
+                if (
+                    cached_path == path_
+                    or cached_path.startswith(path_ + "/")
+                    or path_.startswith(cached_path + "/")
+                ):
+                    return True
+            return False
+
+        self.metadata_cache.invalidate_if(is_related)
+
+    def remember_content(self, path_, content, etag):
+        """Record the ETag of the object at `path_` holding `content`"""
+        if etag and self.content_hashes.enabled:
+            digest = hashlib.sha256(content).hexdigest()
+            self.content_hashes.set(path_, (digest, etag))
+
+    def known_etag(self, path_, content):
+        """ETag of the object at `path_` if it was last seen holding `content`"""
+        entry = self.content_hashes.get(path_)
+        if entry is not None and entry[0] == hashlib.sha256(content).hexdigest():
+            return entry[1]
+        return None
+
+
+def notify_request(operation):
+    """Call the request listeners of the file system of the current context"""
+    fs = _current_fs.get()
+    if fs is not None:
+        for listener in list(fs.request_listeners):
+            listener(operation)
+
+
+@contextlib.contextmanager
+def requests_of(fs):
+    """Notify the backend requests made in the block to the listeners of `fs`"""
+    token = _current_fs.set(fs)
+    try:
+        yield
+    finally:
+        _current_fs.reset(token)
+
+
+def makes_requests(method):
+    """Decorator for the blocking methods of file systems, the backend requests
+    they make are notified to the listeners of `self`"""
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with requests_of(self):
+            return method(self, *args, **kwargs)
+
+    return wrapper
+
+
+def on_fs_loop(method):
+    """Decorator for coroutine methods of file systems wrapping an fsspec async
+    file system in `self.fs`.
+
+    fsspec runs its coroutines in a dedicated event loop, this schedules the
+    coroutine there when awaited from any other loop (e.g. the Jupyter server one)
+    so the caller's loop is never blocked. The backend requests it makes are
+    notified to the listeners of `self`.
+    """
+
+    @functools.wraps(method)
+    async def wrapper(self, *args, **kwargs):
+        with requests_of(self):
+            return await run_on_loop(self.fs.loop, method(self, *args, **kwargs))
+
+    return wrapper
+
+
+async def run_on_loop(loop, coro):
+    """Await `coro` running it on `loop`, that can be different from the current one"""
+    if asyncio.get_running_loop() is loop:
+        return await coro
+    future = asyncio.run_coroutine_threadsafe(coro, loop)
+    return await asyncio.wrap_future(future)
+
 
 class GenericFSError(Exception):
     pass
@@ -66,3 +450,15 @@ class NoSuchFile(GenericFSError):
         self.path = path
         self.message = "No such file or directory: {}".format(path)
         super(NoSuchFile, self).__init__(self.message, *args, **kwargs)
+
+
+class BulkOperationError(GenericFSError):
+    def __init__(self, result, *args, **kwargs):
+        self.result = result
+        failures = ", ".join(
+            "{}: {}".format(item, error) for item, error in result.failed[:5]
+        )
+        self.message = "{} failed for {} of {} objects: {}".format(
+            result.operation.capitalize(), len(result.failed), result.total, failures
+        )
+        super(BulkOperationError, self).__init__(self.message, *args, **kwargs)
@@ -1,37 +1,36 @@
-import asyncio
+import base64
 import datetime
 import hashlib
-import json
 import mimetypes
-import os
 
-import gcsfs
-from dateutil.tz import tzutc
-from fsspec.asyn import sync
 from tornado.web import HTTPError
 
-from s3contents.chunks import (
-    assemble_chunks,
-    delete_chunks,
-    prune_stale_chunks,
-    store_content_chunk,
-)
-from s3contents.genericfs import GenericFSError, NoSuchFile
+from s3contents import blobs, cells, metrics, serializers
+from s3contents.genericfs import BulkOperationError, GenericFSError, NoSuchFile
 from s3contents.ipycompat import (
     Any,
     AuthenticatedFileHandler,
+    Bool,
     ContentsManager,
+    Float,
     GenericFileCheckpoints,
     HasTraits,
+    Integer,
     TraitError,
     Unicode,
     default,
     from_dict,
     import_item,
-    reads,
     string_types,
     validate,
 )
+from s3contents.journal import Journal
+
+try:
+    from s3contents.handlers import StreamingFilesHandler
+except ImportError:
+    # Handlers are only available in jupyter_server
+    StreamingFilesHandler = None
 
 DUMMY_CREATED_DATE = datetime.datetime.fromtimestamp(86400)
 NBFORMAT_VERSION = 4
@@ -57,23 +56,279 @@ class GenericContentsManager(ContentsManager, HasTraits):
         """,
     )
 
+    metadata_cache_ttl = Float(
+        0,
+        help="""Seconds to cache file and directory metadata (isfile, isdir, lstat).
+        Writes, renames and deletes made through this server invalidate the
+        affected entries. 0 disables the cache.""",
+    ).tag(config=True)
+    metadata_cache_maxsize = Integer(
+        4096, help="Maximum number of entries kept in the metadata cache"
+    ).tag(config=True)
+    content_cache_dir = Unicode(
+        "",
+        help="""Local directory to cache file contents in, e.g. /tmp/s3contents.
+        Cached contents are revalidated with the backend (ETag) before being
+        used so opening an unchanged file doesn't download it again.
+        Empty disables the cache.""",
+    ).tag(config=True)
+    content_cache_max_bytes = Integer(
+        1024 * 1024 * 1024, help="Maximum size of the content cache in bytes"
+    ).tag(config=True)
+    listing_concurrency = Integer(
+        16,
+        help="Maximum number of concurrent requests to get the last modified "
+        "date of the subdirectories when listing a directory",
+    ).tag(config=True)
+    skip_directory_mtimes = Bool(
+        False,
+        help="""Don't get the last modified date of the subdirectories when
+        listing a directory. Saves one request per subdirectory.""",
+    ).tag(config=True)
+    skip_unchanged_writes = Bool(
+        False,
+        help="""Don't upload a file when its content is the same as the last
+        content read or written by this server, e.g. on autosave. The object
+        is checked with a HEAD request to detect changes made by others.""",
+    ).tag(config=True)
+    bulk_concurrency = Integer(
+        32,
+        help="Maximum number of concurrent requests when renaming or deleting "
+        "a directory",
+    ).tag(config=True)
+    lazy_init = Bool(
+        False,
+        help="""Don't wait for the bucket when the server starts: the root
+        directory is checked in the background with one request and only created
+        if it's missing. Errors (e.g. access denied) are logged instead of
+        stopping the server.""",
+    ).tag(config=True)
+    files_chunk_size = Integer(
+        4 * 1024 * 1024,
+        help="Size of the chunks (ranged GETs) used to stream /files/ downloads",
+    ).tag(config=True)
+    files_presign_threshold = Integer(
+        0,
+        help="""Redirect /files/ downloads of files of this size or bigger (bytes)
+        to a presigned URL of the bucket. 0 disables the redirects.""",
+    ).tag(config=True)
+    files_presign_expiration = Integer(
+        3600, help="Seconds the presigned /files/ URLs are valid for"
+    ).tag(config=True)
+    enable_metrics = Bool(
+        False,
+        help="""Record Prometheus metrics of the contents operations and the
+        backend requests they make, served by jupyter_server at /metrics.
+        Requires prometheus_client.""",
+    ).tag(config=True)
+    write_behind_dir = Unicode(
+        "",
+        help="""Local directory of the write-behind journal, e.g. /var/lib/s3contents.
+        Saves are written to the journal and acknowledged right away, a
+        background thread uploads them to the bucket. Saves not uploaded when
+        the server stops are uploaded when it starts again with the same
+        directory. Empty disables write-behind.""",
+    ).tag(config=True)
+    offload_outputs_threshold = Integer(
+        0,
+        help="""Store the cell outputs of this size (characters) or bigger once,
+        as content-addressed blobs in the bucket, the notebooks only hold
+        references to them so unchanged outputs (e.g. plots) are not uploaded
+        again on save. Notebooks with references are read whatever the
+        setting. 0 disables it.""",
+    ).tag(config=True)
+    cell_storage = Bool(
+        False,
+        help="""Store the notebooks as an index object and one blob per cell, so
+        saving a notebook only uploads its new or changed cells. Notebooks are
+        read in either layout whatever the setting, convert them with
+        `python -m s3contents.convert`.""",
+    ).tag(config=True)
+    notebook_serializer = Unicode(
+        "json",
+        help="""Serializer of the notebooks saved and loaded, "json" (standard
+        library), "orjson" (requires orjson, faster on large notebooks) or the
+        import path of a class with `dumps(nb) -> str` and
+        `loads(file_content) -> dict` methods.""",
+    ).tag(config=True)
+    write_behind_retry_delay = Float(
+        1,
+        help="Seconds before retrying a failed upload of the write-behind "
+        "journal, doubled on each failure up to a minute",
+    ).tag(config=True)
+
     def __init__(self, *args, **kwargs):
         super(GenericContentsManager, self).__init__(*args, **kwargs)
         self._fs = None
+        self._blob_store = None
+        self._serializer = None
+        self.journal = None
 
     @default("files_handler_class")
     def _files_handler_class_default(self):
+        if StreamingFilesHandler is not None:
+            return StreamingFilesHandler
         return AuthenticatedFileHandler
 
     @default("files_handler_params")
     def _files_handler_params_default(self):
+        if StreamingFilesHandler is not None:
+            return {}
         return {"path": ""}
 
+    def init_metrics(self):
+        """Instrument this contents manager and its file system, called once
+        the file system is created"""
+        if self.enable_metrics:
+            metrics.instrument(self)
+
+    def init_journal(self):
+        """Start the write-behind journal, called once the file system is created"""
+        if self.write_behind_dir:
+            self.journal = Journal(
+                self.write_behind_dir,
+                self._upload_journaled,
+                self.log,
+                retry_delay=self.write_behind_retry_delay,
+            )
+            self.journal.start()
+
+    def _upload_journaled(self, path, content):
+        self.fs.write(path, base64.b64encode(content).decode("ascii"), "base64")
+        return self.fs.stat(path)
+
+    def flush_writes(self, path=""):
+        """Upload the saves of `path`, and everything under it, that are still
+        in the write-behind journal"""
+        if self.journal is None:
+            return
+        try:
+            self.journal.flush(path)
+        except Exception as e:
+            self.do_error("Unexpected error while uploading %s: %s" % (path, e), 500)
+
+    def _write_behind(self, path, content, format):
+        """Journal a save if write-behind is enabled, returns whether it was"""
+        if self.journal is None:
+            return False
+        if format not in {"text", "base64"}:
+            self.do_error(
+                "Must specify format of file contents as 'text' or 'base64'", 400
+            )
+        if format == "text":
+            content_ = content.encode("utf-8")
+        else:
+            content_ = base64.b64decode(content.encode("ascii"))
+        self.journal.append(path.strip("/"), content_)
+        return True
+
+    def _get_journaled(self, path, content, type, format, require_hash):
+        """Model of `path` if its last save is still in the write-behind
+        journal, None otherwise"""
+        if self.journal is None or type == "directory":
+            return None
+        if content or require_hash:
+            journaled = self.journal.get(path)
+            if journaled is None:
+                return None
+            bytes_content, stat = journaled
+        else:
+            stat = self.journal.pending_stat(path)
+            if stat is None:
+                return None
+
+        model = base_model(path)
+        model["type"] = type or ("notebook" if path.endswith(".ipynb") else "file")
+        if content and model["type"] == "notebook":
+            nb_content = self._read_notebook(path, bytes_content.decode("utf-8"))
+            self.mark_trusted_cells(nb_content, path)
+            model["format"] = "json"
+            model["content"] = nb_content
+            self.validate_notebook_model(model)
+        elif content:
+            model["content"], model["format"] = decode(path, bytes_content, format)
+            model["mimetype"] = mimetypes.guess_type(path)[0] or "text/plain"
+        self._update_model_from_stat(model, stat)
+        if require_hash:
+            model.update(**self._get_hash(bytes_content))
+        return model
+
+    def _with_journaled(self, path, models):
+        """Add the saves still in the write-behind journal to the listing of
+        the directory `path`"""
+        if self.journal is None:
+            return models
+        journaled = {
+            entry["path"]: self._model_from_entry(entry)
+            for entry in self.journal.list_pending(path)
+        }
+        if not journaled:
+            return models
+        models = [model for model in models if model["path"] not in journaled]
+        return sorted(models + list(journaled.values()), key=lambda m: m["path"])
+
     def get_fs(self):
         return self._fs
 
     fs = property(get_fs)
 
+    @property
+    def blob_store(self):
+        if self._blob_store is None:
+            self._blob_store = blobs.BlobStore(
+                self.fs, concurrency=self.bulk_concurrency
+            )
+        return self._blob_store
+
+    def _notebook_to_store(self, nb, cell_storage=None):
+        """JSON of the notebook `nb` as stored, its big outputs and its cells
+        (with `cell_storage`, by default the setting) uploaded as blobs"""
+        if self.offload_outputs_threshold:
+            nb, contents = blobs.offload(nb, self.offload_outputs_threshold)
+            self.blob_store.put_many(contents)
+        if self.cell_storage if cell_storage is None else cell_storage:
+            nb, contents = cells.split(nb)
+            self.blob_store.put_many(contents)
+        return self.serializer.dumps(nb)
+
+    def _read_notebook(self, path, file_content):
+        """Notebook node of the stored notebook `file_content`, its cells and
+        outputs fetched from the blobs"""
+        index = cells.parse_index(file_content)
+        if index is not None:
+            nb = cells.join(index, self._get_blobs(path, index["cells"]))
+        else:
+            nb = self.serializer.loads(file_content)
+        nb_content = serializers.to_notebook(nb, NBFORMAT_VERSION)
+        digests = blobs.references(nb_content)
+        if digests:
+            blobs.inflate(nb_content, self._get_blobs(path, digests))
+        return nb_content
+
+    @staticmethod
+    def _has_blobs(file_content):
+        """Does reading the stored notebook `file_content` fetch blobs?"""
+        return (
+            blobs.REFERENCE_PREFIX in file_content or cells.LAYOUT_KEY in file_content
+        )
+
+    def _get_blobs(self, path, digests):
+        try:
+            return self.blob_store.get_many(digests)
+        except NoSuchFile as e:
+            self.do_error("Missing blob of {}: {}".format(path, e.path), 500)
+
+    def convert_notebook(self, path, cell_storage):
+        """Store the notebook `path` cell by cell if `cell_storage`, as a plain
+        notebook otherwise. Returns False if it already was."""
+        self.flush_writes(path)
+        file_content, _, _ = self.fs.read(path, "text")
+        if (cells.parse_index(file_content) is not None) == cell_storage:
+            return False
+        nb_content = self._read_notebook(path, file_content)
+        self.fs.writenotebook(path, self._notebook_to_store(nb_content, cell_storage))
+        return True
+
     def _checkpoints_class_default(self):
         return GenericFileCheckpoints
 
@@ -90,7 +345,7 @@ class GenericContentsManager(ContentsManager, HasTraits):
             409,
         )
 
-    def guess_type(self, path, allow_directory=True):
+    def guess_type(self, path, allow_directory=True, stat=None):
         """
         Guess the type of a file.
         If allow_directory is False, don't consider the possibility that the
@@ -99,12 +354,15 @@ class GenericContentsManager(ContentsManager, HasTraits):
         Parameters
         ----------
             obj: s3.Object or string
+            stat: optional result of fs.stat(path) to avoid another request
         """
         self.log.debug(
             f"guess_type with path={path} and allow_directory={allow_directory}"
         )
         if path.endswith(".ipynb"):
             return "notebook"
+        elif allow_directory and stat is not None:
+            return "directory" if stat["type"] == "directory" else "file"
         elif allow_directory and self.dir_exists(path):
             return "directory"
         else:
@@ -113,6 +371,8 @@ class GenericContentsManager(ContentsManager, HasTraits):
     def file_exists(self, path):
         # Does a file exist at the given path?
         self.log.debug("S3contents.GenericManager.file_exists: ('%s')", path)
+        if self.journal is not None and self.journal.pending_stat(path.strip("/")):
+            return True
         return self.fs.isfile(path)
 
     def dir_exists(self, path):
@@ -132,8 +392,16 @@ class GenericContentsManager(ContentsManager, HasTraits):
 
         path = path.strip("/")
 
+        model = self._get_journaled(path, content, type, format, require_hash)
+        if model is not None:
+            return model
+
+        # The stat is built once and threaded through the model builders
+        stat = None
         if type is None:
-            type = self.guess_type(path)
+            if not path.endswith(".ipynb"):
+                stat = self.fs.stat(path)
+            type = self.guess_type(path, stat=stat)
         try:
             func = {
                 "directory": self._get_directory,
@@ -141,20 +409,30 @@ class GenericContentsManager(ContentsManager, HasTraits):
                 "file": self._get_file,
             }[type]
         except KeyError:
-            raise ValueError("Unknown type passed: '{}'".format(type))
-
-        return func(path=path, content=content, format=format, require_hash=require_hash)
+            raise ValueError("Unknown type passed: '%s'" % type) from None
+
+        return func(
+            path=path,
+            content=content,
+            format=format,
+            require_hash=require_hash,
+            stat=stat,
+        )
 
-    def _get_directory(self, path, content=True, format=None, require_hash=False):
+    def _get_directory(
+        self, path, content=True, format=None, require_hash=False, stat=None
+    ):
         self.log.debug(
             "S3contents.GenericManager._get_directory: path('%s') content(%s) format(%s)",
             path,
             content,
             format,
         )
-        return self._directory_model_from_path(path, content=content)
+        return self._directory_model_from_path(path, content=content, stat=stat)
 
-    def _get_notebook(self, path, content=True, format=None, require_hash=False):
+    def _get_notebook(
+        self, path, content=True, format=None, require_hash=False, stat=None
+    ):
         self.log.debug(
             "S3contents.GenericManager._get_notebook: path('%s') type(%s) format(%s) require_hash(%s)",
             path,
@@ -162,9 +440,15 @@ class GenericContentsManager(ContentsManager, HasTraits):
             format,
             require_hash,
         )
-        return self._notebook_model_from_path(path, content=content, format=format, require_hash=require_hash)
+        return self._notebook_model_from_path(
+            path,
+            content=content,
+            format=format,
+            require_hash=require_hash,
+            stat=stat,
+        )
 
-    def _get_file(self, path, content=True, format=None, require_hash=False):
+    def _get_file(self, path, content=True, format=None, require_hash=False, stat=None):
         self.log.debug(
             "S3contents.GenericManager._get_file: path('%s') type(%s) format(%s) require_hash(%s)",
             path,
@@ -172,116 +456,53 @@ class GenericContentsManager(ContentsManager, HasTraits):
             format,
             require_hash,
         )
-        return self._file_model_from_path(path, content=content, format=format, require_hash=require_hash)
+        return self._file_model_from_path(
+            path,
+            content=content,
+            format=format,
+            require_hash=require_hash,
+            stat=stat,
+        )
 
-    def _directory_model_from_path(self, path, content=False):
+    def _directory_model_from_path(self, path, content=False, stat=None):
         self.log.debug(
             "S3contents.GenericManager._directory_model_from_path: path('%s') type(%s)",
             path,
             content,
         )
         model = base_directory_model(path)
-        if self.fs.isdir(path):
-            lstat = self.fs.lstat(path)
-            if "ST_MTIME" in lstat and lstat["ST_MTIME"]:
-                model["created"] = model["last_modified"] = lstat["ST_MTIME"]
+        if stat is None:
+            stat = self.fs.stat(path)
+        if stat["type"] == "directory":
+            if stat["ST_MTIME"]:
+                model["created"] = model["last_modified"] = stat["ST_MTIME"]
 
-            self.log.debug(
-                f"s3_detail_to_model={self.convert_s3_details_to_models}"
-                f"dir_s3_detail: path='{path}', lstat={lstat}"
-            )
+            self.log.debug(f"dir_s3_detail: path='{path}', stat={stat}")
         if content:
-            if not self.dir_exists(path):
+            if stat["type"] != "directory":
                 self.no_such_entity(path)
             model["format"] = "json"
-            prefixed_path = self.fs.path(path)
-
-            if isinstance(self.fs.fs, gcsfs.GCSFileSystem):
-                self.log.debug("FS is GCS")
-                return self._list_contents(model, prefixed_path)
-            self.log.debug("FS is S3")
-
-            files_s3_detail = sync(self.fs.fs.loop, self.fs.fs._lsdir, prefixed_path)
-            filtered_files_s3_detail = list(
-                filter(
-                    lambda detail: os.path.basename(detail["Key"])
-                    != self.fs.dir_keep_file
-                    and self.fs.remove_prefix(detail["Key"]) != path,
-                    files_s3_detail,
-                )
-            )
-            filtered_files_s3_detail = sync(
-                self.fs.fs.loop,
-                self.get_content_s3_metadata,
-                filtered_files_s3_detail,
-            )
-            filtered_files_s3_detail = self.filter_deleted_markers(
-                filtered_files_s3_detail
-            )
-            model["content"] = self.convert_s3_details_to_models(
-                filtered_files_s3_detail
+            model["content"] = self._with_journaled(
+                path,
+                [self._model_from_entry(entry) for entry in self.fs.list_details(path)],
             )
         return model
 
-    def filter_deleted_markers(self, s3_details):
-        def is_delete_marker(detail):
-            return bool("ST_MTIME" in detail and detail["ST_MTIME"])
-
-        return list(filter(is_delete_marker, s3_details))
-
-    async def get_content_s3_metadata(self, s3_details):
-        async def s3_detail_metadata(s3_detail):
-            if s3_detail["StorageClass"] == "DIRECTORY":
-                dir_path = os.path.join(self.fs.path(s3_detail["Key"]), ".s3keep")
-                try:
-                    lstat = await self.fs.fs._info(dir_path)
-                    s3_detail["LastModified"] = lstat["LastModified"]
-                except FileNotFoundError:
-                    pass
-            st_time = s3_detail.get("LastModified")
-            if st_time:
-                s3_detail["ST_MTIME"] = datetime.datetime(
-                    st_time.year,
-                    st_time.month,
-                    st_time.day,
-                    st_time.hour,
-                    st_time.minute,
-                    st_time.second,
-                    tzinfo=st_time.tzinfo,
-                )
-            return s3_detail
-
-        tasks = [
-            self.fs.fs.loop.create_task(s3_detail_metadata(detail))
-            for detail in s3_details
-        ]
-        details_with_meta = await asyncio.gather(*tasks)
-        return details_with_meta
-
-    def convert_s3_details_to_models(self, s3_details):
-        models = []
-        for s3_detail in s3_details:
-            model_path = s3_detail["Key"]
-            model = base_model(self.fs.remove_prefix(model_path))
-            if s3_detail["StorageClass"] == "DIRECTORY":
-                model["created"] = model["last_modified"] = DUMMY_CREATED_DATE
-                model["type"] = "directory"
-                model["last_modified"] = model["created"] = s3_detail.get(
-                    "LastModified"
-                )
-                if "ST_MTIME" in s3_detail and s3_detail["ST_MTIME"]:
-                    model["created"] = model["last_modified"] = s3_detail["ST_MTIME"]
-            else:
-                model["last_modified"] = s3_detail.get("LastModified").replace(
-                    microsecond=0, tzinfo=tzutc()
-                )
-                model["created"] = model["last_modified"]
-                model["size"] = s3_detail.get("Size", 0)
-                model["type"] = "notebook" if model_path.endswith(".ipynb") else "file"
-            models.append(model)
-        return models
-
-    def _notebook_model_from_path(self, path, content=False, format=None, require_hash=False):
+    def _model_from_entry(self, entry):
+        """Build a model without content from a `list_details` entry"""
+        if entry["type"] == "directory":
+            model = base_directory_model(entry["path"])
+            if entry["ST_MTIME"]:
+                model["created"] = model["last_modified"] = entry["ST_MTIME"]
+            return model
+        model = base_model(entry["path"])
+        model["type"] = "notebook" if entry["path"].endswith(".ipynb") else "file"
+        self._update_model_from_stat(model, entry)
+        return model
+
+    def _notebook_model_from_path(
+        self, path, content=False, format=None, require_hash=False, stat=None
+    ):
         """
         Build a notebook model from database record.
         """
@@ -290,32 +511,41 @@ class GenericContentsManager(ContentsManager, HasTraits):
         )
         model = base_model(path)
         model["type"] = "notebook"
-        if self.fs.isfile(path):
-            info = self.fs.lstat(path)
-            model["created"] = model["last_modified"] = info["ST_MTIME"]
-            model["size"] = info["SIZE"]
-        else:
-            model["created"] = model["last_modified"] = DUMMY_CREATED_DATE
 
         bytes_content = None
         if content:
-            if not self.fs.isfile(path):
+            try:
+                if stat is None:
+                    # One GET gives us both the content and the stat
+                    file_content, _, bytes_content, stat = self.fs.read_with_stat(
+                        path, format
+                    )
+                else:
+                    file_content, _, bytes_content = self.fs.read(path, format)
+            except NoSuchFile:
                 self.no_such_entity(path)
-            file_content, _, bytes_content = self.fs.read(path, format)
-            nb_content = reads(file_content, as_version=NBFORMAT_VERSION)
+            # Before checking the signature, computed with the outputs
+            nb_content = self._read_notebook(path, file_content)
             self.mark_trusted_cells(nb_content, path)
             model["format"] = "json"
             model["content"] = nb_content
             self.validate_notebook_model(model)
+        elif stat is None:
+            stat = self.fs.stat(path)
+
+        self._update_model_from_stat(model, stat)
 
         if require_hash:
             if bytes_content is None:
-                _, _, bytes_content = self.fs.read(path, format)
-            model.update(**self._get_hash(bytes_content))
+                model.update(**self._get_stored_hash(path, stat))
+            else:
+                model.update(**self._get_hash(bytes_content))
 
         return model
 
-    def _file_model_from_path(self, path, content=False, format=None, require_hash=False):
+    def _file_model_from_path(
+        self, path, content=False, format=None, require_hash=False, stat=None
+    ):
         """
         Build a file model from database record.
         """
@@ -324,18 +554,17 @@ class GenericContentsManager(ContentsManager, HasTraits):
         )
         model = base_model(path)
         model["type"] = "file"
-        if self.fs.isfile(path):
-            info = self.fs.lstat(path)
-            model["created"] = model["last_modified"] = info["ST_MTIME"]
-            model["size"] = info["SIZE"]
-        else:
-            model["created"] = model["last_modified"] = DUMMY_CREATED_DATE
 
         bytes_content = None
         if content:
             try:
                 # Get updated format from fs.read()
-                content, format_, bytes_content = self.fs.read(path, format)
+                if stat is None:
+                    content, format_, bytes_content, stat = self.fs.read_with_stat(
+                        path, format
+                    )
+                else:
+                    content, format_, bytes_content = self.fs.read(path, format)
             except NoSuchFile as e:
                 self.no_such_entity(e.path)
             except GenericFSError as e:
@@ -343,18 +572,33 @@ class GenericContentsManager(ContentsManager, HasTraits):
             model["format"] = format_
             model["content"] = content
             model["mimetype"] = mimetypes.guess_type(path)[0] or "text/plain"
+        elif stat is None:
+            stat = self.fs.stat(path)
+
+        self._update_model_from_stat(model, stat)
 
         if require_hash:
             if bytes_content is None:
-                _, _, bytes_content = self.fs.read(path, format)
-            model.update(**self._get_hash(bytes_content))
+                model.update(**self._get_stored_hash(path, stat))
+            else:
+                model.update(**self._get_hash(bytes_content))
 
         return model
 
+    def _update_model_from_stat(self, model, stat):
+        if stat["type"] == "file":
+            if self.journal is not None:
+                stat = self.journal.stat(model["path"], stat)
+            model["created"] = model["last_modified"] = stat["ST_MTIME"]
+            model["size"] = stat["SIZE"]
+        else:
+            model["created"] = model["last_modified"] = DUMMY_CREATED_DATE
+
     def save(self, model, path):
         """Save a file or directory model to path."""
 
-        self.log.debug(f"save with path={path}, model={model}")
+        # Not formatted unless logged, models hold the whole notebook
+        self.log.debug("save with path=%s, model=%s", path, model)
 
         # Chunked uploads
         # See https://jupyter-notebook.readthedocs.io/en/stable/extending/contents.html#chunked-saving
@@ -411,8 +655,6 @@ class GenericContentsManager(ContentsManager, HasTraits):
                 400,
             )
 
-        prune_stale_chunks()
-
         self.log.debug(
             "S3contents.GenericManager.save (chunk %s) %s: '%s'",
             chunk,
@@ -422,9 +664,11 @@ class GenericContentsManager(ContentsManager, HasTraits):
 
         try:
             if chunk == 1:
+                # A journaled save uploaded later would overwrite the file
+                self.flush_writes(path)
                 self.run_pre_save_hook(model=model, path=path)
-            # Store the chunk in our registry
-            store_content_chunk(path, model["content"])
+            # The file system stores the chunk and writes the file on the last one
+            self.fs.write_chunk(path, chunk, model["content"], format)
         except Exception as e:
             self.log.error(
                 "S3contents.GenericManager._save_large_file: error while saving file: %s %s",
@@ -434,27 +678,23 @@ class GenericContentsManager(ContentsManager, HasTraits):
             )
             self.do_error(f"Unexpected error while saving file: {path} {e}")
 
-        if chunk == -1:
-            # Last chunk: we want to combine the chunks in the registry to compose the full file content
-            model["content"] = assemble_chunks(path)
-            delete_chunks(path)
-            self._save_file(model, path)
-
         return self.get(path, content=False)
 
     def _save_notebook(self, model, path):
         nb_contents = from_dict(model["content"])
         self.check_and_sign(nb_contents, path)
-        file_contents = json.dumps(model["content"])
+        file_contents = self._notebook_to_store(model["content"])
         file_format = model.get("format")
-        self.fs.write(path, file_contents, file_format)
+        if not self._write_behind(path, file_contents, "text"):
+            self.fs.write(path, file_contents, file_format)
         self.validate_notebook_model(model)
         return model.get("message")
 
     def _save_file(self, model, path):
         file_contents = model["content"]
         file_format = model.get("format")
-        self.fs.write(path, file_contents, file_format)
+        if not self._write_behind(path, file_contents, file_format):
+            self.fs.write(path, file_contents, file_format)
 
     def _save_directory(self, path):
         self.fs.mkdir(path)
@@ -470,6 +710,8 @@ class GenericContentsManager(ContentsManager, HasTraits):
             old_path,
             new_path,
         )
+        self.flush_writes(old_path)
+        self.flush_writes(new_path)
         if self.file_exists(new_path) or self.dir_exists(new_path):
             self.already_exists(new_path)
         elif self.file_exists(old_path) or self.dir_exists(old_path):
@@ -478,15 +720,22 @@ class GenericContentsManager(ContentsManager, HasTraits):
                 old_path,
                 new_path,
             )
-            self.fs.mv(old_path, new_path)
+            try:
+                self.fs.mv(old_path, new_path)
+            except BulkOperationError as e:
+                self.do_error(str(e), 500)
         else:
             self.no_such_entity(old_path)
 
     def delete_file(self, path):
         """Delete the file or directory at path."""
         self.log.debug("S3contents.GenericManager.delete_file '%s'", path)
+        self.flush_writes(path)
         if self.file_exists(path) or self.dir_exists(path):
-            self.fs.rm(path)
+            try:
+                self.fs.rm(path)
+            except BulkOperationError as e:
+                self.do_error(str(e), 500)
         else:
             self.no_such_entity(path)
 
@@ -495,6 +744,20 @@ class GenericContentsManager(ContentsManager, HasTraits):
         self.log.debug("S3contents.GenericManager.is_hidden '%s'", path)
         return False
 
+    @validate("notebook_serializer")
+    def _validate_notebook_serializer(self, proposal):
+        try:
+            serializers.get_serializer(proposal["value"])
+        except ValueError as e:
+            raise TraitError(str(e)) from e
+        return proposal["value"]
+
+    @property
+    def serializer(self):
+        if self._serializer is None:
+            self._serializer = serializers.get_serializer(self.notebook_serializer)
+        return self._serializer
+
     @validate("post_save_hook")
     def _validate_post_save_hook(self, proposal):
         value = proposal["value"]
@@ -517,6 +780,11 @@ class GenericContentsManager(ContentsManager, HasTraits):
                     "Unexpected error while running post hook save: %s" % e,
                 ) from e
 
+    def _get_stored_hash(self, path, stat):
+        """Hash of the file `path` stored at write time, without downloading it"""
+        digest = stat.get("SHA256") or self.fs.hash(path)
+        return {"hash": digest, "hash_algorithm": "sha256"}
+
     def _get_hash(self, byte_content: bytes, hash_algorithm: str = "sha256") -> dict[str, str]:
         """Compute the hash hexdigest for the provided bytes."""
         h = hashlib.new(hash_algorithm)
@@ -524,6 +792,20 @@ class GenericContentsManager(ContentsManager, HasTraits):
         return {"hash": h.hexdigest(), "hash_algorithm": hash_algorithm}
 
 
+def decode(path, bytes_content, format):
+    """Return the content and format of a file model from its bytes"""
+    # format is not base64-encoded. "json" is requested by jupyter collaboration.
+    if format is None or format in ["text", "json"]:
+        try:
+            return bytes_content.decode("utf-8"), "text"
+        except UnicodeError:
+            if format == "text":
+                raise HTTPError(
+                    400, "{} is not UTF-8 encoded".format(path), reason="bad format"
+                ) from None
+    return base64.b64encode(bytes_content).decode("ascii"), "base64"
+
+
 def base_model(path):
     return {
         "name": path.rsplit("/", 1)[-1],
@@ -0,0 +1,181 @@
+"""
+Tornado handler serving /files/ downloads straight from the bucket.
+
+Files are streamed in chunks of `files_chunk_size` bytes, so large downloads
+don't have to fit in memory, and HTTP Range requests are supported. Notebooks
+are read whole, their cells and outputs stored as blobs are put back.
+"""
+
+import mimetypes
+import re
+
+from jupyter_core.utils import ensure_async
+from tornado import web
+
+from s3contents.genericfs import NoSuchFile
+from s3contents.ipycompat import JupyterHandler, authorized, writes
+
+if JupyterHandler is None:
+    raise ImportError(
+        "StreamingFilesHandler requires jupyter_server. "
+        "Install it with: pip install jupyter_server"
+    )
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def parse_range(header, size):
+    """Return the `(start, end)` (end excluded) of a single range Range header
+    for a file of `size` bytes.
+
+    Returns None when the header should be ignored (invalid or multiple ranges)
+    and raises ValueError when the range can't be satisfied.
+    """
+    match = RANGE_RE.match(header.strip())
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the last N bytes
+        start, end = max(size - int(last), 0), size
+    else:
+        start = int(first)
+        end = min(int(last) + 1, size) if last else size
+        if last and int(last) < start:
+            return None
+    if start >= size or start >= end:
+        raise ValueError("Range not satisfiable: {}".format(header))
+    return start, end
+
+
+class StreamingFilesHandler(JupyterHandler):
+    """Serve files from the contents manager file system in chunks.
+
+    Files bigger than `files_presign_threshold` are redirected to a presigned
+    URL when the file system supports it, so the bytes don't go through the
+    Jupyter server at all.
+    """
+
+    auth_resource = "contents"
+
+    @property
+    def content_security_policy(self):
+        # In case we're serving HTML/SVG, confine any Javascript to a unique
+        # origin so it can't interact with the notebook server.
+        return super().content_security_policy + "; sandbox allow-scripts"
+
+    @web.authenticated
+    @authorized
+    async def head(self, path):
+        await self.serve(path, include_body=False)
+
+    @web.authenticated
+    @authorized
+    async def get(self, path):
+        await self.serve(path, include_body=True)
+
+    async def serve(self, path, include_body):
+        # /files/ requests must originate from the same site
+        self.check_xsrf_cookie()
+        cm = self.contents_manager
+        path = path.strip("/")
+
+        if not cm.allow_hidden and await ensure_async(cm.is_hidden(path)):
+            self.log.info("Refusing to serve hidden file, via 404 Error")
+            raise web.HTTPError(404)
+
+        if cm.journal is not None and cm.journal.pending_stat(path):
+            # The file is read from the bucket, upload its journaled save first
+            await ensure_async(cm.flush_writes(path))
+
+        stat = await cm.fs._stat(path)
+        if stat["type"] != "file":
+            raise web.HTTPError(404)
+        size = stat["SIZE"]
+        name = path.rsplit("/", 1)[-1]
+
+        # The stored notebook may not be the notebook, it's served from memory
+        notebook = None
+        if name.lower().endswith(".ipynb"):
+            notebook = await self.read_notebook(path)
+            size = len(notebook)
+
+        threshold = cm.files_presign_threshold
+        if include_body and notebook is None and threshold and size >= threshold:
+            try:
+                url = await cm.fs._presign(path, cm.files_presign_expiration)
+            except NotImplementedError:
+                url = None
+            if url:
+                self.redirect(url)
+                return
+
+        self.set_content_type(name)
+        if self.get_argument("download", None):
+            self.set_attachment_header(name)
+        if stat["ST_MTIME"]:
+            self.set_header("Last-Modified", stat["ST_MTIME"])
+        self.set_header("Accept-Ranges", "bytes")
+
+        start, end = 0, size
+        range_header = self.request.headers.get("Range")
+        if range_header:
+            try:
+                byte_range = parse_range(range_header, size)
+            except ValueError:
+                self.set_status(416)
+                self.set_header("Content-Range", "bytes */{}".format(size))
+                return
+            if byte_range is not None:
+                start, end = byte_range
+                self.set_status(206)
+                self.set_header(
+                    "Content-Range", "bytes {}-{}/{}".format(start, end - 1, size)
+                )
+        self.set_header("Content-Length", end - start)
+
+        if not include_body:
+            return
+        if notebook is not None:
+            self.write(notebook[start:end])
+            return
+        chunks = cm.fs._read_chunks(path, start, end, cm.files_chunk_size)
+        try:
+            async for chunk in chunks:
+                self.write(chunk)
+                # Wait for the chunk to be sent before reading the next one
+                await self.flush()
+        except NoSuchFile:
+            raise web.HTTPError(404) from None
+        finally:
+            await chunks.aclose()
+
+    async def read_notebook(self, path):
+        """Content of the notebook `path` as downloaded"""
+        cm = self.contents_manager
+        try:
+            file_content, _, raw_content = await cm.fs._read(path, "text")
+        except NoSuchFile:
+            raise web.HTTPError(404) from None
+        if not cm._has_blobs(file_content):
+            return raw_content
+        # Put back the cells and outputs stored as blobs
+        model = await ensure_async(cm.get(path, type="notebook"))
+        return writes(model["content"]).encode("utf-8")
+
+    def set_content_type(self, name):
+        if name.lower().endswith(".ipynb"):
+            self.set_header("Content-Type", "application/x-ipynb+json")
+            return
+        cur_mime, encoding = mimetypes.guess_type(name)
+        if cur_mime == "text/plain":
+            self.set_header("Content-Type", "text/plain; charset=UTF-8")
+        # RFC 6713
+        elif encoding == "gzip":
+            self.set_header("Content-Type", "application/gzip")
+        elif encoding is not None or cur_mime is None:
+            self.set_header("Content-Type", "application/octet-stream")
+        else:
+            self.set_header("Content-Type", cur_mime)
@@ -9,6 +9,7 @@ from nbformat.v4.nbbase import (
     new_code_cell,
     new_markdown_cell,
     new_notebook,
+    new_output,
     new_raw_cell,
 )
 from nbformat.v4.rwbase import strip_transient
@@ -50,6 +51,26 @@ if not ct_mgr_deps_loaded:
     except ModuleNotFoundError:
         pass
 
+# Async contents managers are only available in jupyter_server
+try:
+    from jupyter_server.services.contents.checkpoints import AsyncCheckpoints
+    from jupyter_server.services.contents.filecheckpoints import (
+        AsyncGenericFileCheckpoints,
+    )
+    from jupyter_server.services.contents.manager import AsyncContentsManager
+except ImportError:
+    AsyncCheckpoints = None
+    AsyncContentsManager = None
+    AsyncGenericFileCheckpoints = None
+
+# Handlers to serve files from the bucket are only available in jupyter_server
+try:
+    from jupyter_server.auth.decorator import authorized
+    from jupyter_server.base.handlers import JupyterHandler
+except ImportError:
+    JupyterHandler = None
+    authorized = None
+
 if not ct_mgr_deps_loaded:
     raise ImportError(
         "Couldn't import ContentsManager from either notebook or jupyter_server."
@@ -60,6 +81,7 @@ from traitlets import (
     Any,
     Bool,
     Dict,
+    Float,
     HasTraits,
     Instance,
     Integer,
@@ -107,6 +129,9 @@ string_types = (str,)
 
 __all__ = [
     "Any",
+    "AsyncCheckpoints",
+    "AsyncContentsManager",
+    "AsyncGenericFileCheckpoints",
     "Bool",
     "Checkpoints",
     "Config",
@@ -114,18 +139,22 @@ __all__ = [
     "AuthenticatedFileHandler",
     "Dict",
     "FileContentsManager",
+    "Float",
     "GenericCheckpointsMixin",
     "GenericFileCheckpoints",
     "HasTraits",
     "Instance",
     "Integer",
+    "JupyterHandler",
     "TraitError",
     "Unicode",
+    "authorized",
     "from_dict",
     "import_item",
     "new_code_cell",
     "new_markdown_cell",
     "new_notebook",
+    "new_output",
     "new_raw_cell",
     "reads",
     "string_types",
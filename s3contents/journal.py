@@ -0,0 +1,315 @@
+"""
+Local journal of the saves not uploaded yet, used by the write-behind mode.
+
+A save is written to a file in the journal directory (and fsynced) before
+being acknowledged, a background thread uploads the journaled saves to the
+bucket, retrying failures, and deletes them once uploaded. Saves left in the
+journal by a server that stopped or crashed are uploaded when it starts again.
+
+Each journal file holds one save: a JSON header line with the path and the
+date of the save followed by the raw content. Files are named after an
+increasing sequence number so the latest save of a path wins on replay.
+"""
+
+import datetime
+import json
+import os
+import threading
+import time
+
+from s3contents.cache import LRUCache
+
+ENTRY_SUFFIX = ".entry"
+TMP_PREFIX = ".tmp-"
+
+
+class Entry:
+    """A save waiting to be uploaded"""
+
+    def __init__(self, seq, path, mtime, size, filename):
+        self.seq = seq
+        self.path = path
+        self.mtime = mtime
+        self.size = size
+        self.filename = filename
+        self.attempts = 0
+        self.retry_at = 0
+
+    @property
+    def stat(self):
+        return {"type": "file", "ST_MTIME": self.mtime, "SIZE": self.size}
+
+
+class Journal:
+    """Write-behind journal of the saves in `directory`.
+
+    Parameters
+    ----------
+    directory : str
+        Local directory of the journal, created if needed.
+    upload : callable
+        ``upload(path, content)`` writes the bytes `content` to `path` in the
+        bucket and returns its `stat`. Called from the uploader thread.
+    log : logging.Logger
+    retry_delay : float
+        Seconds before retrying a failed upload, doubled on every failure up
+        to `max_retry_delay`.
+    """
+
+    def __init__(self, directory, upload, log, retry_delay=1, max_retry_delay=60):
+        self.directory = directory
+        self.upload = upload
+        self.log = log
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        # Path -> Entry of the latest save of each path not uploaded yet
+        self.pending = {}
+        # Path -> (date of the object in the bucket, date of the save), see `stat`
+        self.uploaded = LRUCache(maxsize=4096)
+        self._seq = 0
+        self._uploading = set()
+        self._condition = threading.Condition()
+        self._stopped = False
+        self._thread = None
+        os.makedirs(directory, exist_ok=True)
+        self.replay()
+
+    def replay(self):
+        """Load the saves left in the journal directory"""
+        for filename in sorted(os.listdir(self.directory)):
+            filename_ = os.path.join(self.directory, filename)
+            if filename.startswith(TMP_PREFIX):
+                # The server stopped before the save was acknowledged
+                os.remove(filename_)
+                continue
+            if not filename.endswith(ENTRY_SUFFIX):
+                continue
+            try:
+                with open(filename_, "rb") as f:
+                    header = json.loads(f.readline())
+                    start = f.tell()
+                    size = f.seek(0, os.SEEK_END) - start
+                entry = Entry(
+                    int(filename[: -len(ENTRY_SUFFIX)]),
+                    header["path"],
+                    datetime.datetime.fromisoformat(header["mtime"]),
+                    size,
+                    filename_,
+                )
+            except (OSError, ValueError, KeyError) as e:
+                self.log.error(
+                    "S3contents.Journal: Ignoring invalid entry `%s`: %s", filename_, e
+                )
+                continue
+            self._seq = max(self._seq, entry.seq)
+            # Sorted by sequence number, the latest save of a path comes last
+            previous = self.pending.get(entry.path)
+            if previous is not None:
+                os.remove(previous.filename)
+            self.pending[entry.path] = entry
+        if self.pending:
+            self.log.info(
+                "S3contents.Journal: %s saves to upload from `%s`",
+                len(self.pending),
+                self.directory,
+            )
+
+    def start(self):
+        """Start uploading the journaled saves in a background thread"""
+        self._thread = threading.Thread(
+            target=self._run, name="s3contents-journal", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        """Stop the uploader thread, the saves not uploaded stay in the journal"""
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+
+    #  Saves -------------------------------------------------------------------
+
+    def append(self, path, content):
+        """Journal the save of the bytes `content` to `path`, returns its `stat`"""
+        with self._condition:
+            self._seq += 1
+            seq = self._seq
+        mtime = datetime.datetime.now(datetime.timezone.utc)
+        filename_ = os.path.join(self.directory, "{:020d}{}".format(seq, ENTRY_SUFFIX))
+        tmp_filename_ = os.path.join(
+            self.directory, "{}{:020d}".format(TMP_PREFIX, seq)
+        )
+        header = json.dumps({"path": path, "mtime": mtime.isoformat()})
+        with open(tmp_filename_, "wb") as f:
+            f.write(header.encode("utf-8") + b"\n")
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_filename_, filename_)
+        self._fsync_directory()
+
+        entry = Entry(seq, path, mtime, len(content), filename_)
+        with self._condition:
+            previous = self.pending.get(path)
+            if previous is not None and previous.seq > seq:
+                # A concurrent save of the same path was journaled after this one
+                os.remove(filename_)
+                return previous.stat
+            self.pending[path] = entry
+            if previous is not None and previous.path not in self._uploading:
+                os.remove(previous.filename)
+            self._condition.notify_all()
+        return entry.stat
+
+    def _fsync_directory(self):
+        if not hasattr(os, "O_DIRECTORY"):
+            return
+        fd = os.open(self.directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def get(self, path):
+        """Return the content and `stat` of the pending save of `path` or None"""
+        while True:
+            with self._condition:
+                entry = self.pending.get(path)
+            if entry is None:
+                return None
+            try:
+                with open(entry.filename, "rb") as f:
+                    f.readline()
+                    return f.read(), entry.stat
+            except FileNotFoundError:
+                with self._condition:
+                    if self.pending.get(path) is entry:
+                        raise
+                # Replaced by a newer save or uploaded in the meantime
+
+    def pending_stat(self, path):
+        """`stat` of the pending save of `path` or None"""
+        with self._condition:
+            entry = self.pending.get(path)
+        return entry.stat if entry is not None else None
+
+    def list_pending(self, path):
+        """`stat` of the pending saves in the directory `path`, with a `path` key"""
+        prefix = path + "/" if path else ""
+        with self._condition:
+            entries = list(self.pending.values())
+        return [
+            dict(entry.stat, path=entry.path)
+            for entry in entries
+            if entry.path.startswith(prefix) and "/" not in entry.path[len(prefix) :]
+        ]
+
+    def stat(self, path, stat):
+        """Translate the `stat` of `path` in the bucket.
+
+        An uploaded object is dated from the upload, after the save was
+        acknowledged. The date of the save is returned instead until the
+        object changes, so the frontend doesn't take the upload for a change
+        made by someone else.
+        """
+        uploaded = self.uploaded.get(path)
+        if uploaded is not None and stat.get("ST_MTIME") == uploaded[0]:
+            return dict(stat, ST_MTIME=uploaded[1])
+        return stat
+
+    #  Uploads -----------------------------------------------------------------
+
+    def flush(self, path=""):
+        """Upload the pending saves of `path` and everything under it now, in
+        the calling thread. Raises the error of a failed upload."""
+        path = path.strip("/")
+        while True:
+            with self._condition:
+                entries = [
+                    entry
+                    for entry in self.pending.values()
+                    if not path
+                    or entry.path == path
+                    or entry.path.startswith(path + "/")
+                ]
+                if not entries:
+                    return
+                entry = next(
+                    (e for e in entries if e.path not in self._uploading), None
+                )
+                if entry is None:
+                    # Being uploaded by the uploader thread
+                    self._condition.wait()
+                    continue
+                self._uploading.add(entry.path)
+            self._upload(entry)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                entry, delay = self._next()
+                while entry is None:
+                    if self._stopped:
+                        return
+                    self._condition.wait(delay)
+                    entry, delay = self._next()
+                self._uploading.add(entry.path)
+            try:
+                self._upload(entry)
+            except Exception as e:
+                entry.attempts += 1
+                delay = min(
+                    self.retry_delay * 2 ** (entry.attempts - 1), self.max_retry_delay
+                )
+                entry.retry_at = time.monotonic() + delay
+                self.log.warning(
+                    "S3contents.Journal: Upload of `%s` failed (attempt %s), "
+                    "retrying in %ss: %s",
+                    entry.path,
+                    entry.attempts,
+                    delay,
+                    e,
+                )
+
+    def _next(self):
+        """Oldest entry ready to be uploaded, or None and the seconds to wait"""
+        if self._stopped:
+            return None, None
+        now = time.monotonic()
+        ready = [
+            entry
+            for entry in self.pending.values()
+            if entry.path not in self._uploading
+        ]
+        if not ready:
+            return None, None
+        entry = min(ready, key=lambda e: (e.retry_at, e.seq))
+        if entry.retry_at > now:
+            return None, entry.retry_at - now
+        return entry, None
+
+    def _upload(self, entry):
+        try:
+            with open(entry.filename, "rb") as f:
+                f.readline()
+                content = f.read()
+            stat = self.upload(entry.path, content)
+        except Exception:
+            self._done(entry, uploaded=False)
+            raise
+        self.uploaded.set(entry.path, (stat["ST_MTIME"], entry.mtime))
+        self.log.debug("S3contents.Journal: Uploaded `%s`", entry.path)
+        self._done(entry, uploaded=True)
+
+    def _done(self, entry, uploaded):
+        with self._condition:
+            self._uploading.discard(entry.path)
+            if self.pending.get(entry.path) is not entry:
+                # Replaced by a newer save while being uploaded
+                os.remove(entry.filename)
+            elif uploaded:
+                del self.pending[entry.path]
+                os.remove(entry.filename)
+            self._condition.notify_all()
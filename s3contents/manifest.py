@@ -0,0 +1,45 @@
+"""
+Per-directory manifests: one small object per directory listing the names,
+types, sizes and last modified dates of its entries, so listing a directory
+is a single GET instead of a LIST plus one HEAD per subdirectory.
+
+See `s3contents.reconcile` to rebuild them from the contents of the bucket.
+"""
+
+import datetime
+import json
+
+MANIFEST_VERSION = 1
+
+
+def dumps(entries):
+    """Serialize the manifest `entries`, a dictionary of name -> stat"""
+    serialized = {}
+    for name, stat in entries.items():
+        st_time = stat["ST_MTIME"]
+        serialized[name] = {
+            "type": stat["type"],
+            "ST_MTIME": st_time.isoformat() if st_time else None,
+            "SIZE": stat["SIZE"],
+        }
+    manifest = {"version": MANIFEST_VERSION, "entries": serialized}
+    return json.dumps(manifest, sort_keys=True).encode("utf-8")
+
+
+def loads(raw):
+    """Parse a manifest serialized by `dumps`, None if it's not valid"""
+    try:
+        manifest = json.loads(raw)
+    except ValueError:
+        return None
+    if not isinstance(manifest, dict) or manifest.get("version") != MANIFEST_VERSION:
+        return None
+    entries = {}
+    for name, stat in manifest["entries"].items():
+        st_time = stat["ST_MTIME"]
+        entries[name] = {
+            "type": stat["type"],
+            "ST_MTIME": datetime.datetime.fromisoformat(st_time) if st_time else None,
+            "SIZE": stat["SIZE"],
+        }
+    return entries
@@ -0,0 +1,265 @@
+"""
+File system kept in memory, for tests and as a fast scratch backend.
+
+Every call made to it is recorded with its arguments, so tests can assert how
+many backend calls an operation of the contents manager makes, and an optional
+latency can be simulated.
+"""
+
+import base64
+import collections
+import datetime
+import functools
+import hashlib
+import threading
+import time
+
+from tornado.web import HTTPError
+
+from s3contents.genericfs import GenericFS, NoSuchFile
+from s3contents.ipycompat import Float, Unicode
+
+Call = collections.namedtuple("Call", ["method", "args", "latency"])
+
+
+def recorded(method):
+    """Record the calls to a MemoryFS method and sleep for `latency`.
+
+    Only the calls made from outside the file system are recorded, e.g. `mv`
+    is one call even if it uses `cp` and `rm`.
+    """
+
+    @functools.wraps(method)
+    def wrapper(self, *args):
+        if getattr(self._local, "depth", 0):
+            return method(self, *args)
+        self.calls.append(Call(method.__name__, args, self.latency))
+        if self.latency:
+            time.sleep(self.latency)
+        self._local.depth = 1
+        try:
+            return method(self, *args)
+        finally:
+            self._local.depth = 0
+
+    return wrapper
+
+
+class MemoryFS(GenericFS):
+    latency = Float(
+        0, help="Seconds each call sleeps for, to simulate a remote backend"
+    ).tag(config=True)
+
+    delimiter = Unicode("/", help="Path delimiter").tag(config=True)
+    dir_keep_file = Unicode(
+        ".s3keep", help="Not stored, directories are kept explicitly"
+    ).tag(config=True)
+
+    def __init__(self, log, **kwargs):
+        super(MemoryFS, self).__init__(**kwargs)
+        self.log = log
+        self.calls = []
+        self._local = threading.local()
+        self._lock = threading.RLock()
+        # Path -> (content, last modified) and path -> last modified
+        self.files = {}
+        self.directories = {"": self._now()}
+
+    def reset_calls(self):
+        """Forget the calls recorded so far"""
+        self.calls = []
+
+    def call_count(self, *methods):
+        """Number of calls recorded, only of `methods` if given"""
+        return len([c for c in self.calls if not methods or c.method in methods])
+
+    #  GenericFS methods -------------------------------------------------------
+
+    @recorded
+    def ls(self, path=""):
+        return [child["path"] for child in self._children(self.strip(path))]
+
+    @recorded
+    def list_details(self, path):
+        path = self.strip(path)
+        entries = []
+        for child in self._children(path):
+            if child["path"] != self.internal_dir:
+                entries.append(child)
+        return entries
+
+    def _children(self, path):
+        prefix = path + self.delimiter if path else ""
+        children = {}
+        with self._lock:
+            for file_path, (content, mtime) in self.files.items():
+                if not file_path.startswith(prefix):
+                    continue
+                name, _, rest = file_path[len(prefix) :].partition(self.delimiter)
+                if rest:
+                    children.setdefault(name, self._directory_stat(prefix + name))
+                else:
+                    children[name] = self._file_stat(content, mtime)
+            for dir_path in self.directories:
+                if dir_path and dir_path.startswith(prefix):
+                    name = dir_path[len(prefix) :].partition(self.delimiter)[0]
+                    children.setdefault(name, self._directory_stat(prefix + name))
+        return [
+            dict(stat, path=prefix + name) for name, stat in sorted(children.items())
+        ]
+
+    @recorded
+    def isfile(self, path):
+        return self.strip(path) in self.files
+
+    @recorded
+    def isdir(self, path):
+        return self._has_directory(self.strip(path))
+
+    def _has_directory(self, path):
+        if path in self.directories:
+            return True
+        prefix = path + self.delimiter
+        with self._lock:
+            return any(p.startswith(prefix) for p in self.files)
+
+    @recorded
+    def mv(self, old_path, new_path):
+        self.cp(old_path, new_path)
+        self.rm(old_path)
+
+    @recorded
+    def cp(self, old_path, new_path):
+        old_path, new_path = self.strip(old_path), self.strip(new_path)
+        with self._lock:
+            if old_path in self.files:
+                self.files[new_path] = (self.files[old_path][0], self._now())
+                return
+            for path, renamed in self._tree(old_path, new_path):
+                if path in self.files:
+                    self.files[renamed] = (self.files[path][0], self._now())
+                else:
+                    self.directories[renamed] = self._now()
+
+    @recorded
+    def rm(self, path):
+        path = self.strip(path)
+        with self._lock:
+            if path in self.files:
+                del self.files[path]
+                return
+            for child, _ in self._tree(path, path):
+                self.files.pop(child, None)
+                self.directories.pop(child, None)
+
+    def _tree(self, path, new_path):
+        """Paths of the directory `path` and everything in it, with their
+        path under `new_path`"""
+        prefix = path + self.delimiter
+        paths = [p for p in list(self.files) + list(self.directories) if p]
+        return [
+            (p, new_path + p[len(path) :])
+            for p in paths
+            if p == path or p.startswith(prefix)
+        ]
+
+    @recorded
+    def mkdir(self, path):
+        self.directories[self.strip(path)] = self._now()
+
+    @recorded
+    def read(self, path, format):
+        return self._read_file(path, format)
+
+    @recorded
+    def read_with_stat(self, path, format):
+        path = self.strip(path)
+        with self._lock:
+            result = self._read_file(path, format)
+            return result + (self._stat_path(path),)
+
+    def _read_file(self, path, format):
+        path = self.strip(path)
+        try:
+            content, _ = self.files[path]
+        except KeyError:
+            raise NoSuchFile(path) from None
+        # format is not base64-encoded. "json" is requested by jupyter collaboration.
+        if format is None or format in ["text", "json"]:
+            try:
+                return content.decode("utf-8"), "text", content
+            except UnicodeError:
+                if format == "text":
+                    raise HTTPError(
+                        400, "{} is not UTF-8 encoded".format(path), reason="bad format"
+                    ) from None
+        return base64.b64encode(content).decode("ascii"), "base64", content
+
+    @recorded
+    def hash(self, path):
+        # Like a backend storing the hashes, answered without a read
+        path = self.strip(path)
+        try:
+            return hashlib.sha256(self.files[path][0]).hexdigest()
+        except KeyError:
+            raise NoSuchFile(path) from None
+
+    @recorded
+    def read_range(self, path, start, end):
+        path = self.strip(path)
+        try:
+            return self.files[path][0][start:end]
+        except KeyError:
+            raise NoSuchFile(path) from None
+
+    def lstat(self, path):
+        stat = self.stat(path)
+        return {"ST_MTIME": stat["ST_MTIME"], "SIZE": stat["SIZE"]}
+
+    @recorded
+    def stat(self, path):
+        return self._stat_path(self.strip(path))
+
+    def _stat_path(self, path):
+        with self._lock:
+            if path in self.files:
+                return self._file_stat(*self.files[path])
+            if self._has_directory(path):
+                return self._directory_stat(path)
+        return {"type": None, "ST_MTIME": None, "SIZE": 0}
+
+    def _file_stat(self, content, mtime):
+        return {"type": "file", "ST_MTIME": mtime, "SIZE": len(content)}
+
+    def _directory_stat(self, path):
+        return {"type": "directory", "ST_MTIME": self.directories.get(path), "SIZE": 0}
+
+    @recorded
+    def write(self, path, content, format):
+        if format == "base64":
+            content_ = base64.b64decode(content.encode("ascii"))
+        else:
+            content_ = content.encode("utf-8")
+        self.files[self.strip(path)] = (content_, self._now())
+
+    @recorded
+    def writenotebook(self, path, content):
+        self.files[self.strip(path)] = (content.encode("utf-8"), self._now())
+
+    @recorded
+    def write_chunk(self, path, chunk, content, format):
+        super(MemoryFS, self).write_chunk(path, chunk, content, format)
+
+    #  Utilities ---------------------------------------------------------------
+
+    def strip(self, path):
+        return path.strip(self.delimiter)
+
+    def path(self, *path):
+        """Join paths, there's no bucket or prefix"""
+        return self.delimiter.join(self.strip(p) for p in path if p)
+
+    @staticmethod
+    def _now():
+        # Remove the microseconds like the other file systems
+        return datetime.datetime.now(datetime.timezone.utc).replace(microsecond=0)
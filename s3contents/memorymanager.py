@@ -0,0 +1,26 @@
+from s3contents.genericmanager import GenericContentsManager
+from s3contents.ipycompat import Float
+from s3contents.memory_fs import MemoryFS
+
+
+class MemoryContentsManager(GenericContentsManager):
+    """Contents manager keeping everything in memory.
+
+    The contents are lost when the server stops, use it for tests or as a
+    scratch space.
+    """
+
+    latency = Float(
+        0, help="Seconds each file system call sleeps for, to simulate a remote backend"
+    ).tag(config=True)
+
+    def __init__(self, *args, **kwargs):
+        super(MemoryContentsManager, self).__init__(*args, **kwargs)
+        self._fs = MemoryFS(
+            log=self.log,
+            latency=self.latency,
+            metadata_cache_ttl=self.metadata_cache_ttl,
+            metadata_cache_maxsize=self.metadata_cache_maxsize,
+        )
+        self.init_metrics()
+        self.init_journal()
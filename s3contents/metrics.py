@@ -0,0 +1,279 @@
+"""
+Prometheus metrics for the contents managers and their file systems.
+
+With `enable_metrics` the entry points of the contents manager and the methods
+of its file system are wrapped to record their latency, the backend requests
+each operation made and the bytes read and written. The metrics are registered
+in the default prometheus_client registry, served by jupyter_server at
+`/metrics`. When disabled nothing is wrapped so there's no overhead.
+"""
+
+import contextlib
+import contextvars
+import functools
+import inspect
+import threading
+import time
+import weakref
+
+try:
+    from prometheus_client import REGISTRY, Counter, Histogram
+    from prometheus_client.core import CounterMetricFamily
+except ImportError:
+    REGISTRY = None
+
+# Contents manager entry points recorded as operations
+MANAGER_METHODS = (
+    "get",
+    "save",
+    "delete_file",
+    "rename_file",
+    "new_untitled",
+    "copy",
+    "file_exists",
+    "dir_exists",
+)
+
+# File system methods whose latency is recorded, the coroutine versions
+# (prefixed with `_`) are recorded under the same name
+FS_METHODS = (
+    "ls",
+    "list_details",
+    "isfile",
+    "isdir",
+    "mv",
+    "cp",
+    "rm",
+    "mkdir",
+    "read",
+    "read_with_stat",
+    "read_range",
+    "presign",
+    "stat",
+    "write",
+    "writenotebook",
+    "write_chunk",
+)
+
+REQUEST_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 500, 1000, float("inf"))
+
+# Operation in progress in the current context, where backend requests are
+# counted. The context is copied to the fsspec event loop by `sync()`.
+_current_operation = contextvars.ContextVar("s3contents_operation", default=None)
+# Set while a file system call is recorded, so the calls it makes to other
+# methods of the file system are not recorded twice
+_in_fs_call = contextvars.ContextVar("s3contents_fs_call", default=False)
+
+_metrics = None
+_metrics_lock = threading.Lock()
+
+
+class _OperationStats:
+    def __init__(self, parent):
+        self.parent = parent
+        self.requests = 0
+
+
+class Metrics:
+    """The s3contents metrics, registered once per process"""
+
+    def __init__(self, registry):
+        self.operation_seconds = Histogram(
+            "s3contents_operation_seconds",
+            "Duration of the contents manager operations",
+            ["operation"],
+            registry=registry,
+        )
+        self.operation_requests = Histogram(
+            "s3contents_operation_requests",
+            "Backend requests made by each contents manager operation",
+            ["operation"],
+            buckets=REQUEST_BUCKETS,
+            registry=registry,
+        )
+        self.operation_errors = Counter(
+            "s3contents_operation_errors",
+            "Contents manager operations that raised an error",
+            ["operation"],
+            registry=registry,
+        )
+        self.fs_seconds = Histogram(
+            "s3contents_fs_seconds",
+            "Duration of the file system calls, including the time the caller "
+            "was blocked waiting for the fsspec event loop",
+            ["method"],
+            registry=registry,
+        )
+        self.backend_requests = Counter(
+            "s3contents_backend_requests",
+            "Requests made to the storage backend",
+            ["operation"],
+            registry=registry,
+        )
+        self.read_bytes = Counter(
+            "s3contents_read_bytes", "Bytes read from the backend", registry=registry
+        )
+        self.written_bytes = Counter(
+            "s3contents_written_bytes",
+            "Bytes written to the backend",
+            registry=registry,
+        )
+        self.caches = CacheCollector()
+        registry.register(self.caches)
+
+    @contextlib.contextmanager
+    def operation(self, name):
+        stats = _OperationStats(_current_operation.get())
+        token = _current_operation.set(stats)
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.operation_errors.labels(name).inc()
+            raise
+        finally:
+            _current_operation.reset(token)
+            self.operation_seconds.labels(name).observe(time.perf_counter() - start)
+            self.operation_requests.labels(name).observe(stats.requests)
+
+    def on_request(self, operation):
+        """Count a request to the backend, called by the file system"""
+        self.backend_requests.labels(operation).inc()
+        stats = _current_operation.get()
+        while stats is not None:
+            stats.requests += 1
+            stats = stats.parent
+
+    def count_bytes(self, method, args, result):
+        if method in ("read", "read_with_stat"):
+            self.read_bytes.inc(len(result[2]))
+        elif method == "read_range":
+            self.read_bytes.inc(len(result))
+        elif method == "write":
+            self.written_bytes.inc(content_size(args[1], args[2]))
+        elif method == "write_chunk":
+            self.written_bytes.inc(content_size(args[2], args[3]))
+        elif method == "writenotebook":
+            self.written_bytes.inc(content_size(args[1], "text"))
+
+
+class CacheCollector:
+    """Hits and misses of the caches of the instrumented file systems,
+    read when the metrics are scraped"""
+
+    def __init__(self):
+        self.file_systems = weakref.WeakSet()
+
+    def collect(self):
+        hits = CounterMetricFamily(
+            "s3contents_cache_hits",
+            "Cache lookups that found an entry",
+            labels=["cache"],
+        )
+        misses = CounterMetricFamily(
+            "s3contents_cache_misses",
+            "Cache lookups that didn't find an entry",
+            labels=["cache"],
+        )
+        totals = {"metadata": [0, 0], "content": [0, 0]}
+        for fs in list(self.file_systems):
+            for name, cache in [
+                ("metadata", fs.metadata_cache),
+                ("content", fs.content_cache),
+            ]:
+                if cache is not None:
+                    totals[name][0] += cache.hits
+                    totals[name][1] += cache.misses
+        for name, (cache_hits, cache_misses) in totals.items():
+            hits.add_metric([name], cache_hits)
+            misses.add_metric([name], cache_misses)
+        yield hits
+        yield misses
+
+
+def content_size(content, format):
+    """Size in bytes of the `content` of a model"""
+    if format == "base64":
+        return len(content) * 3 // 4 - content[-2:].count("=")
+    return len(content.encode("utf-8"))
+
+
+def get_metrics():
+    global _metrics
+    with _metrics_lock:
+        if _metrics is None:
+            _metrics = Metrics(REGISTRY)
+        return _metrics
+
+
+def instrument(contents_manager):
+    """Record the metrics of `contents_manager` and its file system"""
+    if REGISTRY is None:
+        contents_manager.log.warning(
+            "S3contents: enable_metrics requires prometheus_client. "
+            "Install it with: pip install prometheus_client"
+        )
+        return
+    metrics = get_metrics()
+    for name in MANAGER_METHODS:
+        method = getattr(contents_manager, name)
+        setattr(contents_manager, name, _operation_wrapper(metrics, name, method))
+
+    fs = contents_manager.fs
+    for name in FS_METHODS:
+        for attr in (name, "_" + name):
+            method = getattr(fs, attr, None)
+            if method is not None:
+                setattr(fs, attr, _fs_wrapper(metrics, name, method))
+    metrics.caches.file_systems.add(fs)
+    fs.add_request_listener(metrics.on_request)
+
+
+def _operation_wrapper(metrics, name, method):
+    if inspect.iscoroutinefunction(method):
+
+        async def wrapper(*args, **kwargs):
+            with metrics.operation(name):
+                return await method(*args, **kwargs)
+
+    else:
+
+        def wrapper(*args, **kwargs):
+            with metrics.operation(name):
+                return method(*args, **kwargs)
+
+    return functools.wraps(method)(wrapper)
+
+
+def _fs_wrapper(metrics, name, method):
+    if inspect.iscoroutinefunction(method):
+
+        async def wrapper(*args, **kwargs):
+            if _in_fs_call.get():
+                return await method(*args, **kwargs)
+            token = _in_fs_call.set(True)
+            start = time.perf_counter()
+            try:
+                result = await method(*args, **kwargs)
+            finally:
+                _in_fs_call.reset(token)
+                metrics.fs_seconds.labels(name).observe(time.perf_counter() - start)
+            metrics.count_bytes(name, args, result)
+            return result
+
+    else:
+
+        def wrapper(*args, **kwargs):
+            if _in_fs_call.get():
+                return method(*args, **kwargs)
+            token = _in_fs_call.set(True)
+            start = time.perf_counter()
+            try:
+                result = method(*args, **kwargs)
+            finally:
+                _in_fs_call.reset(token)
+                metrics.fs_seconds.labels(name).observe(time.perf_counter() - start)
+            metrics.count_bytes(name, args, result)
+            return result
+
+    return functools.wraps(method)(wrapper)
@@ -0,0 +1,58 @@
+"""
+Rebuild the directory manifests from the real contents of the bucket, e.g.
+after files were changed by other tools:
+
+    python -m s3contents.reconcile --config=jupyter_server_config.py [path]
+"""
+
+from traitlets.config import Application
+
+from s3contents.ipycompat import Unicode, default, import_item
+
+
+class ReconcileManifestsApp(Application):
+    name = "s3contents-reconcile"
+    description = "Rebuild the s3contents directory manifests from a real listing"
+
+    config_file = Unicode(
+        "", help="Jupyter config file with the contents manager configuration"
+    ).tag(config=True)
+    contents_manager_class = Unicode(
+        "s3contents.S3ContentsManager", help="Contents manager to reconcile"
+    ).tag(config=True)
+
+    @default("log_level")
+    def _log_level_default(self):
+        return "INFO"
+
+    aliases = {
+        "config": "ReconcileManifestsApp.config_file",
+        "contents-manager-class": "ReconcileManifestsApp.contents_manager_class",
+        "log-level": "Application.log_level",
+    }
+
+    def initialize(self, argv=None):
+        super(ReconcileManifestsApp, self).initialize(argv)
+        if self.config_file:
+            self.load_config_file(self.config_file)
+            # Command line options take precedence over the config file
+            self.update_config(self.cli_config)
+
+    def start(self):
+        path = self.extra_args[0] if self.extra_args else ""
+        contents_manager = import_item(self.contents_manager_class)(parent=self)
+        if not hasattr(contents_manager.fs, "reconcile_manifests"):
+            self.log.error("%s doesn't use manifests", self.contents_manager_class)
+            self.exit(1)
+        count = contents_manager.fs.reconcile_manifests(path)
+        self.log.info("Rebuilt %s manifests under `%s`", count, path or "/")
+
+
+def main(argv=None):
+    app = ReconcileManifestsApp()
+    app.initialize(argv)
+    app.start()
+
+
+if __name__ == "__main__":
+    main()
@@ -2,19 +2,38 @@
 Utilities to make S3 look like a regular file system
 """
 
+import asyncio
 import base64
 import datetime
+import hashlib
+import json
 import os
 import re
 import sys
 
+import botocore
+import botocore.session
 import s3fs
 from botocore.exceptions import ClientError
+from fsspec.asyn import sync
+from s3fs.errors import translate_boto_error
 from tornado.web import HTTPError
 from traitlets import Any
 
-from s3contents.genericfs import GenericFS, NoSuchFile
-from s3contents.ipycompat import Bool, Unicode
+from s3contents import clients, compression, manifest
+from s3contents.bulk import BulkResult, batched, run_bounded
+from s3contents.cache import LRUCache
+from s3contents.genericfs import (
+    HASH_CHUNK_SIZE,
+    HASH_METADATA,
+    BulkOperationError,
+    GenericFS,
+    GenericFSError,
+    NoSuchFile,
+    notify_request,
+    on_fs_loop,
+)
+from s3contents.ipycompat import Bool, Float, Integer, TraitError, Unicode, validate
 
 SAMPLE_ACCESS_POLICY = """
 {{
@@ -29,6 +48,25 @@ SAMPLE_ACCESS_POLICY = """
 }}
 """
 
+UPLOAD_STATE_FILE = "state.json"
+# Maximum number of keys in one DeleteObjects request
+DELETE_OBJECTS_BATCH_SIZE = 1000
+MANIFEST_FILE = "manifest.json"
+# Attempts to update a manifest changed concurrently before dropping it
+MANIFEST_UPDATE_ATTEMPTS = 5
+
+
+def supports_conditional_writes():
+    """Can botocore send If-Match and If-None-Match with a PutObject? s3fs drops
+    the arguments botocore doesn't know instead of failing"""
+    service_model = botocore.session.get_session().get_service_model("s3")
+    members = service_model.operation_model("PutObject").input_shape.members
+    return "IfMatch" in members and "IfNoneMatch" in members
+
+
+def _notify_request(model, **kwargs):
+    notify_request(model.name)
+
 
 class S3FS(GenericFS):
     access_key_id = Unicode(
@@ -79,6 +117,43 @@ class S3FS(GenericFS):
         help="optional dictionary to be appended to s3fs config kwargs"
     ).tag(config=True)
 
+    multipart_part_size = Integer(
+        8 * 1024 * 1024,
+        help="Size of the multipart upload parts used for chunked uploads. "
+        "S3 requires at least 5MB.",
+    ).tag(config=True)
+    stale_upload_timeout = Integer(
+        3600, help="Seconds after which an unfinished chunked upload is aborted"
+    ).tag(config=True)
+    use_manifests = Bool(
+        False,
+        help="""Keep a manifest object per directory with the details of its
+        entries, so listing a directory is a single GET. Files changed by other
+        tools are not seen until the manifests are rebuilt with
+        `python -m s3contents.reconcile`.""",
+    ).tag(config=True)
+    compression = Unicode(
+        "",
+        help="""Compress the files written, "gzip" or "zstd" (requires zstandard).
+        Files that don't get smaller are stored as they are. Compressed and
+        uncompressed objects are read whatever the setting. Empty disables it.""",
+    ).tag(config=True)
+
+    max_pool_connections = Integer(
+        10,
+        help="""Maximum number of connections kept open to S3, shared by the
+        contents managers using the same client. Raise it up to bulk_concurrency
+        so directory operations don't wait for a connection.""",
+    ).tag(config=True)
+    keepalive_timeout = Float(
+        12, help="Seconds an idle connection to S3 is kept open for reuse"
+    ).tag(config=True)
+    prewarm_connections = Integer(
+        0,
+        help="""Connections to open when the contents manager starts, so the
+        first requests don't wait for TLS handshakes. 0 disables it.""",
+    ).tag(config=True)
+
     def __init__(self, log, **kwargs):
         super(S3FS, self).__init__(**kwargs)
         self.log = log
@@ -97,9 +172,13 @@ class S3FS(GenericFS):
 
         if self.s3fs_config_kwargs:
             self.must_be_dictionary(self.s3fs_config_kwargs)
-            config_kwargs = self.s3fs_config_kwargs
+            config_kwargs = dict(self.s3fs_config_kwargs)
         else:
             config_kwargs = {}
+        config_kwargs.setdefault("max_pool_connections", self.max_pool_connections)
+        connector_args = dict(config_kwargs.get("connector_args") or {})
+        connector_args.setdefault("keepalive_timeout", self.keepalive_timeout)
+        config_kwargs["connector_args"] = connector_args
 
         if self.signature_version:
             config_kwargs["signature_version"] = self.signature_version
@@ -113,7 +192,14 @@ class S3FS(GenericFS):
         if self.kms_key_id:
             s3_additional_kwargs["SSEKMSKeyId"] = self.kms_key_id
 
-        self.fs = s3fs.S3FileSystem(
+        # (Full path, ETag) -> stat of the listed objects that may be compressed
+        self.listed_stats = LRUCache(
+            maxsize=self.metadata_cache_maxsize if self.compression else 0
+        )
+
+        # Shared with the other instances using the same client settings
+        self.fs = clients.get_client(
+            s3fs.S3FileSystem,
             key=self.access_key_id,
             secret=self.secret_access_key,
             token=self.session_token,
@@ -123,91 +209,582 @@ class S3FS(GenericFS):
             session=self.boto3_session,
         )
 
-        self.init()
+        self.init_future = None
+        if self.lazy_init:
+            self.init_future = self.start_lazy_init(self._lazy_init())
+        else:
+            self.init()
+            if self.prewarm_connections:
+                self.prewarm(self.prewarm_connections)
+
+    @validate("compression")
+    def _validate_compression(self, proposal):
+        if proposal["value"]:
+            try:
+                compression.check_encoding(proposal["value"])
+            except ValueError as e:
+                raise TraitError(str(e)) from e
+        return proposal["value"]
+
+    @validate("use_manifests")
+    def _validate_use_manifests(self, proposal):
+        if proposal["value"] and not supports_conditional_writes():
+            raise TraitError(
+                "use_manifests requires conditional writes, botocore {} doesn't "
+                "support them: pip install 'botocore>=1.35.69'".format(
+                    botocore.__version__
+                )
+            )
+        return proposal["value"]
 
     def init(self):
         try:
             self.mkdir("")
             self.ls("")
             self.isdir("")
-        except ClientError as ex:
-            if "AccessDenied" in str(ex):
-                policy = SAMPLE_ACCESS_POLICY.format(
-                    bucket=os.path.join(self.bucket, self.prefix)
-                )
-                self.log.error(
-                    "AccessDenied error while creating initial S3 objects.\
-                    Create an IAM policy like:\n{policy}".format(policy=policy)
-                )
+        except (ClientError, PermissionError) as ex:
+            if isinstance(ex, PermissionError) or "AccessDenied" in str(ex):
+                self._log_access_denied()
                 sys.exit(1)
             else:
                 raise ex
 
+    async def _lazy_init(self):
+        """One HEAD of the root dir_keep_file, created if it's missing"""
+        try:
+            if await self._head_object(self.path(self.dir_keep_file)) is None:
+                await self._mkdir("")
+        except PermissionError:
+            self._log_access_denied()
+            raise
+        if self.prewarm_connections:
+            await self._prewarm(self.prewarm_connections)
+
+    def _log_access_denied(self):
+        policy = SAMPLE_ACCESS_POLICY.format(
+            bucket=os.path.join(self.bucket, self.prefix)
+        )
+        self.log.error(
+            "AccessDenied error while creating initial S3 objects.\
+            Create an IAM policy like:\n{policy}".format(policy=policy)
+        )
+
+    def prewarm(self, connections):
+        sync(self.fs.loop, self._prewarm, connections)
+
+    @on_fs_loop
+    async def _prewarm(self, connections):
+        """Fill the connection pool with `connections` concurrent HEAD requests
+        of the bucket"""
+        bucket, _, _ = self.fs.split_path(self.path())
+        requests = [
+            self.fs._call_s3("head_bucket", Bucket=bucket) for _ in range(connections)
+        ]
+        results = await asyncio.gather(*requests, return_exceptions=True)
+        errors = [result for result in results if isinstance(result, Exception)]
+        if errors:
+            self.log.warning(
+                "S3contents.S3FS: Couldn't open %s connections: %s",
+                len(errors),
+                errors[0],
+            )
+
+    def install_request_hook(self):
+        s3 = sync(self.fs.loop, self.fs.get_s3)
+        # Registered once per client thanks to the unique_id
+        s3.meta.events.register(
+            "before-call.s3", _notify_request, unique_id="s3contents-requests"
+        )
+
     #  GenericFS methods -------------------------------------------------------
+    # Implemented as coroutines running on the s3fs event loop, the blocking
+    # methods are thin wrappers used by the synchronous contents manager.
 
     def ls(self, path=""):
+        return sync(self.fs.loop, self._ls, path)
+
+    @on_fs_loop
+    async def _ls(self, path=""):
         path_ = self.path(path)
         self.log.debug("S3contents.S3FS.ls: Listing directory: `%s`", path_)
-        files = self.fs.ls(path_, refresh=True)
+        files = await self.fs._ls(path_, refresh=True)
         return self.remove_prefix(files)
 
+    def list_details(self, path):
+        return sync(self.fs.loop, self._list_details, path)
+
+    @on_fs_loop
+    async def _list_details(self, path):
+        path = path.strip(self.delimiter)
+        if not self.use_manifests:
+            return await self._list_entries(path)
+        entries, etag = await self._read_manifest(path)
+        if entries is not None:
+            self.log.debug("S3contents.S3FS: Listing from manifest: `%s`", path)
+            return self._entries_from_manifest(path, entries)
+        details = await self._list_entries(path)
+        # Another server may have built it in the meantime, which is fine
+        conditions = {"IfMatch": etag} if etag else {"IfNoneMatch": "*"}
+        await self._write_manifest(path, self._manifest_entries(details), **conditions)
+        return details
+
+    async def _list_entries(self, path):
+        """List the directory `path` with a LIST and a HEAD per subdirectory"""
+        bucket, key, _ = self.fs.split_path(self.path(path))
+        prefix = key + self.delimiter if key else ""
+        self.log.debug("S3contents.S3FS: Listing details: `%s`", prefix)
+        semaphore = asyncio.Semaphore(max(1, self.listing_concurrency))
+        entries, directories, files = [], [], []
+        try:
+            # The listing is consumed page by page, the metadata of the
+            # subdirectories is fetched while the next pages are listed
+            async for info in self.fs._iterdir(bucket, prefix=prefix):
+                child = self.remove_prefix(info["name"]).strip(self.delimiter)
+                if (
+                    child.rsplit(self.delimiter, 1)[-1] == self.dir_keep_file
+                    or child in (path, self.internal_dir)
+                ):
+                    continue
+                if info["type"] == "directory":
+                    directories.append(
+                        asyncio.ensure_future(self._directory_entry(child, semaphore))
+                    )
+                elif self._may_be_compressed(info):
+                    files.append(
+                        asyncio.ensure_future(
+                            self._compressed_file_entry(child, info, semaphore)
+                        )
+                    )
+                else:
+                    entries.append(self._file_entry(child, info))
+            entries.extend(await asyncio.gather(*directories, *files))
+        except BaseException as e:
+            for task in directories + files:
+                task.cancel()
+            if isinstance(e, ClientError):
+                raise translate_boto_error(e) from e
+            raise
+        return sorted(entries, key=lambda entry: entry["path"])
+
+    def _file_entry(self, path, info):
+        # Not cached: listings don't say if an object is compressed, whatever
+        # the compression setting, and the size of a compressed object is not
+        # the size of its content
+        response = {"LastModified": info["LastModified"], "ContentLength": info["size"]}
+        return dict(self._stat_from_response("file", response), path=path)
+
+    def _may_be_compressed(self, info):
+        """Can a listed object be compressed? The size of its content is then
+        only known from its metadata."""
+        # Empty objects and chunked uploads (multipart ETags) are not compressed
+        return (
+            bool(self.compression) and info["size"] > 0 and "-" not in info["ETag"]
+        )
+
+    async def _compressed_file_entry(self, path, info, semaphore):
+        """Entry of a listed object that may be compressed, with the size of its
+        content from a HEAD. The HEADs are cached by ETag, listing again only
+        makes them for the new and changed objects."""
+        path_ = self.path(path)
+        stat = self.listed_stats.get((path_, info["ETag"]))
+        if stat is None:
+            async with semaphore:
+                response = await self._head_object(path_)
+            if response is None:
+                # Deleted since it was listed
+                return self._file_entry(path, info)
+            stat = self._stat_from_response("file", response)
+            self.listed_stats.set((path_, response["ETag"]), stat)
+            self.metadata_cache.set(("stat", path_), stat)
+        return dict(stat, path=path)
+
+    async def _directory_entry(self, path, semaphore):
+        # Every prefix is listed, with or without a dir_keep_file, so the
+        # listing is the same whether skip_directory_mtimes is set or not
+        entry = {"path": path, "type": "directory", "ST_MTIME": None, "SIZE": 0}
+        if self.skip_directory_mtimes:
+            return entry
+        async with semaphore:
+            response = await self._head_object(self.path(path, self.dir_keep_file))
+        if response is None:
+            return entry
+        stat = self._stat_from_response("directory", response)
+        self.metadata_cache.set(("stat", self.path(path)), stat)
+        return dict(stat, path=path)
+
     def isfile(self, path):
+        return sync(self.fs.loop, self._isfile, path)
+
+    @on_fs_loop
+    async def _isfile(self, path):
         path_ = self.path(path)
         # FileNotFoundError handled by s3fs
-        is_file = self.fs.isfile(path_)
+        is_file = await self.cached_async(
+            "isfile", path_, lambda: self.fs._isfile(path_)
+        )
 
         self.log.debug("S3contents.S3FS: `%s` is a file: %s", path_, is_file)
         return is_file
 
     def isdir(self, path):
+        return sync(self.fs.loop, self._isdir, path)
+
+    @on_fs_loop
+    async def _isdir(self, path):
         path_ = self.path(path)
         # FileNotFoundError handled by s3fs
-        is_dir = self.fs.isdir(path_)
+        is_dir = await self.cached_async(
+            "isdir", path_, lambda: self._check_isdir(path)
+        )
 
         self.log.debug("S3contents.S3FS: `%s` is a directory: %s", path_, is_dir)
         return is_dir
 
+    async def _check_isdir(self, path):
+        # The manifest of the parent directory saves a LIST
+        stat = await self._manifest_stat(path) if self.use_manifests else None
+        if stat is not None:
+            return stat["type"] == "directory"
+        return await self.fs._isdir(self.path(path))
+
     def mv(self, old_path, new_path):
+        sync(self.fs.loop, self._mv, old_path, new_path)
+
+    @on_fs_loop
+    async def _mv(self, old_path, new_path):
         self.log.debug("S3contents.S3FS: Move file `%s` to `%s`", old_path, new_path)
-        self.cp(old_path, new_path)
-        self.rm(old_path)
+        await self._cp(old_path, new_path)
+        await self._rm(old_path)
 
     def cp(self, old_path, new_path):
+        sync(self.fs.loop, self._cp, old_path, new_path)
+
+    @on_fs_loop
+    async def _cp(self, old_path, new_path):
         old_path_, new_path_ = self.path(old_path), self.path(new_path)
         self.log.debug("S3contents.S3FS: Copying `%s` to `%s`", old_path_, new_path_)
 
-        if self.isdir(old_path):
-            old_dir_path, new_dir_path = old_path, new_path
-            for obj in self.ls(old_dir_path):
-                old_item_path = obj
-                new_item_path = old_item_path.replace(old_dir_path, new_dir_path, 1)
-                self.cp(old_item_path, new_item_path)
-            self.mkdir(new_path)  # Touch with dir_keep_file
-        elif self.isfile(old_path):
-            self.fs.copy(old_path_, new_path_)
+        if await self._isdir(old_path):
+            # One recursive listing and then concurrent server-side copies
+            self.fs.invalidate_cache(old_path_)
+            sources = await self.fs._find(old_path_)
+
+            async def copy(source):
+                await self.fs._cp_file(source, new_path_ + source[len(old_path_) :])
+
+            result = await run_bounded(
+                "copy", copy, sources, self.bulk_concurrency, self._log_progress
+            )
+            if self.use_manifests:
+                # Stale manifests of a directory previously at new_path
+                await self._drop_manifests(new_path)
+            await self._mkdir(new_path)  # Touch with dir_keep_file
+            self.fs.invalidate_cache(new_path_)
+            self.invalidate(new_path_)
+            if not result.ok:
+                raise BulkOperationError(result)
+        elif await self._isfile(old_path):
+            await self.fs._cp_file(old_path_, new_path_)
+            if self.use_manifests:
+                await self._manifest_add(new_path, await self._fetch_stat(new_path))
+        self.invalidate(new_path_)
 
     def rm(self, path):
+        sync(self.fs.loop, self._rm, path)
+
+    @on_fs_loop
+    async def _rm(self, path):
         path_ = self.path(path)
         self.log.debug("S3contents.S3FS: Removing: `%s`", path_)
-        if self.isfile(path):
+        if await self._isfile(path):
             self.log.debug("S3contents.S3FS: Removing file: `%s`", path_)
-            self.fs.rm(path_)
-        elif self.isdir(path):
+            await self.fs._rm(path_)
+        elif await self._isdir(path):
             self.log.debug("S3contents.S3FS: Removing directory: `%s`", path_)
-            self.fs.rm(path_ + self.delimiter, recursive=True)
-            # self.fs.rmdir(path_ + self.delimiter, recursive=True)
+            self.fs.invalidate_cache(path_)
+            result = await self._delete_objects(await self.fs._find(path_))
+            self.fs.invalidate_cache(path_)
+            self.invalidate(path_)
+            if not result.ok:
+                raise BulkOperationError(result)
+            if self.use_manifests:
+                await self._drop_manifests(path)
+        await self._manifest_remove(path)
+        self.invalidate(path_)
+
+    async def _delete_objects(self, paths_):
+        """Delete objects with batched DeleteObjects requests"""
+        result = BulkResult("delete", len(paths_))
+
+        async def delete_batch(batch):
+            bucket, _, _ = self.fs.split_path(batch[0])
+            response = await self.fs._call_s3(
+                "delete_objects",
+                Bucket=bucket,
+                Delete={
+                    "Objects": [{"Key": self.fs.split_path(p)[1]} for p in batch],
+                    "Quiet": True,
+                },
+            )
+            errors = response.get("Errors", [])
+            for error in errors:
+                key = bucket + self.delimiter + error["Key"]
+                result.failed.append((key, error.get("Message", error.get("Code"))))
+            result.succeeded += len(batch) - len(errors)
+            self._log_progress(result)
+
+        batches = batched(paths_, DELETE_OBJECTS_BATCH_SIZE)
+        batch_result = await run_bounded(
+            "delete", delete_batch, batches, self.bulk_concurrency
+        )
+        for batch, error in batch_result.failed:
+            result.failed.extend((p, error) for p in batch)
+        return result
+
+    def _log_progress(self, result):
+        if result.done == result.total or result.done % 1000 == 0:
+            self.log.info(
+                "S3contents.S3FS: %s: %s/%s objects done, %s failed",
+                result.operation,
+                result.done,
+                result.total,
+                len(result.failed),
+            )
 
     def mkdir(self, path):
+        sync(self.fs.loop, self._mkdir, path)
+
+    @on_fs_loop
+    async def _mkdir(self, path):
         path_ = self.path(path, self.dir_keep_file)
         self.log.debug("S3contents.S3FS: Making dir: `%s`", path_)
-        self.fs.touch(path_)
+        await self.fs._pipe_file(path_, b"")
+        self.invalidate(path_)
+        await self._manifest_add(path, self._new_stat("directory", 0))
 
     def read(self, path, format):
+        return sync(self.fs.loop, self._read, path, format)
+
+    @on_fs_loop
+    async def _read(self, path, format):
+        return (await self._read_with_stat(path, format))[:3]
+
+    def read_with_stat(self, path, format):
+        return sync(self.fs.loop, self._read_with_stat, path, format)
+
+    @on_fs_loop
+    async def _read_with_stat(self, path, format):
         path_ = self.path(path)
-        if not self.isfile(path):
+        try:
+            raw_content, stat = await self._get_content(path_)
+        except FileNotFoundError as e:
+            raise NoSuchFile(path_) from e
+        self.metadata_cache.set(("stat", path_), stat)
+        return self._decode(path_, raw_content, format) + (stat,)
+
+    async def _get_content(self, path_):
+        """GET the content and stat of an object.
+
+        When the object is in the content cache the GET is conditional on its
+        ETag and a 304 response means the cached content can be used.
+        """
+        cached = self.content_cache.get(path_) if self.content_cache else None
+        if cached is None:
+            raw_content, response = await self._get_content_object(path_)
+        else:
+            metadata, data = cached
+            try:
+                raw_content, response = await self._get_content_object(
+                    path_, IfNoneMatch=metadata["etag"]
+                )
+            except FileNotFoundError:
+                self.content_cache.pop(path_)
+                raise
+            except OSError as e:
+                if not self._is_not_modified(e):
+                    raise
+                self.log.debug("S3contents.S3FS: Content cache hit: `%s`", path_)
+                self.remember_content(path_, data, metadata["etag"])
+                st_time = datetime.datetime.fromisoformat(metadata["last_modified"])
+                return data, {"type": "file", "ST_MTIME": st_time, "SIZE": len(data)}
+        # The GET response has all the metadata we need, no need for a HEAD
+        stat = self._stat_from_response("file", response)
+        self.remember_content(path_, raw_content, response["ETag"])
+        if self.content_cache is not None:
+            metadata = {
+                "etag": response["ETag"],
+                "last_modified": stat["ST_MTIME"].isoformat(),
+            }
+            self.content_cache.set(path_, metadata, raw_content)
+        return raw_content, stat
+
+    @staticmethod
+    def _error_status(error):
+        """HTTP status code of an error translated by s3fs, if known"""
+        # s3fs translates the botocore ClientError to an OSError
+        cause = error.__cause__
+        if isinstance(cause, ClientError):
+            return cause.response["ResponseMetadata"]["HTTPStatusCode"]
+        return None
+
+    def _is_not_modified(self, error):
+        return self._error_status(error) == 304
+
+    def _is_precondition_failed(self, error):
+        return isinstance(error, FileExistsError) or self._error_status(error) == 412
+
+    def hash(self, path):
+        return sync(self.fs.loop, self._hash, path)
+
+    @on_fs_loop
+    async def _hash(self, path):
+        path_ = self.path(path)
+        response = await self._head_object(path_)
+        if response is None:
             raise NoSuchFile(path_)
-        with self.fs.open(path_, mode="rb") as f:
-            raw_content = f.read()
+        digest = response.get("Metadata", {}).get(HASH_METADATA)
+        if digest:
+            return digest
+        # Written by another tool or before the hashes were stored
+        self.log.debug("S3contents.S3FS: Hashing the content of `%s`", path_)
+        if self._content_encoding(response) is not None:
+            content, _ = await self._get_content(path_)
+            return hashlib.sha256(content).hexdigest()
+        bucket, key, _ = self.fs.split_path(path_)
+        response = await self.fs._call_s3(
+            "get_object", Bucket=bucket, Key=key, IfMatch=response["ETag"]
+        )
+        hash_ = hashlib.sha256()
+        try:
+            while True:
+                chunk = await response["Body"].read(HASH_CHUNK_SIZE)
+                if not chunk:
+                    break
+                hash_.update(chunk)
+        finally:
+            response["Body"].close()
+        return hash_.hexdigest()
+
+    def read_range(self, path, start, end):
+        return sync(self.fs.loop, self._read_range, path, start, end)
+
+    @on_fs_loop
+    async def _read_range(self, path, start, end):
+        path_ = self.path(path)
+        try:
+            response, is_range = await self._get_range(path_, start, end)
+            try:
+                data = await response["Body"].read()
+            finally:
+                response["Body"].close()
+        except FileNotFoundError as e:
+            raise NoSuchFile(path_) from e
+        if is_range:
+            return data
+        encoding = self._content_encoding(response)
+        if encoding is not None:
+            data = compression.decompress(data, encoding)
+        return data[start:end]
+
+    async def _get_range(self, path_, start, end):
+        """GET the bytes `start` to `end` (excluded) of the content of an object.
+
+        Returns the response and whether its body is that range. A range of a
+        compressed object is not a range of its content, the body is then the
+        whole object.
+        """
+        bucket, key, _ = self.fs.split_path(path_)
+        try:
+            response = await self.fs._call_s3(
+                "get_object",
+                Bucket=bucket,
+                Key=key,
+                Range="bytes={}-{}".format(start, end - 1),
+            )
+        except OSError as e:
+            # A range of the content can start past the end of the compressed
+            # object, which S3 doesn't satisfy
+            if self._error_status(e) != 416:
+                raise
+        else:
+            if self._content_encoding(response) is None:
+                return response, True
+            if self._is_whole_object(response):
+                return response, False
+            response["Body"].close()
+        response = await self.fs._call_s3("get_object", Bucket=bucket, Key=key)
+        return response, False
+
+    async def _read_chunks(self, path, start, end, chunk_size):
+        """Read the bytes `start` to `end` (excluded) of the content of `path` in
+        chunks of at most `chunk_size` bytes from a single GET. Compressed
+        objects are decompressed as they are read."""
+        if start >= end:
+            return
+        stream = await self._open_stream(path, start, end)
+        try:
+            while True:
+                chunk = await self._read_stream(stream, chunk_size)
+                if not chunk:
+                    return
+                yield chunk
+        finally:
+            await self._close_stream(stream)
+
+    @on_fs_loop
+    async def _open_stream(self, path, start, end):
+        path_ = self.path(path)
+        try:
+            response, is_range = await self._get_range(path_, start, end)
+        except FileNotFoundError as e:
+            raise NoSuchFile(path_) from e
+        encoding = self._content_encoding(response)
+        return {
+            "body": response["Body"],
+            "decompressor": encoding and compression.decompressor(encoding),
+            # Content bytes to skip and to read
+            "skip": 0 if is_range else start,
+            "remaining": end - start,
+            "buffer": b"",
+            "eof": False,
+        }
+
+    @on_fs_loop
+    async def _read_stream(self, stream, size):
+        size = min(size, stream["remaining"])
+        while len(stream["buffer"]) < size and not stream["eof"]:
+            data = await stream["body"].read(size)
+            stream["eof"] = not data
+            if data and stream["decompressor"] is not None:
+                data = stream["decompressor"].decompress(data)
+            skipped = min(stream["skip"], len(data))
+            stream["skip"] -= skipped
+            stream["buffer"] += data[skipped:]
+        chunk, stream["buffer"] = stream["buffer"][:size], stream["buffer"][size:]
+        stream["remaining"] -= len(chunk)
+        return chunk
+
+    @on_fs_loop
+    async def _close_stream(self, stream):
+        stream["body"].close()
+
+    @staticmethod
+    def _is_whole_object(response):
+        """Is the body of a ranged GET response the whole object?"""
+        # e.g. "bytes 0-99/100", missing if the object is empty
+        match = re.match(r"^bytes 0-(\d+)/(\d+)$", response.get("ContentRange", ""))
+        if match is None:
+            return "ContentRange" not in response
+        return int(match.group(1)) + 1 == int(match.group(2))
+
+    def presign(self, path, expiration):
+        return sync(self.fs.loop, self._presign, path, expiration)
+
+    @on_fs_loop
+    async def _presign(self, path, expiration):
+        return await self.fs._url(self.path(path), expires=expiration)
+
+    def _decode(self, path_, raw_content, format):
         # format is not base64-encoded. "json" is requested by jupyter collaboration.
         if format is None or format in ["text", "json"]:
             # Try to interpret as unicode if format is unknown or if unicode
@@ -218,26 +795,76 @@ class S3FS(GenericFS):
                 if format == "text":
                     err = "{} is not UTF-8 encoded".format(path_)
                     self.log.error(err)
-                    raise HTTPError(400, err, reason="bad format")
+                    raise HTTPError(400, err, reason="bad format") from None
         return base64.b64encode(raw_content).decode("ascii"), "base64", raw_content
 
     def lstat(self, path):
+        stat = self.stat(path)
+        return {"ST_MTIME": stat["ST_MTIME"], "SIZE": stat["SIZE"]}
+
+    def stat(self, path):
+        return sync(self.fs.loop, self._stat, path)
+
+    @on_fs_loop
+    async def _stat(self, path):
         path_ = self.path(path)
+        stat = await self.cached_async("stat", path_, lambda: self._fetch_stat(path))
+        self.log.debug("S3contents.S3FS: stat `%s`: %s", path_, stat)
+        return stat
 
-        if self.fs.isdir(path_):
-            # Try to get status of the dir_keep_file
-            path_ = self.path(path, self.dir_keep_file)
+    async def _fetch_stat(self, path):
+        path_ = self.path(path)
+        _, key, _ = self.fs.split_path(path_)
+        if key:
+            response = await self._head_object(path_)
+            if response is not None:
+                return self._stat_from_response("file", response)
+        # Try to get status of the dir_keep_file
+        response = await self._head_object(self.path(path, self.dir_keep_file))
+        if response is not None:
+            return self._stat_from_response("directory", response)
+        # A directory without a dir_keep_file, e.g. created by another tool
+        self.fs.invalidate_cache(path_)
+        if await self.fs._isdir(path_):
+            return {"type": "directory", "ST_MTIME": None, "SIZE": 0}
+        return {"type": None, "ST_MTIME": None, "SIZE": 0}
 
-        st_time = None
-        size = 0
+    async def _head_object(self, path_):
+        bucket, key, _ = self.fs.split_path(path_)
         try:
-            self.fs.invalidate_cache(path_)
-            info = self.fs.info(path_)
-            st_time = info["LastModified"]
-            size = info.get("size", 0)
+            return await self.fs._call_s3(
+                "head_object", self.fs.kwargs, Bucket=bucket, Key=key
+            )
         except FileNotFoundError:
-            return {"ST_MTIME": None, "SIZE": 0}
+            return None
+
+    async def _get_content_object(self, path_, **kwargs):
+        """GET an object and return its decompressed content"""
+        data, response = await self._get_object(path_, **kwargs)
+        encoding = self._content_encoding(response)
+        if encoding is not None:
+            data = compression.decompress(data, encoding)
+        return data, response
+
+    @staticmethod
+    def _content_encoding(response):
+        """Compression of an object, None if it's not compressed by us"""
+        encoding = response.get("ContentEncoding")
+        return encoding if encoding in compression.ENCODINGS else None
+
+    async def _get_object(self, path_, **kwargs):
+        bucket, key, _ = self.fs.split_path(path_)
+        response = await self.fs._call_s3(
+            "get_object", Bucket=bucket, Key=key, **kwargs
+        )
+        try:
+            return await response["Body"].read(), response
+        finally:
+            response["Body"].close()
 
+    @staticmethod
+    def _stat_from_response(type_, response):
+        st_time = response["LastModified"]
         # Remove the microsend information to match Jupyter base tests
         st_time = datetime.datetime(
             st_time.year,
@@ -248,11 +875,78 @@ class S3FS(GenericFS):
             st_time.second,
             tzinfo=st_time.tzinfo,
         )
-        return {"ST_MTIME": st_time, "SIZE": size}
+        # The size of the content of compressed objects is in their metadata
+        metadata = response.get("Metadata", {})
+        size = metadata.get(compression.SIZE_METADATA)
+        stat = {
+            "type": type_,
+            "ST_MTIME": st_time,
+            "SIZE": int(size) if size else response.get("ContentLength", 0),
+        }
+        if metadata.get(HASH_METADATA):
+            stat["SHA256"] = metadata[HASH_METADATA]
+        return stat
+
+    @staticmethod
+    def _new_stat(type_, size):
+        """Stat of an object just written, without asking S3 for it"""
+        st_time = datetime.datetime.now(datetime.timezone.utc).replace(microsecond=0)
+        return {"type": type_, "ST_MTIME": st_time, "SIZE": size}
 
     def write(self, path, content, format):
+        sync(self.fs.loop, self._write, path, content, format)
+
+    @on_fs_loop
+    async def _write(self, path, content, format):
         path_ = self.path(self.remove_prefix(path))
         self.log.debug("S3contents.S3FS: Writing file: `%s`", path_)
+        content_ = self._encode(path_, content, format)
+        await self._put_content(path_, content_)
+
+    async def _put_content(self, path_, content_):
+        if await self._is_unchanged(path_, content_):
+            self.log.debug("S3contents.S3FS: Skipping unchanged write: `%s`", path_)
+            return
+        body, kwargs = self._compress(content_)
+        digest = hashlib.sha256(content_).hexdigest()
+        # Answers require_hash without downloading the object
+        kwargs.setdefault("Metadata", {})[HASH_METADATA] = digest
+        response = await self.fs._pipe_file(path_, body, **kwargs)
+        self.invalidate(path_)
+        # Multipart uploads of very large files return no response
+        self.remember_content(path_, content_, (response or {}).get("ETag"))
+        await self._manifest_add(
+            self.remove_prefix(path_), self._new_stat("file", len(content_))
+        )
+
+    def _compress(self, content_):
+        """Body and PutObject arguments of an object holding `content_`"""
+        if not self.compression:
+            return content_, {}
+        body = compression.compress(content_, self.compression)
+        if len(body) >= len(content_):
+            return content_, {}
+        metadata = {compression.SIZE_METADATA: str(len(content_))}
+        return body, {"ContentEncoding": self.compression, "Metadata": metadata}
+
+    async def _is_unchanged(self, path_, content_):
+        """Is `content_` what the object at `path_` already holds?
+
+        The hash of the content is compared with the last one read or written
+        and a HEAD checks the object wasn't changed since by someone else.
+        """
+        etag = self.known_etag(path_, content_)
+        if etag is None:
+            return False
+        response = await self._head_object(path_)
+        if response is None or response["ETag"] != etag:
+            return False
+        self.metadata_cache.set(
+            ("stat", path_), self._stat_from_response("file", response)
+        )
+        return True
+
+    def _encode(self, path_, content, format):
         if format not in {"text", "base64"}:
             raise HTTPError(
                 400,
@@ -260,20 +954,318 @@ class S3FS(GenericFS):
             )
         try:
             if format == "text":
-                content_ = content.encode("utf8")
+                return content.encode("utf8")
             else:
                 b64_bytes = content.encode("ascii")
-                content_ = base64.b64decode(b64_bytes)
+                return base64.b64decode(b64_bytes)
         except Exception as e:
-            raise HTTPError(400, "Encoding error saving %s: %s" % (path_, e))
-        with self.fs.open(path_, mode="wb") as f:
-            f.write(content_)
+            raise HTTPError(
+                400, "Encoding error saving %s: %s" % (path_, e)
+            ) from e
 
     def writenotebook(self, path, content):
+        sync(self.fs.loop, self._writenotebook, path, content)
+
+    @on_fs_loop
+    async def _writenotebook(self, path, content):
         path_ = self.path(self.remove_prefix(path))
         self.log.debug("S3contents.S3FS: Writing notebook: `%s`", path_)
-        with self.fs.open(path_, mode="wb") as f:
-            f.write(content.encode("utf-8"))
+        await self._put_content(path_, content.encode("utf-8"))
+
+    #  Chunked uploads ---------------------------------------------------------
+    # Chunks are streamed into an S3 multipart upload. The upload id, the parts
+    # uploaded so far and the chunks not yet big enough to make a part are kept
+    # in the bucket so any server replica can receive the next chunk and the
+    # memory used is bounded by multipart_part_size.
+
+    def write_chunk(self, path, chunk, content, format):
+        sync(self.fs.loop, self._write_chunk, path, chunk, content, format)
+
+    @on_fs_loop
+    async def _write_chunk(self, path, chunk, content, format):
+        path_ = self.path(self.remove_prefix(path))
+        self.log.debug("S3contents.S3FS: Writing chunk %s of: `%s`", chunk, path_)
+        data = self._encode(path_, content, format)
+        bucket, key, _ = self.fs.split_path(path_)
+        upload_dir = self.upload_dir(path_)
+
+        if chunk == 1:
+            await self._prune_stale_uploads()
+            # Leftovers of a previous attempt to upload the same file
+            await self._abort_upload(upload_dir)
+            response = await self.fs._call_s3(
+                "create_multipart_upload", Bucket=bucket, Key=key
+            )
+            state = {
+                "path": path_,
+                "upload_id": response["UploadId"],
+                "parts": [],
+                "pending": [],
+            }
+        else:
+            state = await self._read_upload_state(upload_dir)
+            if state is None and chunk == -1:
+                # The whole file came in a single chunk
+                metadata = {HASH_METADATA: hashlib.sha256(data).hexdigest()}
+                await self.fs._pipe_file(path_, data, Metadata=metadata)
+                self.invalidate(path_)
+                await self._manifest_add(
+                    self.remove_prefix(path_), self._new_stat("file", len(data))
+                )
+                return
+            if state is None:
+                raise GenericFSError(
+                    "No chunked upload in progress for: {}".format(path_)
+                )
+
+        pending_size = sum(p["size"] for p in state["pending"]) + len(data)
+        if chunk == -1 or pending_size >= self.multipart_part_size:
+            pending_paths = [p["path"] for p in state["pending"]]
+            pending = [await self.fs._cat_file(p) for p in pending_paths]
+            part_number = len(state["parts"]) + 1
+            response = await self.fs._call_s3(
+                "upload_part",
+                Bucket=bucket,
+                Key=key,
+                UploadId=state["upload_id"],
+                PartNumber=part_number,
+                Body=b"".join(pending + [data]),
+            )
+            state["parts"].append({"PartNumber": part_number, "ETag": response["ETag"]})
+            state["pending"] = []
+            if pending_paths:
+                await self.fs._rm(pending_paths)
+        else:
+            pending_path = "{}/chunk-{:06d}".format(upload_dir, chunk)
+            await self.fs._pipe_file(pending_path, data)
+            state["pending"].append({"path": pending_path, "size": len(data)})
+
+        state_path = upload_dir + self.delimiter + UPLOAD_STATE_FILE
+        if chunk == -1:
+            await self.fs._call_s3(
+                "complete_multipart_upload",
+                Bucket=bucket,
+                Key=key,
+                UploadId=state["upload_id"],
+                MultipartUpload={"Parts": state["parts"]},
+            )
+            await self.fs._rm(state_path)
+            self.fs.invalidate_cache(path_)
+            self.invalidate(path_)
+            if self.use_manifests:
+                path = self.remove_prefix(path_)
+                await self._manifest_add(path, await self._fetch_stat(path))
+        else:
+            await self.fs._pipe_file(state_path, json.dumps(state).encode("utf-8"))
+
+    def upload_dir(self, path_):
+        """Directory where the state of the chunked upload of `path_` is kept"""
+        upload_id = hashlib.sha256(path_.encode("utf-8")).hexdigest()
+        return self.path(self.internal_dir, "uploads", upload_id)
+
+    async def _read_upload_state(self, upload_dir):
+        state_path = upload_dir + self.delimiter + UPLOAD_STATE_FILE
+        try:
+            return json.loads(await self.fs._cat_file(state_path))
+        except FileNotFoundError:
+            return None
+
+    async def _abort_upload(self, upload_dir):
+        state = await self._read_upload_state(upload_dir)
+        if state is None:
+            return
+        self.log.debug("S3contents.S3FS: Aborting upload of: `%s`", state["path"])
+        bucket, key, _ = self.fs.split_path(state["path"])
+        try:
+            await self.fs._call_s3(
+                "abort_multipart_upload",
+                Bucket=bucket,
+                Key=key,
+                UploadId=state["upload_id"],
+            )
+        except FileNotFoundError:
+            # The upload was already completed or aborted
+            pass
+        pending_paths = [p["path"] for p in state["pending"]]
+        state_path = upload_dir + self.delimiter + UPLOAD_STATE_FILE
+        await self.fs._rm(pending_paths + [state_path])
+
+    async def _prune_stale_uploads(self):
+        """Abort the uploads that didn't get a chunk in `stale_upload_timeout`
+        seconds"""
+        uploads_dir = self.path(self.internal_dir, "uploads")
+        self.fs.invalidate_cache(uploads_dir)
+        try:
+            found = await self.fs._find(uploads_dir, detail=True)
+        except FileNotFoundError:
+            return
+        now = datetime.datetime.now(datetime.timezone.utc)
+        for state_path, info in found.items():
+            if not state_path.endswith(self.delimiter + UPLOAD_STATE_FILE):
+                continue
+            age = now - info["LastModified"]
+            if age.total_seconds() > self.stale_upload_timeout:
+                await self._abort_upload(state_path.rsplit(self.delimiter, 1)[0])
+
+    #  Directory manifests -----------------------------------------------------
+    # With use_manifests each directory has a manifest object under
+    # internal_dir with the stat of its entries. Manifests are built from a
+    # real listing the first time a directory is listed and then updated with
+    # conditional writes, so concurrent updates from several servers are
+    # retried instead of lost.
+
+    def manifest_path(self, path):
+        """Full path of the manifest of the directory `path`"""
+        return self.path(
+            self.internal_dir, "manifests", path.strip(self.delimiter), MANIFEST_FILE
+        )
+
+    def reconcile_manifests(self, path=""):
+        return sync(self.fs.loop, self._reconcile_manifests, path)
+
+    @on_fs_loop
+    async def _reconcile_manifests(self, path=""):
+        """Rebuild the manifests of `path` and its subdirectories from real
+        listings and delete the manifests of directories that don't exist.
+
+        Returns the number of manifests written.
+        """
+        path = path.strip(self.delimiter)
+        semaphore = asyncio.Semaphore(max(1, self.listing_concurrency))
+        rebuilt = set()
+
+        async def rebuild(path):
+            async with semaphore:
+                details = await self._list_entries(path)
+                await self._write_manifest(path, self._manifest_entries(details))
+            rebuilt.add(self.manifest_path(path))
+            await asyncio.gather(
+                *(rebuild(d["path"]) for d in details if d["type"] == "directory")
+            )
+
+        await rebuild(path)
+        manifests_dir = self.path(self.internal_dir, "manifests", path)
+        self.fs.invalidate_cache(manifests_dir)
+        orphans = [p for p in await self.fs._find(manifests_dir) if p not in rebuilt]
+        if orphans:
+            self.log.info("S3contents.S3FS: Deleting %s orphan manifests", len(orphans))
+            await self._delete_objects(orphans)
+        return len(rebuilt)
+
+    async def _read_manifest(self, path):
+        """Return the entries and ETag of the manifest of the directory `path`.
+
+        The entries are None when there's no valid manifest.
+        """
+        try:
+            raw, response = await self._get_object(self.manifest_path(path))
+        except FileNotFoundError:
+            return None, None
+        return manifest.loads(raw), response["ETag"]
+
+    async def _write_manifest(self, path, entries, **conditions):
+        """Write the manifest of the directory `path`.
+
+        `conditions` are IfMatch/IfNoneMatch arguments of the PUT, returns False
+        when they don't hold.
+        """
+        bucket, key, _ = self.fs.split_path(self.manifest_path(path))
+        try:
+            await self.fs._call_s3(
+                "put_object",
+                Bucket=bucket,
+                Key=key,
+                Body=manifest.dumps(entries),
+                ContentType="application/json",
+                **conditions,
+            )
+        except OSError as e:
+            if not self._is_precondition_failed(e):
+                raise
+            self.log.debug("S3contents.S3FS: Manifest changed: `%s`", path)
+            return False
+        return True
+
+    async def _update_manifest(self, path, mutate):
+        """Apply `mutate` to the entries of the manifest of the directory `path`"""
+        for _ in range(MANIFEST_UPDATE_ATTEMPTS):
+            entries, etag = await self._read_manifest(path)
+            if entries is None:
+                # Built from a real listing when the directory is next listed
+                break
+            before = dict(entries)
+            mutate(entries)
+            if entries == before:
+                return
+            try:
+                if await self._write_manifest(path, entries, IfMatch=etag):
+                    return
+            except FileNotFoundError:
+                return
+        else:
+            self.log.warning(
+                "S3contents.S3FS: Too many concurrent updates of the manifest of `%s`",
+                path,
+            )
+        if etag is not None:
+            await self.fs._rm(self.manifest_path(path))
+
+    async def _manifest_add(self, path, stat):
+        parent, name = self._split_parent(path)
+        if not self.use_manifests or not name or self._is_internal(parent):
+            return
+        entry = {
+            "type": stat["type"],
+            "ST_MTIME": stat["ST_MTIME"],
+            "SIZE": stat["SIZE"],
+        }
+        await self._update_manifest(
+            parent, lambda entries: entries.update({name: entry})
+        )
+
+    async def _manifest_remove(self, path):
+        parent, name = self._split_parent(path)
+        if not self.use_manifests or not name or self._is_internal(parent):
+            return
+        await self._update_manifest(parent, lambda entries: entries.pop(name, None))
+
+    def _is_internal(self, path):
+        """Is `path` in internal_dir, never listed so without manifests"""
+        return path.split(self.delimiter, 1)[0] == self.internal_dir
+
+    async def _manifest_stat(self, path):
+        """Stat of `path` in the manifest of its parent directory, if there"""
+        parent, name = self._split_parent(path)
+        if not name:
+            return None
+        entries, _ = await self._read_manifest(parent)
+        return (entries or {}).get(name)
+
+    async def _drop_manifests(self, path):
+        """Delete the manifests of the directory `path` and its subdirectories"""
+        manifests_dir = self.path(self.internal_dir, "manifests", path)
+        self.fs.invalidate_cache(manifests_dir)
+        paths_ = await self.fs._find(manifests_dir)
+        if paths_:
+            await self._delete_objects(paths_)
+
+    def _entries_from_manifest(self, path, entries):
+        details = []
+        for name, stat in sorted(entries.items()):
+            child = path + self.delimiter + name if path else name
+            self.metadata_cache.set(("stat", self.path(child)), stat)
+            details.append(dict(stat, path=child))
+        return details
+
+    def _manifest_entries(self, details):
+        return {self._split_parent(d["path"])[1]: d for d in details}
+
+    def _split_parent(self, path):
+        """Split `path` into its parent directory and name"""
+        path = path.strip(self.delimiter)
+        if self.delimiter in path:
+            return tuple(path.rsplit(self.delimiter, 1))
+        return "", path
 
     #  Utilities ---------------------------------------------------------------
 
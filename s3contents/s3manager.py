@@ -1,10 +1,9 @@
-import json
 from urllib.parse import urlparse
 
 from traitlets import Any
 
 from s3contents.genericmanager import GenericContentsManager, from_dict
-from s3contents.ipycompat import Bool, Unicode
+from s3contents.ipycompat import Bool, Float, Integer, Unicode
 from s3contents.s3_fs import S3FS
 
 
@@ -73,6 +72,40 @@ class S3ContentsManager(GenericContentsManager):
         help="optional dictionary to be appended to s3fs config kwargs"
     ).tag(config=True)
 
+    multipart_part_size = Integer(
+        8 * 1024 * 1024,
+        help="Size of the multipart upload parts used for chunked uploads. "
+        "S3 requires at least 5MB.",
+    ).tag(config=True)
+    use_manifests = Bool(
+        False,
+        help="""Keep a manifest object per directory with the details of its
+        entries, so listing a directory is a single GET. Files changed by other
+        tools are not seen until the manifests are rebuilt with
+        `python -m s3contents.reconcile`.""",
+    ).tag(config=True)
+    compression = Unicode(
+        "",
+        help="""Compress the notebooks and files saved, "gzip" or "zstd" (requires
+        zstandard). Compressed and uncompressed objects are read whatever the
+        setting. Empty disables it.""",
+    ).tag(config=True)
+    max_pool_connections = Integer(
+        10,
+        help="""Maximum number of connections kept open to S3, shared by the
+        contents managers with the same endpoint, credentials and client
+        settings. Raise it up to bulk_concurrency so directory operations don't
+        wait for a connection.""",
+    ).tag(config=True)
+    keepalive_timeout = Float(
+        12, help="Seconds an idle connection to S3 is kept open for reuse"
+    ).tag(config=True)
+    prewarm_connections = Integer(
+        0,
+        help="""Connections to open when the server starts, so the first
+        requests don't wait for TLS handshakes. 0 disables it.""",
+    ).tag(config=True)
+
     def __init__(self, *args, **kwargs):
         super(S3ContentsManager, self).__init__(*args, **kwargs)
 
@@ -97,7 +130,24 @@ class S3ContentsManager(GenericContentsManager):
             sse=self.sse,
             s3fs_additional_kwargs=self.s3fs_additional_kwargs,
             s3fs_config_kwargs=self.s3fs_config_kwargs,
+            metadata_cache_ttl=self.metadata_cache_ttl,
+            metadata_cache_maxsize=self.metadata_cache_maxsize,
+            bulk_concurrency=self.bulk_concurrency,
+            content_cache_dir=self.content_cache_dir,
+            content_cache_max_bytes=self.content_cache_max_bytes,
+            skip_unchanged_writes=self.skip_unchanged_writes,
+            listing_concurrency=self.listing_concurrency,
+            skip_directory_mtimes=self.skip_directory_mtimes,
+            lazy_init=self.lazy_init,
+            multipart_part_size=self.multipart_part_size,
+            use_manifests=self.use_manifests,
+            compression=self.compression,
+            max_pool_connections=self.max_pool_connections,
+            keepalive_timeout=self.keepalive_timeout,
+            prewarm_connections=self.prewarm_connections,
         )
+        self.init_metrics()
+        self.init_journal()
 
     def run_init_s3_hook(self):
         if self.init_s3_hook is not None:
@@ -107,8 +157,9 @@ class S3ContentsManager(GenericContentsManager):
         nb_contents = from_dict(model["content"])
         self.check_and_sign(nb_contents, path)
 
-        file_contents = json.dumps(model["content"])
-        self.fs.writenotebook(path, file_contents)
+        file_contents = self._notebook_to_store(model["content"])
+        if not self._write_behind(path, file_contents, "text"):
+            self.fs.writenotebook(path, file_contents)
         self.validate_notebook_model(model)
 
         return model.get("message")
@@ -0,0 +1,76 @@
+"""
+Serializers of the notebooks stored in the bucket.
+
+A serializer turns the notebook dictionaries into the JSON text stored and
+back. The notebooks read are converted to the current nbformat version but
+not validated here, `validate_notebook_model` validates the model once.
+"""
+
+import json
+
+from nbformat import convert, versions
+from nbformat.reader import get_version
+
+from s3contents.ipycompat import import_item
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class JSONSerializer:
+    """The standard library `json`"""
+
+    def dumps(self, nb):
+        return json.dumps(nb)
+
+    def loads(self, file_content):
+        return json.loads(file_content)
+
+
+class OrjsonSerializer:
+    """orjson, faster than `json` on large notebooks"""
+
+    def __init__(self):
+        if orjson is None:
+            raise ValueError(
+                "The orjson serializer requires orjson: pip install orjson"
+            )
+
+    def dumps(self, nb):
+        return orjson.dumps(nb).decode("utf-8")
+
+    def loads(self, file_content):
+        return orjson.loads(file_content)
+
+
+SERIALIZERS = {"json": JSONSerializer, "orjson": OrjsonSerializer}
+
+
+def get_serializer(name):
+    """Return the serializer `name`, one of SERIALIZERS or the import path of a
+    class with `dumps(nb) -> str` and `loads(file_content) -> dict` methods.
+    Raises ValueError if it can't be used."""
+    if name in SERIALIZERS:
+        return SERIALIZERS[name]()
+    if "." not in name:
+        raise ValueError(
+            "Unknown serializer {!r}, use one of: {} or the import path of a "
+            "class".format(name, ", ".join(SERIALIZERS))
+        )
+    try:
+        return import_item(name)()
+    except ImportError as e:
+        raise ValueError(
+            "Can't import the serializer {!r}: {}".format(name, e)
+        ) from e
+
+
+def to_notebook(nb_dict, as_version):
+    """NotebookNode of a notebook dictionary read, converted to `as_version`"""
+    major, minor = get_version(nb_dict)
+    if major not in versions:
+        raise ValueError("Unsupported nbformat version {}".format(major))
+    nb = versions[major].to_notebook_json(nb_dict, minor=minor)
+    return convert(nb, as_version)
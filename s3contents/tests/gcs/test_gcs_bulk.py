@@ -0,0 +1,80 @@
+import uuid
+
+import pytest
+from tornado.web import HTTPError
+
+from s3contents.tests.utils import make_gcs_contents_manager
+
+pytestmark = [pytest.mark.gcs]
+
+
+@pytest.fixture
+def contents_manager():
+    cm = make_gcs_contents_manager(prefix=uuid.uuid4().hex)
+    cm.new(model={"type": "directory"}, path="d")
+    cm.new(model={"type": "directory"}, path="d/sub")
+    for i in range(5):
+        cm.save({"type": "file", "format": "text", "content": "x"}, "d/%d.txt" % i)
+    yield cm
+    cm.fs.fs.rm(cm.fs.path(""), recursive=True)
+
+
+def names(cm, path):
+    return sorted(m["name"] for m in cm.get(path)["content"])
+
+
+def test_copy_and_delete_tree(contents_manager):
+    cm = contents_manager
+    cm.rename_file("d", "e")
+    assert not cm.dir_exists("d")
+    assert names(cm, "e") == ["%d.txt" % i for i in range(5)] + ["sub"]
+    assert cm.dir_exists("e/sub")
+
+    cm.delete_file("e")
+    assert not cm.dir_exists("e")
+    assert cm.fs.fs.find(cm.fs.path("e")) == []
+
+
+def test_batch_delete_results_match_their_paths(contents_manager, monkeypatch):
+    cm = contents_manager
+    gone, locked = cm.fs.path("d/1.txt"), cm.fs.path("d/3.txt")
+    rm_file = cm.fs.fs._rm_file
+
+    async def rm_files(paths):
+        # Like a GCS batch, the errors come after the deleted paths and don't
+        # say which object they are about
+        for path in paths:
+            if path != locked:
+                await rm_file(path)
+        deleted = [path for path in paths if path not in (gone, locked)]
+        return deleted + [OSError("403 Forbidden"), OSError("503 Backend Error")]
+
+    async def rm_one_file(path, **kwargs):
+        if path == locked:
+            raise PermissionError("403 Forbidden")
+        return await rm_file(path, **kwargs)
+
+    # Emulators don't support batch requests
+    monkeypatch.setattr(type(cm.fs.fs), "on_google", True)
+    monkeypatch.setattr(cm.fs.fs, "_rm_files", rm_files)
+    monkeypatch.setattr(cm.fs.fs, "_rm_file", rm_one_file)
+    with pytest.raises(HTTPError, match="Delete failed for 1 of 7 objects"):
+        cm.delete_file("d")
+    monkeypatch.undo()
+    assert cm.fs.fs.find(cm.fs.path("d")) == [locked]
+
+
+def test_rename_keeps_source_on_copy_failure(contents_manager, monkeypatch):
+    cm = contents_manager
+    cp_file = cm.fs.fs._cp_file
+
+    async def fail_one_copy(source, destination, **kwargs):
+        if source.endswith("/3.txt"):
+            raise PermissionError("403 Forbidden")
+        return await cp_file(source, destination, **kwargs)
+
+    monkeypatch.setattr(cm.fs.fs, "_cp_file", fail_one_copy)
+    with pytest.raises(HTTPError, match="Copy failed for 1 of 7 objects"):
+        cm.rename_file("d", "e")
+    monkeypatch.undo()
+    assert names(cm, "d") == ["%d.txt" % i for i in range(5)] + ["sub"]
@@ -0,0 +1,43 @@
+import uuid
+
+import pytest
+
+from s3contents.tests.utils import make_gcs_contents_manager
+
+pytestmark = [pytest.mark.gcs]
+
+
+@pytest.fixture
+def contents_manager(tmp_path):
+    cm = make_gcs_contents_manager(
+        prefix=uuid.uuid4().hex, content_cache_dir=str(tmp_path)
+    )
+    yield cm
+    cm.fs.fs.rm(cm.fs.path(""), recursive=True)
+
+
+def test_conditional_get(contents_manager, monkeypatch):
+    cm = contents_manager
+    cm.save({"type": "file", "format": "text", "content": "v1"}, "a.txt")
+    path_ = cm.fs.path("a.txt")
+    generation = cm.fs.fs.info(path_)["generation"]
+    cm.fs.content_cache.set(path_, {"generation": generation}, b"v1")
+
+    calls = []
+    call = cm.fs.fs._call
+
+    async def record_call(method, path, *args, **kwargs):
+        calls.append(kwargs)
+        return await call(method, path, *args, **kwargs)
+
+    monkeypatch.setattr(cm.fs.fs, "_call", record_call)
+
+    # The generation check and the download are one request
+    assert cm.fs.read("a.txt", "text")[0] == "v1"
+    assert len(calls) == 1
+    assert calls[0]["ifGenerationNotMatch"] == generation
+
+    cm.save({"type": "file", "format": "text", "content": "v2"}, "a.txt")
+    calls.clear()
+    assert cm.fs.read("a.txt", "text")[0] == "v2"
+    assert len(calls) == 1
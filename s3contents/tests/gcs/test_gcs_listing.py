@@ -0,0 +1,68 @@
+import uuid
+
+import pytest
+
+from s3contents.tests.utils import make_gcs_contents_manager
+
+pytestmark = [pytest.mark.gcs]
+
+
+@pytest.fixture(scope="module")
+def contents_manager():
+    cm = make_gcs_contents_manager(prefix=uuid.uuid4().hex, listing_concurrency=4)
+    cm.new(model={"type": "directory"}, path="big")
+    for i in range(10):
+        cm.new(model={"type": "directory"}, path="big/dir%d" % i)
+    cm.fs.fs.pipe({cm.fs.path("big/file%02d.txt" % i): b"x" for i in range(50)})
+    # A prefix without dir_keep_file, e.g. written by another tool
+    cm.fs.fs.pipe_file(cm.fs.path("big/nokeep/file.txt"), b"x")
+    yield cm
+    cm.fs.fs.rm(cm.fs.path(""), recursive=True)
+
+
+def record_requests(cm):
+    requests = []
+    cm.fs.add_request_listener(requests.append)
+    cm.fs.fs.invalidate_cache()
+    return requests
+
+
+def test_list_directory(contents_manager):
+    cm = contents_manager
+    model = cm.get("big")
+
+    files = [m for m in model["content"] if m["type"] == "file"]
+    dirs = [m for m in model["content"] if m["type"] == "directory"]
+    assert len(files) == 50
+    assert files[0]["size"] == 1
+    names = ["dir%d" % i for i in range(10)] + ["nokeep"]
+    assert sorted(m["name"] for m in dirs) == names
+    # The date of a directory is the one of its dir_keep_file
+    keep_file = cm.fs.fs.info(cm.fs.path("big/dir0", cm.fs.dir_keep_file))
+    assert dirs[0]["last_modified"] == keep_file["updated"]
+
+
+def test_list_details_requests(contents_manager):
+    cm = contents_manager
+    requests = record_requests(cm)
+
+    entries = cm.fs.list_details("big")
+
+    assert len(entries) == 50 + 11
+    # One listing, then one request per subdirectory
+    assert len(requests) == 1 + 11
+
+
+def test_skip_directory_mtimes(contents_manager):
+    cm = make_gcs_contents_manager(
+        prefix=contents_manager.prefix, skip_directory_mtimes=True
+    )
+    requests = record_requests(cm)
+
+    entries = cm.fs.list_details("big")
+
+    dirs = [e for e in entries if e["type"] == "directory"]
+    # The same directories without their dates
+    assert len(dirs) == 11
+    assert all(e["ST_MTIME"] is None for e in dirs)
+    assert len(requests) == 1
@@ -0,0 +1,71 @@
+import asyncio
+
+import pytest
+
+from s3contents import AsyncS3ContentsManager
+from s3contents.tests.utils import clean, make_contents_manager
+
+pytestmark = [pytest.mark.minio]
+
+
+@pytest.fixture
+def contents_manager():
+    cm = make_contents_manager(AsyncS3ContentsManager)
+    yield cm
+    clean(cm)
+
+
+def test_roundtrip(contents_manager):
+    cm = contents_manager
+
+    async def roundtrip():
+        await cm.new(model={"type": "directory"}, path="async")
+        model = await cm.new_untitled(path="async", type="notebook")
+        await cm.save(
+            {"type": "file", "format": "text", "content": "hello"}, "async/a.txt"
+        )
+
+        listing = await cm.get("async")
+        assert sorted(m["name"] for m in listing["content"]) == sorted(
+            [model["name"], "a.txt"]
+        )
+
+        # Concurrent requests share the s3fs event loop without blocking ours
+        files = await asyncio.gather(*[cm.get("async/a.txt") for _ in range(10)])
+        assert [f["content"] for f in files] == ["hello"] * 10
+
+        await cm.rename("async", "renamed")
+        assert await cm.dir_exists("renamed")
+        assert not await cm.dir_exists("async")
+
+        await cm.delete("renamed")
+        assert not await cm.dir_exists("renamed")
+
+    asyncio.run(roundtrip())
+
+
+def test_concurrent_saves_are_coalesced(contents_manager):
+    cm = contents_manager
+    puts = []
+    cm.fs.add_request_listener(
+        lambda operation: puts.append(1) if operation == "PutObject" else None
+    )
+
+    async def save(i):
+        model = {"type": "file", "format": "text", "content": str(i)}
+        return await cm.save(model, "a.txt")
+
+    async def save_concurrently():
+        first = asyncio.ensure_future(save(0))
+        # Let the first upload start
+        await asyncio.sleep(0.01)
+        models = await asyncio.gather(first, *[save(i) for i in range(1, 10)])
+        return models, await cm.get("a.txt")
+
+    models, model = asyncio.run(save_concurrently())
+
+    # One upload in flight, the following saves replaced each other
+    assert len(puts) == 2
+    assert model["content"] == "9"
+    assert all(m["last_modified"] == model["last_modified"] for m in models[1:])
+    assert len(cm.save_coalescer) == 0
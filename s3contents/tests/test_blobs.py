@@ -0,0 +1,111 @@
+import base64
+import json
+
+import pytest
+from tornado.web import HTTPError
+
+from s3contents.blobs import REFERENCE_PREFIX
+from s3contents.collect import collect
+from s3contents.ipycompat import new_code_cell, new_notebook, new_output
+from s3contents.memorymanager import MemoryContentsManager
+
+PNG = base64.b64encode(bytes(range(256)) * 10).decode("ascii")
+
+
+@pytest.fixture
+def contents_manager():
+    return MemoryContentsManager(offload_outputs_threshold=1000)
+
+
+def notebook_model(*pngs):
+    cells = [
+        new_code_cell(
+            "plot()",
+            outputs=[
+                new_output("display_data", data={"image/png": png}),
+                new_output("stream", text="small"),
+            ],
+        )
+        for png in pngs
+    ]
+    return {"type": "notebook", "content": new_notebook(cells=cells)}
+
+
+def test_outputs_are_offloaded(contents_manager):
+    cm = contents_manager
+    other_png = PNG[::-1]
+    cm.save(notebook_model(PNG, other_png, PNG), "a.ipynb")
+
+    stored = json.loads(cm.fs.files["a.ipynb"][0])
+    outputs = [cell["outputs"] for cell in stored["cells"]]
+    assert all(o[0]["data"]["image/png"].startswith(REFERENCE_PREFIX) for o in outputs)
+    assert outputs[0][1]["text"] == "small"
+    assert len([p for p in cm.fs.files if p.startswith(".s3contents/blobs/")]) == 2
+    assert len(cm.fs.files["a.ipynb"][0]) < len(PNG)
+
+    model = cm.get("a.ipynb")
+    pngs = [cell.outputs[0].data["image/png"] for cell in model["content"].cells]
+    assert pngs == [PNG, other_png, PNG]
+
+    # Unchanged plots are not uploaded again
+    cm.fs.reset_calls()
+    model["content"].cells.append(new_code_cell("print(1)"))
+    cm.save(model, "a.ipynb")
+    assert cm.fs.call_count("write", "isfile") == 1
+
+
+def test_blobs_are_read_concurrently_and_cached(contents_manager):
+    cm = contents_manager
+    cm.save(notebook_model(*[PNG[i:] for i in range(5)]), "a.ipynb")
+
+    # Another server, without the blobs in its cache
+    reader = MemoryContentsManager()
+    reader._fs = cm.fs
+    cm.fs.reset_calls()
+    model = reader.get("a.ipynb")
+    assert model["content"].cells[4].outputs[0].data["image/png"] == PNG[4:]
+    assert cm.fs.call_count("read") == 5
+
+    cm.fs.reset_calls()
+    reader.get("a.ipynb")
+    assert cm.fs.call_count("read") == 0
+
+
+def test_missing_blob(contents_manager):
+    cm = contents_manager
+    cm.save(notebook_model(PNG), "a.ipynb")
+    for path in [p for p in cm.fs.files if p.startswith(".s3contents/blobs/")]:
+        cm.fs.rm(path)
+    cm.blob_store.cache.clear()
+
+    with pytest.raises(HTTPError) as e:
+        cm.get("a.ipynb")
+    assert e.value.status_code == 500
+
+
+def test_collect(contents_manager):
+    cm = contents_manager
+    other_png = PNG[::-1]
+    cm.new_untitled(type="directory")
+    cm.save(notebook_model(PNG, other_png), "a.ipynb")
+    cm.save(notebook_model(PNG), "Untitled Folder/b.ipynb")
+    assert collect(cm) == 0
+
+    # The blobs referenced by no notebook are deleted
+    cm.save(notebook_model(PNG), "a.ipynb")
+    assert collect(cm) == 1
+    assert len(cm.blob_store.digests()) == 1
+    cm.delete_file("a.ipynb")
+    assert collect(cm) == 0
+    model = cm.get("Untitled Folder/b.ipynb")
+    assert model["content"].cells[0].outputs[0].data["image/png"] == PNG
+
+    cm.delete_file("Untitled Folder/b.ipynb")
+    assert collect(cm) == 1
+    assert cm.blob_store.digests() == []
+
+    # Uploaded again when they are referenced again
+    cm.save(notebook_model(other_png), "a.ipynb")
+    cm.blob_store.cache.clear()
+    model = cm.get("a.ipynb")
+    assert model["content"].cells[0].outputs[0].data["image/png"] == other_png
@@ -0,0 +1,104 @@
+import asyncio
+
+import pytest
+from tornado.web import HTTPError
+
+from s3contents.bulk import batched, run_bounded
+from s3contents.genericfs import BulkOperationError
+from s3contents.tests.utils import clean, make_contents_manager
+
+
+@pytest.fixture
+def contents_manager():
+    cm = make_contents_manager()
+    cm.new(model={"type": "directory"}, path="d")
+    for i in range(5):
+        cm.save({"type": "file", "format": "text", "content": "x"}, "d/%d.txt" % i)
+    yield cm
+    clean(cm)
+
+
+def names(cm, path):
+    return sorted(m["name"] for m in cm.get(path)["content"])
+
+
+def test_run_bounded_limits_concurrency():
+    in_flight = []
+    peak = []
+
+    async def work(item):
+        in_flight.append(item)
+        peak.append(len(in_flight))
+        await asyncio.sleep(0.01)
+        in_flight.remove(item)
+
+    result = asyncio.run(run_bounded("copy", work, range(20), 4))
+
+    assert result.ok
+    assert result.succeeded == 20
+    assert max(peak) == 4
+
+
+def test_run_bounded_collects_failures():
+    progress = []
+
+    async def work(item):
+        if item % 3 == 0:
+            raise ValueError("bad {}".format(item))
+
+    result = asyncio.run(
+        run_bounded("delete", work, range(7), 2, lambda r: progress.append(r.done))
+    )
+
+    assert not result.ok
+    assert result.succeeded == 4
+    assert sorted(item for item, _ in result.failed) == [0, 3, 6]
+    assert sorted(progress) == list(range(1, 8))
+
+    with pytest.raises(BulkOperationError, match="Delete failed for 3 of 7 objects"):
+        raise BulkOperationError(result)
+
+
+def test_batched():
+    assert batched(range(5), 2) == [[0, 1], [2, 3], [4]]
+    assert batched([], 2) == []
+
+
+@pytest.mark.minio
+def test_partial_delete_failure(contents_manager, monkeypatch):
+    cm = contents_manager
+    call_s3 = cm.fs.fs._call_s3
+    locked = cm.fs.path("d/2.txt").split("/", 1)[1]
+
+    async def fail_one_delete(method, *args, **kwargs):
+        if method != "delete_objects":
+            return await call_s3(method, *args, **kwargs)
+        objects = kwargs["Delete"]["Objects"]
+        kwargs["Delete"]["Objects"] = [o for o in objects if o["Key"] != locked]
+        response = await call_s3(method, *args, **kwargs)
+        response["Errors"] = [{"Key": locked, "Code": "AccessDenied"}]
+        return response
+
+    monkeypatch.setattr(cm.fs.fs, "_call_s3", fail_one_delete)
+    with pytest.raises(HTTPError, match="Delete failed for 1 of 6 objects"):
+        cm.delete_file("d")
+    monkeypatch.undo()
+    assert names(cm, "d") == ["2.txt"]
+
+
+@pytest.mark.minio
+def test_rename_keeps_source_on_copy_failure(contents_manager, monkeypatch):
+    cm = contents_manager
+    cp_file = cm.fs.fs._cp_file
+
+    async def fail_one_copy(source, destination, **kwargs):
+        if source.endswith("/3.txt"):
+            raise PermissionError("Access Denied")
+        return await cp_file(source, destination, **kwargs)
+
+    monkeypatch.setattr(cm.fs.fs, "_cp_file", fail_one_copy)
+    with pytest.raises(HTTPError, match="Copy failed for 1 of 6 objects"):
+        cm.rename_file("d", "e")
+    monkeypatch.undo()
+    assert names(cm, "d") == ["%d.txt" % i for i in range(5)]
+    assert names(cm, "e") == ["0.txt", "1.txt", "2.txt", "4.txt"]
@@ -0,0 +1,95 @@
+from s3contents.cache import DiskCache, LRUCache
+from s3contents.genericfs import GenericFS
+
+
+class FakeTimer:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_lru_eviction():
+    cache = LRUCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1  # "a" is now the most recently used
+    cache.set("c", 3)
+
+    assert "b" not in cache
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+def test_ttl_expiry():
+    timer = FakeTimer()
+    cache = LRUCache(maxsize=10, ttl=5, timer=timer)
+    cache.set("a", False)
+    timer.now = 4
+    assert cache.get("a", "missing") is False
+    timer.now = 6
+    assert cache.get("a", "missing") == "missing"
+    assert len(cache) == 0
+
+
+def test_hit_miss_counters():
+    cache = LRUCache(maxsize=10)
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return "value"
+
+    assert cache.get_or_set("key", compute) == "value"
+    assert cache.get_or_set("key", compute) == "value"
+    assert len(calls) == 1
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["hit_rate"] == 0.5
+
+
+def test_disabled_cache_never_stores():
+    cache = LRUCache(maxsize=0)
+    cache.set("a", 1)
+    assert not cache.enabled
+    assert cache.get("a") is None
+
+
+def test_generic_fs_invalidate():
+    fs = GenericFS(metadata_cache_ttl=60)
+    for path_ in ["bucket", "bucket/dir", "bucket/dir/nb.ipynb", "bucket/other"]:
+        fs.cached("isdir", path_, lambda: True)
+
+    fs.invalidate("bucket/dir/nb.ipynb")
+
+    cached = {key[1] for key in fs.metadata_cache._data}
+    assert cached == {"bucket/other"}
+
+
+def test_disk_cache_evicts_least_recently_used(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=10)
+    cache.set("bucket/a", {"etag": "1"}, b"aaaa")
+    cache.set("bucket/b", {"etag": "2"}, b"bbbb")
+    assert cache.get("bucket/a") == ({"etag": "1"}, b"aaaa")
+    cache.set("bucket/c", {"etag": "3"}, b"cccc")
+
+    assert cache.get("bucket/b") is None
+    assert cache.get("bucket/a") is not None
+    assert cache.size == 8
+
+    # Entries larger than the cache are not stored
+    cache.set("bucket/d", {"etag": "4"}, b"d" * 11)
+    assert cache.get("bucket/d") is None
+
+
+def test_disk_cache_reloads_entries(tmp_path):
+    DiskCache(str(tmp_path), max_bytes=10).set("bucket/a", {"etag": "1"}, b"aaaa")
+
+    cache = DiskCache(str(tmp_path), max_bytes=10)
+    assert cache.size == 4
+    assert cache.get("bucket/a") == ({"etag": "1"}, b"aaaa")
+    cache.pop("bucket/a")
+    assert cache.get("bucket/a") is None
+    assert cache.stats()["entries"] == 0
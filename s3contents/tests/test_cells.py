@@ -0,0 +1,119 @@
+import base64
+import json
+import time
+
+from s3contents.blobs import REFERENCE_PREFIX
+from s3contents.cells import LAYOUT_KEY
+from s3contents.collect import collect
+from s3contents.convert import convert
+from s3contents.ipycompat import (
+    new_code_cell,
+    new_markdown_cell,
+    new_notebook,
+    new_output,
+)
+from s3contents.memorymanager import MemoryContentsManager
+
+PNG = base64.b64encode(bytes(range(256)) * 10).decode("ascii")
+
+
+def notebook_model(n):
+    cells = [new_markdown_cell("# Cell {}".format(i)) for i in range(n)]
+    return {"type": "notebook", "content": new_notebook(cells=cells)}
+
+
+def blobs(cm):
+    return [p for p in cm.fs.files if p.startswith(".s3contents/blobs/")]
+
+
+def test_only_changed_cells_are_uploaded():
+    cm = MemoryContentsManager(cell_storage=True)
+    cm.save(notebook_model(10), "a.ipynb")
+
+    index = json.loads(cm.fs.files["a.ipynb"][0])
+    assert index[LAYOUT_KEY] == "cells"
+    assert len(index["cells"]) == 10
+    assert len(blobs(cm)) == 10
+
+    model = cm.get("a.ipynb")
+    sources = [cell.source for cell in model["content"].cells]
+    assert sources == ["# Cell {}".format(i) for i in range(10)]
+    assert model["content"].metadata == new_notebook().metadata
+
+    # One changed cell: the cell and the index are uploaded
+    cm.fs.reset_calls()
+    model["content"].cells[3].source = "changed"
+    cm.save(model, "a.ipynb")
+    assert cm.fs.call_count("write", "writenotebook") == 2
+    assert len(blobs(cm)) == 11
+
+
+def test_cells_are_read_concurrently():
+    cm = MemoryContentsManager(cell_storage=True)
+    cm.save(notebook_model(5), "a.ipynb")
+
+    # Another server, without the cells in its cache
+    other = MemoryContentsManager(cell_storage=True, latency=0.2)
+    other.fs.files = cm.fs.files
+    start = time.monotonic()
+    assert len(other.get("a.ipynb")["content"].cells) == 5
+    assert time.monotonic() - start < 0.2 * 5
+    assert other.fs.call_count("read") == 5
+
+    # Read whatever the setting
+    plain = MemoryContentsManager()
+    plain.fs.files = cm.fs.files
+    assert len(plain.get("a.ipynb")["content"].cells) == 5
+
+
+def test_with_offloaded_outputs():
+    cm = MemoryContentsManager(cell_storage=True, offload_outputs_threshold=1000)
+    output = new_output("display_data", data={"image/png": PNG})
+    nb = new_notebook(cells=[new_code_cell("plot()", outputs=[output])])
+    cm.save({"type": "notebook", "content": nb}, "a.ipynb")
+
+    # The cell references the output
+    assert len(blobs(cm)) == 2
+    assert any(REFERENCE_PREFIX.encode() in cm.fs.files[p][0] for p in blobs(cm))
+    model = cm.get("a.ipynb")
+    assert model["content"].cells[0].outputs[0].data["image/png"] == PNG
+
+
+def test_collect():
+    cm = MemoryContentsManager(cell_storage=True, offload_outputs_threshold=1000)
+    output = new_output("display_data", data={"image/png": PNG})
+    nb = new_notebook(cells=[new_code_cell("plot()", outputs=[output])])
+    cm.save({"type": "notebook", "content": nb}, "a.ipynb")
+    cm.save(notebook_model(2), "b.ipynb")
+    assert collect(cm) == 0
+
+    # The changed cell and the output it referenced
+    nb.cells[0].outputs = []
+    cm.save({"type": "notebook", "content": nb}, "a.ipynb")
+    assert len(blobs(cm)) == 5
+    assert collect(cm) == 2
+    assert len(blobs(cm)) == 3
+
+    cm.delete_file("b.ipynb")
+    assert collect(cm) == 2
+    cm.blob_store.cache.clear()
+    assert [cell.source for cell in cm.get("a.ipynb")["content"].cells] == ["plot()"]
+
+
+def test_convert():
+    cm = MemoryContentsManager()
+    cm.new_untitled(type="directory")
+    cm.save(notebook_model(3), "a.ipynb")
+    cm.save(notebook_model(2), "Untitled Folder/b.ipynb")
+    cm.save({"type": "file", "format": "text", "content": "a"}, "a.txt")
+    expected = {path: cm.get(path)["content"] for path in cm.fs.files}
+
+    assert convert(cm, "", cell_storage=True) == 2
+    assert LAYOUT_KEY in cm.fs.files["a.ipynb"][0].decode("utf-8")
+    assert LAYOUT_KEY in cm.fs.files["Untitled Folder/b.ipynb"][0].decode("utf-8")
+    assert convert(cm, "", cell_storage=True) == 0
+
+    assert convert(cm, "Untitled Folder", cell_storage=False) == 1
+    assert LAYOUT_KEY not in cm.fs.files["Untitled Folder/b.ipynb"][0].decode()
+    for path, content in expected.items():
+        assert cm.get(path)["content"] == content
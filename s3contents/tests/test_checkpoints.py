@@ -0,0 +1,108 @@
+import asyncio
+
+import pytest
+from tornado.web import HTTPError
+
+from s3contents import AsyncS3ContentsManager
+from s3contents.asynccheckpoints import AsyncS3Checkpoints
+from s3contents.checkpoints import S3Checkpoints
+from s3contents.collect import collect
+from s3contents.ipycompat import new_code_cell, new_notebook, new_output
+from s3contents.tests.utils import clean, make_contents_manager
+
+pytestmark = [pytest.mark.minio]
+
+
+@pytest.fixture
+def contents_manager():
+    cm = make_contents_manager(checkpoints_class=S3Checkpoints)
+    clean(cm)
+    yield cm
+    clean(cm)
+
+
+def test_checkpoints(contents_manager):
+    cm = contents_manager
+    cm.new(model={"type": "directory"}, path="d")
+    cm.save({"type": "file", "format": "text", "content": "v1"}, "d/a.txt")
+
+    checkpoint = cm.create_checkpoint("d/a.txt")
+    assert cm.list_checkpoints("d/a.txt") == [checkpoint]
+    # Checkpoints are hidden from the listings
+    assert [m["name"] for m in cm.get("")["content"]] == ["d"]
+
+    cm.save({"type": "file", "format": "text", "content": "v2"}, "d/a.txt")
+    cm.restore_checkpoint(checkpoint["id"], "d/a.txt")
+    assert cm.get("d/a.txt")["content"] == "v1"
+
+    # Renaming a directory moves the checkpoints of its files
+    cm.rename("d", "e")
+    assert cm.list_checkpoints("d/a.txt") == []
+    assert [c["id"] for c in cm.list_checkpoints("e/a.txt")] == [checkpoint["id"]]
+
+    cm.delete("e")
+    assert cm.list_checkpoints("e/a.txt") == []
+
+    with pytest.raises(HTTPError) as e:
+        cm.delete_checkpoint(checkpoint["id"], "e/a.txt")
+    assert e.value.status_code == 404
+
+
+def test_restore_with_manifests():
+    cm = make_contents_manager(checkpoints_class=S3Checkpoints, use_manifests=True)
+    cm.new(model={"type": "directory"}, path="d")
+    try:
+        cm.save({"type": "file", "format": "text", "content": "v1"}, "d/a.txt")
+        checkpoint = cm.create_checkpoint("d/a.txt")
+        cm.save({"type": "file", "format": "text", "content": "version 2"}, "d/a.txt")
+        assert cm.get("d")["content"][0]["size"] == 9
+
+        # The listing comes from the manifest, updated by the restore
+        cm.restore_checkpoint(checkpoint["id"], "d/a.txt")
+        assert cm.get("d")["content"][0]["size"] == 2
+        assert cm.get("d/a.txt")["content"] == "v1"
+    finally:
+        clean(cm)
+
+
+def test_collect_keeps_the_blobs_of_checkpoints(contents_manager):
+    cm = contents_manager
+    cm.offload_outputs_threshold = 100
+    png = "iVBORw0KGgo" * 100
+    output = new_output("display_data", data={"image/png": png})
+    nb = new_notebook(cells=[new_code_cell("plot()", outputs=[output])])
+    cm.save({"type": "notebook", "content": nb}, "a.ipynb")
+    checkpoint = cm.create_checkpoint("a.ipynb")
+    nb.cells[0].outputs = []
+    cm.save({"type": "notebook", "content": nb}, "a.ipynb")
+
+    assert collect(cm) == 0
+    cm.restore_checkpoint(checkpoint["id"], "a.ipynb")
+    cm.blob_store.cache.clear()
+    assert cm.get("a.ipynb")["content"].cells[0].outputs[0].data["image/png"] == png
+
+    cm.delete_checkpoint(checkpoint["id"], "a.ipynb")
+    cm.save({"type": "notebook", "content": nb}, "a.ipynb")
+    assert collect(cm) == 1
+    assert cm.blob_store.digests() == []
+
+
+def test_async_checkpoints():
+    cm = make_contents_manager(
+        AsyncS3ContentsManager, checkpoints_class=AsyncS3Checkpoints
+    )
+    clean(cm)
+
+    async def roundtrip():
+        model = await cm.new_untitled(type="notebook")
+        path = model["path"]
+        checkpoint = await cm.create_checkpoint(path)
+        assert await cm.list_checkpoints(path) == [checkpoint]
+        await cm.restore_checkpoint(checkpoint["id"], path)
+        await cm.delete_checkpoint(checkpoint["id"], path)
+        assert await cm.list_checkpoints(path) == []
+
+    try:
+        asyncio.run(roundtrip())
+    finally:
+        clean(cm)
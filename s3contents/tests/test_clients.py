@@ -0,0 +1,87 @@
+import threading
+
+import boto3
+import pytest
+
+from s3contents import clients
+from s3contents.tests.utils import make_contents_manager
+
+pytestmark = [pytest.mark.minio]
+
+
+def test_shared_clients():
+    cm = make_contents_manager(prefix="a")
+    other = make_contents_manager(prefix="b")
+    assert other.fs.fs is cm.fs.fs
+
+    # Also when created in another thread
+    managers = []
+    thread = threading.Thread(target=lambda: managers.append(make_contents_manager()))
+    thread.start()
+    thread.join()
+    assert managers[0].fs.fs is cm.fs.fs
+
+    # Not with other client settings
+    assert make_contents_manager(max_pool_connections=50).fs.fs is not cm.fs.fs
+    assert make_contents_manager(session_token="token").fs.fs is not cm.fs.fs
+
+    clients.clear()
+    assert make_contents_manager().fs.fs is not cm.fs.fs
+
+
+class FileSystem:
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+
+
+def test_client_keys(monkeypatch):
+    a = boto3.Session(aws_access_key_id="a", aws_secret_access_key="a")
+    b = boto3.Session(aws_access_key_id="b", aws_secret_access_key="b")
+    assert repr(a) == repr(b)
+    client = clients.get_client(FileSystem, session=a)
+    assert clients.get_client(FileSystem, session=a) is client
+    assert clients.get_client(FileSystem, session=b) is not client
+
+    # Not shared with a forked process
+    monkeypatch.setattr(clients.os, "getpid", lambda: -1)
+    assert clients.get_client(FileSystem, session=a) is not client
+
+
+def test_pool_settings():
+    cm = make_contents_manager(
+        max_pool_connections=50,
+        keepalive_timeout=30,
+        s3fs_config_kwargs={"connect_timeout": 5},
+    )
+    config_kwargs = cm.fs.fs.config_kwargs
+    assert config_kwargs["max_pool_connections"] == 50
+    assert config_kwargs["connector_args"] == {"keepalive_timeout": 30}
+    assert config_kwargs["connect_timeout"] == 5
+
+
+def test_prewarm():
+    cm = make_contents_manager(prewarm_connections=4)
+    requests = []
+    cm.fs.add_request_listener(requests.append)
+    cm.fs.prewarm(4)
+    assert requests == ["HeadBucket"] * 4
+
+
+def test_request_listeners():
+    cm = make_contents_manager(prefix="a")
+    other = make_contents_manager(prefix="b")
+    requests, other_requests = [], []
+    cm.fs.add_request_listener(requests.append)
+    cm.fs.add_request_listener(requests.append)
+    other.fs.add_request_listener(other_requests.append)
+
+    # Each file system only sees its own requests on the shared client
+    cm.fs.prewarm(1)
+    assert requests == ["HeadBucket"]
+    assert other_requests == []
+
+    cm.fs.remove_request_listener(requests.append)
+    cm.fs.prewarm(1)
+    other.fs.prewarm(1)
+    assert requests == ["HeadBucket"]
+    assert other_requests == ["HeadBucket"]
@@ -0,0 +1,56 @@
+import asyncio
+
+from s3contents.coalesce import Coalescer
+
+
+def test_writes_replace_the_queued_one():
+    coalescer = Coalescer()
+    written = []
+
+    def write(value):
+        async def write_():
+            await asyncio.sleep(0.01)
+            written.append(value)
+            return value
+
+        return write_
+
+    async def main():
+        first = asyncio.ensure_future(coalescer.run("a.txt", write(0)))
+        # Let the first write start
+        await asyncio.sleep(0)
+        return await asyncio.gather(
+            first,
+            *[coalescer.run("a.txt", write(i)) for i in range(1, 5)],
+            coalescer.run("b.txt", write("b")),
+        )
+
+    results = asyncio.run(main())
+
+    assert sorted(written, key=str) == [0, 4, "b"]
+    # Callers of a replaced write wait for the write that replaced it
+    assert results == [0, 4, 4, 4, 4, "b"]
+    assert len(coalescer) == 0
+
+
+def test_errors_are_raised_to_every_waiting_caller():
+    coalescer = Coalescer()
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise OSError("Service unavailable")
+
+    async def main():
+        return await asyncio.gather(
+            *[coalescer.run("a.txt", fail) for _ in range(3)], return_exceptions=True
+        )
+
+    results = asyncio.run(main())
+
+    assert [type(r) for r in results] == [OSError] * 3
+    assert len(coalescer) == 0
+
+    async def succeed():
+        return "ok"
+
+    assert asyncio.run(coalescer.run("a.txt", succeed)) == "ok"
@@ -0,0 +1,160 @@
+import asyncio
+import gzip
+
+import pytest
+from fsspec.asyn import sync
+
+from s3contents.ipycompat import TraitError, new_markdown_cell, new_notebook
+from s3contents.tests.utils import clean, make_contents_manager
+
+pytestmark = [pytest.mark.minio]
+
+
+@pytest.fixture(params=["gzip", "zstd"])
+def contents_manager(request):
+    if request.param == "zstd":
+        pytest.importorskip("zstandard")
+    cm = make_contents_manager(compression=request.param)
+    yield cm
+    clean(cm)
+
+
+def head(cm, path):
+    bucket, key, _ = cm.fs.fs.split_path(cm.fs.path(path))
+    return sync(cm.fs.fs.loop, cm.fs.fs._call_s3, "head_object", Bucket=bucket, Key=key)
+
+
+def test_compression(contents_manager):
+    cm = contents_manager
+    text = "All work and no play makes Jack a dull boy\n" * 100
+    cells = [new_markdown_cell(text)]
+    saved = cm.save(
+        {"type": "notebook", "content": new_notebook(cells=cells)}, "a.ipynb"
+    )
+    cm.save({"type": "file", "format": "text", "content": text}, "a.txt")
+
+    response = head(cm, "a.txt")
+    assert response["ContentEncoding"] == cm.fs.compression
+    assert response["ContentLength"] < len(text)
+    assert head(cm, "a.ipynb")["ContentLength"] < saved["size"]
+
+    # Logical content and sizes
+    assert cm.get("a.ipynb")["content"].cells[0].source == text
+    model = cm.get("a.txt")
+    assert model["content"] == text
+    assert model["size"] == len(text)
+    assert cm.get("a.txt", content=False)["size"] == len(text)
+    assert cm.fs.read_range("a.txt", 5, 9) == text[5:9].encode()
+
+    # Copies keep the encoding
+    cm.rename_file("a.txt", "b.txt")
+    assert cm.get("b.txt")["content"] == text
+
+
+def test_incompressible_and_legacy_objects(contents_manager):
+    cm = contents_manager
+    cm.save({"type": "file", "format": "text", "content": "a"}, "small.txt")
+    assert "ContentEncoding" not in head(cm, "small.txt")
+
+    # Written without compression
+    legacy = make_contents_manager(compression="")
+    legacy.save({"type": "file", "format": "text", "content": "a" * 1000}, "a.txt")
+    assert cm.get("a.txt")["content"] == "a" * 1000
+    assert cm.fs.read_range("a.txt", 0, 3) == b"aaa"
+
+    # And the other way around
+    cm.save({"type": "file", "format": "text", "content": "b" * 1000}, "b.txt")
+    assert legacy.get("b.txt")["content"] == "b" * 1000
+
+
+def read_chunks(cm, start, end, chunk_size):
+    async def read():
+        return [c async for c in cm.fs._read_chunks("a.txt", start, end, chunk_size)]
+
+    return asyncio.run(read())
+
+
+def test_read_chunks(contents_manager):
+    cm = contents_manager
+    text = "".join("line %d\n" % i for i in range(1000))
+    cm.save({"type": "file", "format": "text", "content": text}, "a.txt")
+    gets = []
+    cm.fs.add_request_listener(
+        lambda operation: gets.append(1) if operation == "GetObject" else None
+    )
+
+    # The object is decompressed as it's read, not downloaded for each chunk
+    chunks = read_chunks(cm, 0, len(text), 1000)
+    assert b"".join(chunks) == text.encode()
+    assert max(len(chunk) for chunk in chunks) == 1000
+    assert len(gets) == 1
+
+    # The range of the stored bytes is not the range of the content
+    gets.clear()
+    assert b"".join(read_chunks(cm, 100, 5000, 7)) == text[100:5000].encode()
+    assert len(gets) == 2
+
+
+def test_range_past_compressed_size(contents_manager):
+    cm = contents_manager
+    text = "All work and no play makes Jack a dull boy\n" * 8000
+    cm.save({"type": "file", "format": "text", "content": text}, "a.txt")
+    assert head(cm, "a.txt")["ContentLength"] < 100000
+
+    # Not satisfiable as a range of the stored bytes
+    expected = text[100000:100010].encode()
+    assert cm.fs.read_range("a.txt", 100000, 100010) == expected
+    assert b"".join(read_chunks(cm, 100000, 100010, 4)) == expected
+
+
+def test_listed_sizes(contents_manager):
+    cm = contents_manager
+    text = "All work and no play makes Jack a dull boy\n" * 8000
+    cm.save({"type": "file", "format": "text", "content": text}, "a.txt")
+    cm.save({"type": "file", "format": "text", "content": ""}, "empty.txt")
+    heads = []
+    cm.fs.add_request_listener(
+        lambda operation: heads.append(1) if operation == "HeadObject" else None
+    )
+
+    listed = {m["name"]: m for m in cm.get("")["content"]}
+    assert listed["a.txt"]["size"] == len(text)
+    assert listed["empty.txt"]["size"] == 0
+    first = len(heads)
+
+    # Only the changed objects are looked up again
+    heads.clear()
+    cm.get("")
+    assert len(heads) == first - 1
+    cm.save({"type": "file", "format": "text", "content": text * 2}, "a.txt")
+    heads.clear()
+    listed = {m["name"]: m for m in cm.get("")["content"]}
+    assert listed["a.txt"]["size"] == 2 * len(text)
+    assert len(heads) == first
+
+
+def test_listed_sizes_are_not_cached(contents_manager):
+    cm = contents_manager
+    text = "a" * 1000
+    cm.save({"type": "file", "format": "text", "content": text}, "a.txt")
+
+    # Without compression, listings show the stored size of compressed objects
+    reader = make_contents_manager(compression="", metadata_cache_ttl=60)
+    listed = {m["name"]: m for m in reader.get("")["content"]}
+    assert listed["a.txt"]["size"] < len(text)
+    assert reader.get("a.txt", content=False)["size"] == len(text)
+
+
+def test_gzip_objects_are_standard():
+    cm = make_contents_manager(compression="gzip")
+    try:
+        cm.save({"type": "file", "format": "text", "content": "a" * 1000}, "a.txt")
+        raw = cm.fs.fs.cat_file(cm.fs.path("a.txt"))
+        assert gzip.decompress(raw) == b"a" * 1000
+    finally:
+        cm.fs.rm("a.txt")
+
+
+def test_invalid_compression():
+    with pytest.raises(TraitError):
+        make_contents_manager(compression="brotli")
@@ -0,0 +1,45 @@
+import pytest
+from fsspec.asyn import sync
+
+from s3contents.tests.utils import clean, make_contents_manager
+
+pytestmark = [pytest.mark.minio]
+
+
+@pytest.fixture
+def contents_manager(tmp_path):
+    cm = make_contents_manager(content_cache_dir=str(tmp_path))
+    yield cm
+    clean(cm)
+
+
+@pytest.fixture
+def statuses(contents_manager):
+    """Status codes of the GetObject responses"""
+    statuses = []
+
+    def on_response(http_response, **kwargs):
+        statuses.append(http_response.status_code)
+
+    s3 = sync(contents_manager.fs.fs.loop, contents_manager.fs.fs.get_s3)
+    s3.meta.events.register("after-call.s3.GetObject", on_response)
+    yield statuses
+    s3.meta.events.unregister("after-call.s3.GetObject", on_response)
+
+
+def test_not_modified(contents_manager, statuses):
+    cm = contents_manager
+    cm.save({"type": "file", "format": "text", "content": "v1"}, "a.txt")
+    assert cm.get("a.txt")["content"] == "v1"
+
+    statuses.clear()
+    # In the cache: the GET is conditional and S3 answers 304 Not Modified
+    assert cm.get("a.txt")["content"] == "v1"
+    assert statuses == [304]
+
+    # Changed by another server
+    other = make_contents_manager()
+    other.save({"type": "file", "format": "text", "content": "v2"}, "a.txt")
+    statuses.clear()
+    assert cm.get("a.txt")["content"] == "v2"
+    assert statuses == [200]
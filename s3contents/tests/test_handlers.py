@@ -0,0 +1,191 @@
+import uuid
+
+import pytest
+from tornado.httpclient import HTTPClientError
+
+from s3contents import cells
+from s3contents.blobs import REFERENCE_PREFIX
+from s3contents.handlers import parse_range
+from s3contents.ipycompat import new_code_cell, new_notebook, new_output, reads
+from s3contents.tests.utils import MINIO_CONFIG
+
+pytest_plugins = ["pytest_jupyter.jupyter_server"]
+
+
+@pytest.fixture
+def jp_server_config():
+    return {
+        "ServerApp": {"contents_manager_class": "s3contents.S3ContentsManager"},
+        "S3ContentsManager": dict(
+            MINIO_CONFIG, prefix=uuid.uuid4().hex, files_chunk_size=4
+        ),
+    }
+
+
+@pytest.fixture
+def contents_manager(jp_serverapp):
+    cm = jp_serverapp.contents_manager
+    cm.save({"type": "file", "format": "text", "content": "0123456789"}, "a.txt")
+    yield cm
+    cm.fs.fs.rm(cm.fs.path(""), recursive=True)
+
+
+@pytest.mark.parametrize(
+    "header, expected",
+    [
+        ("bytes=0-99", (0, 100)),
+        ("bytes=10-", (10, 1000)),
+        ("bytes=-100", (900, 1000)),
+        ("bytes=-5000", (0, 1000)),
+        ("bytes=990-5000", (990, 1000)),
+        # Ignored: invalid, reversed or multiple ranges
+        ("bytes=", None),
+        ("bytes=20-10", None),
+        ("bytes=0-1,5-6", None),
+        ("lines=0-1", None),
+    ],
+)
+def test_parse_range(header, expected):
+    assert parse_range(header, 1000) == expected
+
+
+def test_parse_range_not_satisfiable():
+    with pytest.raises(ValueError):
+        parse_range("bytes=1000-", 1000)
+
+
+@pytest.mark.minio
+async def test_get(contents_manager, jp_fetch):
+    response = await jp_fetch("files", "a.txt")
+    assert response.code == 200
+    assert response.body == b"0123456789"
+    assert response.headers["Content-Type"] == "text/plain; charset=UTF-8"
+    assert response.headers["Accept-Ranges"] == "bytes"
+
+
+@pytest.mark.minio
+async def test_range(contents_manager, jp_fetch):
+    response = await jp_fetch("files", "a.txt", headers={"Range": "bytes=3-8"})
+    assert response.code == 206
+    assert response.body == b"345678"
+    assert response.headers["Content-Range"] == "bytes 3-8/10"
+
+    with pytest.raises(HTTPClientError) as e:
+        await jp_fetch("files", "a.txt", headers={"Range": "bytes=10-"})
+    assert e.value.code == 416
+    assert e.value.response.headers["Content-Range"] == "bytes */10"
+
+
+@pytest.mark.minio
+async def test_range_of_compressed_file(contents_manager, jp_fetch):
+    cm = contents_manager
+    cm.fs.compression = "gzip"
+    text = "All work and no play makes Jack a dull boy\n" * 8000
+    cm.save({"type": "file", "format": "text", "content": text}, "a.txt")
+    assert cm.fs.fs.size(cm.fs.path("a.txt")) < 100000
+
+    # Starts past the end of the stored bytes
+    response = await jp_fetch(
+        "files", "a.txt", headers={"Range": "bytes=100000-100009"}
+    )
+    assert response.code == 206
+    assert response.body == text[100000:100010].encode()
+    assert response.headers["Content-Range"] == "bytes 100000-100009/%d" % len(
+        text
+    )
+
+
+@pytest.mark.minio
+async def test_not_found(contents_manager, jp_fetch):
+    for path in ["missing.txt", ""]:
+        with pytest.raises(HTTPClientError) as e:
+            await jp_fetch("files", path)
+        assert e.value.code == 404
+
+
+@pytest.mark.minio
+async def test_hidden_files(contents_manager, jp_fetch, monkeypatch):
+    contents_manager.save(
+        {"type": "file", "format": "text", "content": "secret"}, ".env"
+    )
+    monkeypatch.setattr(
+        contents_manager, "is_hidden", lambda path: path.startswith(".")
+    )
+    with pytest.raises(HTTPClientError) as e:
+        await jp_fetch("files", ".env")
+    assert e.value.code == 404
+
+    contents_manager.allow_hidden = True
+    response = await jp_fetch("files", ".env")
+    assert response.body == b"secret"
+
+
+@pytest.mark.minio
+async def test_presign_redirect(contents_manager, jp_fetch):
+    contents_manager.files_presign_threshold = 10
+    response = await jp_fetch(
+        "files", "a.txt", follow_redirects=False, raise_error=False
+    )
+    assert response.code == 302
+    location = response.headers["Location"]
+    assert location.startswith(MINIO_CONFIG["endpoint_url"])
+    assert "Signature=" in location
+
+    # Smaller files are served by the server
+    contents_manager.files_presign_threshold = 11
+    response = await jp_fetch("files", "a.txt")
+    assert response.body == b"0123456789"
+
+
+@pytest.mark.minio
+async def test_write_behind(contents_manager, jp_fetch, tmp_path):
+    cm = contents_manager
+    cm.write_behind_dir = str(tmp_path)
+    cm.init_journal()
+    # Keep the saves in the journal until something flushes them
+    cm.journal.stop()
+    cm.save({"type": "file", "format": "text", "content": "journaled"}, "a.txt")
+    cm.save({"type": "file", "format": "text", "content": "new"}, "b.txt")
+    assert cm.journal.pending_stat("a.txt") is not None
+
+    response = await jp_fetch("files", "a.txt")
+    assert response.body == b"journaled"
+    response = await jp_fetch("files", "b.txt")
+    assert response.body == b"new"
+    assert not cm.journal.pending
+
+
+@pytest.mark.minio
+async def test_notebook_with_blobs(contents_manager, jp_fetch):
+    cm = contents_manager
+    cm.offload_outputs_threshold = 100
+    png = "iVBORw0KGgo" * 100
+    output = new_output("display_data", data={"image/png": png})
+    nb = new_notebook(cells=[new_code_cell("plot()", outputs=[output])])
+    cm.save({"type": "notebook", "content": nb}, "a.ipynb")
+    assert REFERENCE_PREFIX in cm.fs.read("a.ipynb", "text")[0]
+
+    # The outputs are put back in the downloaded notebook
+    response = await jp_fetch("files", "a.ipynb")
+    assert response.headers["Content-Type"] == "application/x-ipynb+json"
+    downloaded = reads(response.body.decode("utf-8"), as_version=4)
+    assert downloaded.cells[0].outputs[0].data["image/png"] == png
+    assert int(response.headers["Content-Length"]) == len(response.body)
+
+    response = await jp_fetch("files", "a.ipynb", headers={"Range": "bytes=0-0"})
+    assert response.code == 206
+    assert response.body == b"{"
+
+
+@pytest.mark.minio
+async def test_notebook_stored_cell_by_cell(contents_manager, jp_fetch):
+    cm = contents_manager
+    cm.cell_storage = True
+    nb = new_notebook(cells=[new_code_cell("x = %d" % i) for i in range(3)])
+    cm.save({"type": "notebook", "content": nb}, "a.ipynb")
+    assert cells.parse_index(cm.fs.read("a.ipynb", "text")[0]) is not None
+
+    # The downloaded notebook is the notebook, not the index of its cells
+    response = await jp_fetch("files", "a.ipynb")
+    downloaded = reads(response.body.decode("utf-8"), as_version=4)
+    assert [cell.source for cell in downloaded.cells] == ["x = 0", "x = 1", "x = 2"]
@@ -0,0 +1,72 @@
+import hashlib
+
+import pytest
+from fsspec.asyn import sync
+
+from s3contents.ipycompat import new_markdown_cell, new_notebook
+from s3contents.tests.utils import clean, make_contents_manager
+
+pytestmark = [pytest.mark.minio]
+
+
+@pytest.fixture
+def contents_manager():
+    cm = make_contents_manager()
+    yield cm
+    clean(cm)
+
+
+def record_requests(cm):
+    requests = []
+    cm.fs.add_request_listener(requests.append)
+    return requests
+
+
+def sha256(content):
+    return hashlib.sha256(content).hexdigest()
+
+
+def test_hash_from_metadata(contents_manager):
+    cm = contents_manager
+    nb = new_notebook(cells=[new_markdown_cell("Hello")])
+    cm.save({"type": "notebook", "content": nb}, "a.ipynb")
+    cm.save({"type": "file", "format": "text", "content": "hello"}, "a.txt")
+    expected = {p: sha256(cm.fs.fs.cat_file(cm.fs.path(p))) for p in cm.fs.ls("")}
+    requests = record_requests(cm)
+
+    for path in ["a.ipynb", "a.txt"]:
+        del requests[:]
+        model = cm.get(path, content=False, require_hash=True)
+        assert model["hash"] == expected[path]
+        assert model["hash_algorithm"] == "sha256"
+        assert requests == ["HeadObject"]
+
+    # Kept by server-side copies
+    cm.rename_file("a.txt", "b.txt")
+    assert cm.fs.hash("b.txt") == sha256(b"hello")
+
+    # Same hash with the content
+    model = cm.get("b.txt", require_hash=True)
+    assert model["hash"] == sha256(b"hello")
+
+
+def test_hash_of_legacy_objects(contents_manager):
+    cm = contents_manager
+    # Written by another tool
+    cm.fs.fs.pipe(cm.fs.path("a.txt"), b"hello")
+    cm.fs.fs.invalidate_cache()
+    requests = record_requests(cm)
+
+    assert cm.get("a.txt", content=False, require_hash=True)["hash"] == sha256(b"hello")
+    assert "GetObject" in requests
+
+
+def test_hash_of_compressed_objects(contents_manager):
+    cm = contents_manager
+    cm.fs.compression = "gzip"
+    text = "All work and no play makes Jack a dull boy\n" * 100
+    cm.save({"type": "file", "format": "text", "content": text}, "a.txt")
+
+    model = cm.get("a.txt", content=False, require_hash=True)
+    assert model["hash"] == sha256(text.encode())
+    assert sync(cm.fs.fs.loop, cm.fs._hash, "a.txt") == sha256(text.encode())
@@ -0,0 +1,105 @@
+import logging
+import os
+import time
+
+import pytest
+
+from s3contents.ipycompat import new_markdown_cell, new_notebook
+from s3contents.journal import Journal
+from s3contents.memorymanager import MemoryContentsManager
+
+log = logging.getLogger(__name__)
+
+
+@pytest.fixture
+def contents_manager(tmp_path):
+    cm = MemoryContentsManager(write_behind_dir=str(tmp_path))
+    # Uploads only happen on flush_writes()
+    cm.journal.stop()
+    return cm
+
+
+def notebook_model(text):
+    return {
+        "type": "notebook",
+        "content": new_notebook(cells=[new_markdown_cell(text)]),
+    }
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "Timed out"
+        time.sleep(0.01)
+
+
+def test_saves_are_served_from_the_journal(contents_manager):
+    cm = contents_manager
+    cm.new(model={"type": "directory"}, path="d")
+    cm.fs.reset_calls()
+
+    saved = cm.save(notebook_model("Hello"), "d/a.ipynb")
+    cm.save({"type": "file", "format": "text", "content": "hello"}, "d/b.txt")
+    assert cm.fs.calls == []
+    assert cm.file_exists("d/a.ipynb")
+
+    model = cm.get("d/a.ipynb")
+    assert model["content"].cells[0].source == "Hello"
+    assert model["last_modified"] == saved["last_modified"]
+    assert cm.get("d/b.txt")["content"] == "hello"
+    listing = cm.get("d")["content"]
+    assert [m["name"] for m in listing] == ["a.ipynb", "b.txt"]
+    assert listing[1]["size"] == 5
+
+    # The date of the save is kept once uploaded
+    cm.flush_writes()
+    assert cm.journal.pending == {}
+    assert cm.fs.files["d/b.txt"][0] == b"hello"
+    assert cm.get("d/a.ipynb")["last_modified"] == saved["last_modified"]
+
+
+def test_replay(tmp_path, contents_manager):
+    cm = contents_manager
+    cm.save(notebook_model("First"), "a.ipynb")
+    cm.save(notebook_model("Second"), "a.ipynb")
+    cm.save({"type": "file", "format": "base64", "content": "/w=="}, "b.bin")
+    assert len(os.listdir(tmp_path)) == 2
+
+    # A new server with the same journal uploads the saves
+    cm = MemoryContentsManager(write_behind_dir=str(tmp_path))
+    wait_for(lambda: not cm.journal.pending)
+    cm.journal.stop()
+    assert os.listdir(tmp_path) == []
+    assert b"Second" in cm.fs.files["a.ipynb"][0]
+    assert cm.fs.files["b.bin"][0] == b"\xff"
+
+
+def test_rename_and_delete_flush(contents_manager):
+    cm = contents_manager
+    cm.save({"type": "file", "format": "text", "content": "hello"}, "a.txt")
+
+    cm.rename_file("a.txt", "b.txt")
+    assert list(cm.fs.files) == ["b.txt"]
+
+    cm.save({"type": "file", "format": "text", "content": "hello"}, "b.txt")
+    cm.delete_file("b.txt")
+    assert cm.fs.files == {}
+    assert not cm.file_exists("b.txt")
+
+
+def test_upload_retries(tmp_path):
+    uploaded = []
+
+    def upload(path, content):
+        if len(uploaded) < 2:
+            uploaded.append(None)
+            raise OSError("Service unavailable")
+        uploaded.append(content)
+        return {"type": "file", "ST_MTIME": None, "SIZE": len(content)}
+
+    journal = Journal(str(tmp_path), upload, log, retry_delay=0.01)
+    journal.start()
+    journal.append("a.txt", b"hello")
+    wait_for(lambda: not journal.pending)
+    journal.stop()
+    assert uploaded == [None, None, b"hello"]
@@ -0,0 +1,36 @@
+import pytest
+from fsspec.asyn import sync
+
+from s3contents.tests.utils import make_contents_manager
+
+pytestmark = [pytest.mark.minio]
+
+
+@pytest.fixture
+def contents_manager():
+    cm = make_contents_manager(prefix="lazy", lazy_init=True)
+    yield cm
+    cm.fs.fs.rm(cm.fs.path(""), recursive=True)
+
+
+def test_lazy_init(contents_manager):
+    cm = contents_manager
+    # The root is created in the background
+    cm.fs.init_future.result()
+    assert cm.fs.fs.exists(cm.fs.path(".s3keep"))
+    assert cm.dir_exists("")
+
+    # Once it exists starting is a single HEAD, the client is shared
+    requests = []
+
+    def on_request(model, **kwargs):
+        requests.append(model.name)
+
+    s3 = sync(cm.fs.fs.loop, cm.fs.fs.get_s3)
+    s3.meta.events.register("before-call.s3", on_request)
+    try:
+        other = make_contents_manager(prefix="lazy", lazy_init=True)
+        other.fs.init_future.result()
+    finally:
+        s3.meta.events.unregister("before-call.s3", on_request)
+    assert requests == ["HeadObject"]
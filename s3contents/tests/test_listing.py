@@ -0,0 +1,49 @@
+import pytest
+from fsspec.asyn import sync
+
+from s3contents.tests.utils import clean, make_contents_manager
+
+pytestmark = [pytest.mark.minio]
+
+
+@pytest.fixture(scope="module")
+def contents_manager():
+    cm = make_contents_manager(listing_concurrency=4)
+    cm.new(model={"type": "directory"}, path="big")
+    for i in range(10):
+        cm.new(model={"type": "directory"}, path="big/dir%d" % i)
+    # More keys than one ListObjectsV2 page
+    cm.fs.fs.pipe({cm.fs.path("big/file%04d.txt" % i): b"x" for i in range(1005)})
+    # A prefix without dir_keep_file, e.g. written by another tool
+    cm.fs.fs.pipe_file(cm.fs.path("big/nokeep/file.txt"), b"x")
+    yield cm
+    clean(cm)
+
+
+def test_list_directory(contents_manager):
+    model = contents_manager.get("big")
+
+    files = [m for m in model["content"] if m["type"] == "file"]
+    dirs = [m for m in model["content"] if m["type"] == "directory"]
+    assert len(files) == 1005
+    assert files[0]["size"] == 1
+    names = ["dir%d" % i for i in range(10)] + ["nokeep"]
+    assert sorted(m["name"] for m in dirs) == names
+    assert all(m["last_modified"].year > 1970 for m in dirs[:10])
+
+
+def test_skip_directory_mtimes(contents_manager):
+    cm = make_contents_manager(skip_directory_mtimes=True)
+    heads = []
+    s3 = sync(cm.fs.fs.loop, cm.fs.fs.get_s3)
+    s3.meta.events.register(
+        "provide-client-params.s3.HeadObject",
+        lambda params, **kwargs: heads.append(params["Key"]),
+    )
+
+    model = cm.get("big")
+
+    dirs = [m for m in model["content"] if m["type"] == "directory"]
+    # The same directories without their dates
+    assert len(dirs) == 11
+    assert not [key for key in heads if key.startswith("big/dir")]
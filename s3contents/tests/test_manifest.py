@@ -0,0 +1,121 @@
+import asyncio
+
+import pytest
+from fsspec.asyn import sync
+from traitlets import TraitError
+
+from s3contents import s3_fs
+from s3contents.tests.utils import clean, make_contents_manager
+
+pytestmark = [pytest.mark.minio]
+
+
+@pytest.fixture
+def contents_manager():
+    cm = make_contents_manager(use_manifests=True)
+    yield cm
+    clean(cm)
+
+
+def names(cm, path):
+    return [m["name"] for m in cm.get(path)["content"]]
+
+
+def test_listing_from_manifest(contents_manager):
+    cm = contents_manager
+    cm.new(model={"type": "directory"}, path="d")
+    cm.save({"type": "file", "format": "text", "content": "v1"}, "d/a.txt")
+    cm.get("d")  # Builds the manifest
+
+    requests = []
+    s3 = sync(cm.fs.fs.loop, cm.fs.fs.get_s3)
+    s3.meta.events.register(
+        "before-send.s3",
+        lambda request, **kwargs: requests.append(request.method),
+    )
+    assert cm.fs.list_details("d")[0]["path"] == "d/a.txt"
+    assert requests == ["GET"]
+
+
+def test_manifest_updates(contents_manager):
+    cm = contents_manager
+    cm.new(model={"type": "directory"}, path="d")
+    assert names(cm, "d") == []
+
+    cm.save({"type": "file", "format": "text", "content": "hello"}, "d/a.txt")
+    cm.new(model={"type": "directory"}, path="d/sub")
+    assert names(cm, "d") == ["a.txt", "sub"]
+    assert cm.get("d")["content"][0]["size"] == 5
+
+    cm.rename_file("d/a.txt", "d/b.txt")
+    assert names(cm, "d") == ["b.txt", "sub"]
+    cm.delete_file("d/sub")
+    assert names(cm, "d") == ["b.txt"]
+
+    # Concurrent updates of the same manifest are not lost
+    async def write_all():
+        await asyncio.gather(
+            *(cm.fs._write("d/%d.txt" % i, "x", "text") for i in range(8))
+        )
+
+    sync(cm.fs.fs.loop, write_all)
+    assert names(cm, "d") == ["%d.txt" % i for i in range(8)] + ["b.txt"]
+
+
+def test_reconcile_manifests(contents_manager):
+    cm = contents_manager
+    cm.new(model={"type": "directory"}, path="d")
+    assert names(cm, "d") == []
+
+    # Changes made by other tools are only seen after a reconcile
+    cm.fs.fs.pipe_file(cm.fs.path("d/external.txt"), b"x")
+    assert names(cm, "d") == []
+    assert cm.fs.reconcile_manifests() == 2
+    assert names(cm, "d") == ["external.txt"]
+
+    # The manifests of deleted directories are deleted
+    cm.fs.fs.rm(cm.fs.path("d"), recursive=True)
+    assert cm.fs.reconcile_manifests() == 1
+    cm.fs.fs.invalidate_cache()
+    assert not cm.fs.fs.exists(cm.fs.manifest_path("d"))
+
+
+def test_stale_manifest_write_is_retried(contents_manager, monkeypatch):
+    cm = contents_manager
+    cm.new(model={"type": "directory"}, path="d")
+    assert names(cm, "d") == []
+
+    statuses = []
+
+    def on_response(http_response, **kwargs):
+        statuses.append(http_response.status_code)
+
+    read_manifest = cm.fs._read_manifest
+    concurrent = []
+
+    async def read_then_change(path):
+        result = await read_manifest(path)
+        if not concurrent:
+            # Another server changes the manifest after this read
+            concurrent.append(path)
+            await cm.fs._write("d/b.txt", "x", "text")
+        return result
+
+    s3 = sync(cm.fs.fs.loop, cm.fs.fs.get_s3)
+    s3.meta.events.register("after-call.s3.PutObject", on_response)
+    monkeypatch.setattr(cm.fs, "_read_manifest", read_then_change)
+    try:
+        cm.save({"type": "file", "format": "text", "content": "x"}, "d/a.txt")
+    finally:
+        s3.meta.events.unregister("after-call.s3.PutObject", on_response)
+    monkeypatch.undo()
+
+    # The write with the stale ETag fails and is retried with the new manifest
+    assert statuses.count(412) == 1
+    assert names(cm, "d") == ["a.txt", "b.txt"]
+
+
+def test_use_manifests_requires_conditional_writes(monkeypatch):
+    monkeypatch.setattr(s3_fs, "supports_conditional_writes", lambda: False)
+    with pytest.raises(TraitError, match="requires conditional writes"):
+        make_contents_manager(use_manifests=True)
@@ -0,0 +1,124 @@
+import asyncio
+import time
+
+import pytest
+
+from s3contents.chunks import content_chunks
+from s3contents.ipycompat import new_code_cell
+from s3contents.memorymanager import MemoryContentsManager
+
+
+@pytest.fixture
+def contents_manager():
+    return MemoryContentsManager()
+
+
+def calls_of(cm, func):
+    """Backend calls made by `func()`"""
+    cm.fs.reset_calls()
+    func()
+    return [call.method for call in cm.fs.calls]
+
+
+def test_roundtrip(contents_manager):
+    cm = contents_manager
+    cm.new(model={"type": "directory"}, path="d")
+    cm.save({"type": "file", "format": "text", "content": "hello"}, "d/a.txt")
+    cm.save({"type": "file", "format": "base64", "content": "/w=="}, "d/b.bin")
+
+    assert cm.get("d/a.txt")["content"] == "hello"
+    assert cm.get("d/b.bin")["content"] == "/w=="
+    assert [m["name"] for m in cm.get("d")["content"]] == ["a.txt", "b.bin"]
+    assert cm.get("d")["content"][0]["size"] == 5
+
+    cm.rename_file("d", "e")
+    assert not cm.dir_exists("d")
+    assert cm.get("e/a.txt")["content"] == "hello"
+
+    cm.delete_file("e")
+    assert cm.get("")["content"] == []
+
+
+def test_calls_are_recorded(contents_manager):
+    cm = contents_manager
+    cm.fs.latency = 0.001
+    cm.save({"type": "file", "format": "text", "content": "hello"}, "a.txt")
+
+    cm.fs.reset_calls()
+    cm.rename_file("a.txt", "b.txt")
+    # The calls made by mv itself are not recorded
+    assert cm.fs.calls[-1].method == "mv"
+    assert cm.fs.calls[-1].args == ("a.txt", "b.txt")
+    assert cm.fs.calls[-1].latency == 0.001
+    assert cm.fs.call_count("cp", "rm") == 0
+
+    # The coroutine versions run the same methods
+    assert asyncio.run(cm.fs._isfile("b.txt"))
+    assert cm.fs.calls[-1].method == "isfile"
+
+
+#  Round-trip budgets ---------------------------------------------------------
+# Maximum number of backend calls of the contents manager operations, raise
+# them only knowing that every call is a request to S3 or GCS.
+
+
+def test_get_notebook_budget(contents_manager):
+    cm = contents_manager
+    path = cm.new_untitled(type="notebook")["path"]
+
+    assert len(calls_of(cm, lambda: cm.get(path))) <= 1
+    assert len(calls_of(cm, lambda: cm.get(path, content=False))) <= 1
+
+
+def test_save_notebook_budget(contents_manager):
+    cm = contents_manager
+    path = cm.new_untitled(type="notebook")["path"]
+    model = cm.get(path)
+    model["content"].cells.append(new_code_cell("print(1)"))
+
+    assert len(calls_of(cm, lambda: cm.save(model, path))) <= 2
+
+
+def test_get_file_budget(contents_manager):
+    cm = contents_manager
+    cm.save({"type": "file", "format": "text", "content": "hello"}, "a.txt")
+
+    assert len(calls_of(cm, lambda: cm.get("a.txt"))) <= 2
+
+
+def test_require_hash_budget(contents_manager):
+    cm = contents_manager
+    cm.save({"type": "file", "format": "text", "content": "hello"}, "a.txt")
+
+    calls = calls_of(cm, lambda: cm.get("a.txt", content=False, require_hash=True))
+    assert len(calls) <= 2
+    assert "read" not in calls
+
+
+def test_list_directory_budget(contents_manager):
+    cm = contents_manager
+    cm.new(model={"type": "directory"}, path="d")
+    for i in range(50):
+        cm.new(model={"type": "directory"}, path="d/sub%d" % i)
+        cm.save({"type": "file", "format": "text", "content": "x"}, "d/%d.txt" % i)
+
+    # Doesn't depend on the number of entries
+    assert len(calls_of(cm, lambda: cm.get("d"))) <= 2
+
+
+def test_rename_and_delete_budget(contents_manager):
+    cm = contents_manager
+    cm.new(model={"type": "directory"}, path="d")
+
+    assert len(calls_of(cm, lambda: cm.rename_file("d", "e"))) <= 5
+    assert len(calls_of(cm, lambda: cm.delete_file("e"))) <= 3
+
+
+def test_stale_chunks_are_pruned(contents_manager):
+    chunks = content_chunks.get()
+    chunks["stale.txt"] = {"started_at": time.time() - 4000, "chunks": []}
+    for chunk, content in [(1, "aGVs"), (-1, "bG8=")]:
+        model = {"type": "file", "format": "base64", "content": content}
+        contents_manager.save(dict(model, chunk=chunk), "a.txt")
+    assert "stale.txt" not in chunks
+    assert contents_manager.get("a.txt")["content"] == "hello"
@@ -0,0 +1,54 @@
+import pytest
+from tornado.web import HTTPError
+
+from s3contents.tests.utils import clean, make_contents_manager
+
+prometheus_client = pytest.importorskip("prometheus_client")
+
+pytestmark = [pytest.mark.minio]
+
+
+@pytest.fixture
+def contents_manager():
+    cm = make_contents_manager(enable_metrics=True)
+    yield cm
+    clean(cm)
+
+
+def sample(name, **labels):
+    value = prometheus_client.REGISTRY.get_sample_value(name, labels)
+    return value or 0
+
+
+def test_metrics(contents_manager):
+    cm = contents_manager
+    requests = sample("s3contents_operation_requests_sum", operation="get")
+    gets = sample("s3contents_backend_requests_total", operation="GetObject")
+    read_bytes = sample("s3contents_read_bytes_total")
+    written_bytes = sample("s3contents_written_bytes_total")
+
+    cm.save({"type": "file", "format": "text", "content": "héllo"}, "a.txt")
+    cm.get("a.txt")
+
+    assert sample("s3contents_written_bytes_total") - written_bytes == 6
+    assert sample("s3contents_read_bytes_total") - read_bytes == 6
+    assert (
+        sample("s3contents_backend_requests_total", operation="GetObject") == gets + 1
+    )
+    assert sample("s3contents_operation_requests_sum", operation="get") > requests
+    assert sample("s3contents_operation_seconds_count", operation="save") > 0
+    assert sample("s3contents_fs_seconds_count", method="write") > 0
+
+    with pytest.raises(HTTPError):
+        cm.get("missing.txt")
+    assert sample("s3contents_operation_errors_total", operation="get") > 0
+
+    text = prometheus_client.generate_latest().decode("utf-8")
+    assert 's3contents_cache_hits_total{cache="metadata"}' in text
+
+
+def test_metrics_disabled():
+    cm = make_contents_manager()
+    # Nothing is wrapped
+    assert "get" not in vars(cm)
+    assert "read" not in vars(cm.fs)
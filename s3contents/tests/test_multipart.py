@@ -0,0 +1,99 @@
+import base64
+
+import pytest
+from fsspec.asyn import sync
+
+from s3contents.tests.utils import clean, make_contents_manager
+
+pytestmark = [pytest.mark.minio]
+
+MB = 1024 * 1024
+
+
+@pytest.fixture
+def contents_manager():
+    cm = make_contents_manager(multipart_part_size=5 * MB)
+    yield cm
+    clean(cm)
+
+
+def save_chunk(cm, path, chunk, content, format="base64"):
+    if format == "base64":
+        content = base64.b64encode(content).decode("ascii")
+    model = {"type": "file", "format": format, "content": content, "chunk": chunk}
+    cm.save(model, path)
+
+
+def record_requests(cm):
+    requests = []
+    cm.fs.add_request_listener(requests.append)
+    return requests
+
+
+def upload_state(cm, path):
+    upload_dir = cm.fs.upload_dir(cm.fs.path(path))
+    return sync(cm.fs.fs.loop, cm.fs._read_upload_state, upload_dir)
+
+
+def uploads(cm):
+    """Ids of the multipart uploads in progress"""
+    s3 = sync(cm.fs.fs.loop, cm.fs.fs.get_s3)
+    response = sync(cm.fs.fs.loop, s3.list_multipart_uploads, Bucket="notebooks")
+    return [upload["UploadId"] for upload in response.get("Uploads", [])]
+
+
+def test_small_chunks_are_buffered(contents_manager):
+    cm = contents_manager
+    requests = record_requests(cm)
+    chunks = [bytes([i]) * 2 * MB for i in range(3)] + [b"end"]
+
+    save_chunk(cm, "big.bin", 1, chunks[0])
+    upload_id = upload_state(cm, "big.bin")["upload_id"]
+    save_chunk(cm, "big.bin", 2, chunks[1])
+    assert requests.count("CreateMultipartUpload") == 1
+    assert "UploadPart" not in requests
+
+    # The pending chunks make a part once there's multipart_part_size of them
+    save_chunk(cm, "big.bin", 3, chunks[2])
+    assert requests.count("UploadPart") == 1
+    save_chunk(cm, "big.bin", -1, chunks[3])
+    assert requests.count("UploadPart") == 2
+    assert requests.count("CompleteMultipartUpload") == 1
+
+    assert cm.fs.fs.cat_file(cm.fs.path("big.bin")) == b"".join(chunks)
+    assert cm.get("big.bin", content=False)["size"] == 6 * MB + 3
+    assert upload_state(cm, "big.bin") is None
+    assert upload_id not in uploads(cm)
+
+
+def test_single_chunk(contents_manager):
+    cm = contents_manager
+    requests = record_requests(cm)
+    save_chunk(cm, "a.bin", -1, b"\x00\xff")
+    assert "CreateMultipartUpload" not in requests
+    assert requests.count("PutObject") == 1
+    assert cm.get("a.bin")["content"] == base64.b64encode(b"\x00\xff").decode()
+
+
+def test_text_chunks(contents_manager):
+    cm = contents_manager
+    save_chunk(cm, "a.txt", 1, "Ünï", format="text")
+    save_chunk(cm, "a.txt", 2, "code ", format="text")
+    save_chunk(cm, "a.txt", -1, "text", format="text")
+    assert cm.get("a.txt")["content"] == "Ünïcode text"
+
+
+def test_stale_uploads_are_aborted(contents_manager):
+    cm = contents_manager
+    save_chunk(cm, "stale.bin", 1, b"a")
+    upload_id = upload_state(cm, "stale.bin")["upload_id"]
+    assert upload_id in uploads(cm)
+
+    # Starting another upload aborts the ones without recent chunks
+    cm.fs.stale_upload_timeout = 0
+    save_chunk(cm, "a.bin", 1, b"b")
+    assert upload_id not in uploads(cm)
+    assert upload_state(cm, "stale.bin") is None
+    assert upload_state(cm, "a.bin")["upload_id"] in uploads(cm)
+    with pytest.raises(Exception, match="No chunked upload"):
+        save_chunk(cm, "stale.bin", 2, b"c")
@@ -1,9 +1,6 @@
-import time
-
 import pytest
 
 from s3contents import S3ContentsManager
-from s3contents.chunks import content_chunks
 from s3contents.tests.utils import *
 
 
@@ -38,17 +35,6 @@ class S3ContentsManagerLargeFileTestCase(TestLargeFileManager):
             path=api_path,
         )
 
-    def test_save(self):
-        current_value = content_chunks.get()
-        current_value["stale_file.txt"] = {
-            "started_at": time.time() - 4000,
-            "chunks": [],
-        }
-
-        super().test_save()
-
-        self.assertNotIn("stale_file.txt", current_value)
-
 
 # Needs to be removed or else we'll run the main IPython tests as well
 del TestLargeFileManager
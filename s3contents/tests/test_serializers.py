@@ -0,0 +1,47 @@
+import json
+
+import pytest
+
+from s3contents.ipycompat import TraitError, new_markdown_cell, new_notebook
+from s3contents.memorymanager import MemoryContentsManager
+from s3contents.serializers import JSONSerializer
+
+
+class SortedSerializer(JSONSerializer):
+    def dumps(self, nb):
+        return json.dumps(nb, sort_keys=True, indent=1)
+
+
+def notebook_model():
+    cells = [new_markdown_cell("Ünïcode {}".format(i)) for i in range(3)]
+    return {"type": "notebook", "content": new_notebook(cells=cells)}
+
+
+@pytest.mark.parametrize(
+    "name", ["json", "orjson", "s3contents.tests.test_serializers.SortedSerializer"]
+)
+def test_serializers(name):
+    if name == "orjson":
+        pytest.importorskip("orjson")
+    cm = MemoryContentsManager(notebook_serializer=name)
+    model = notebook_model()
+    cm.save(model, "a.ipynb")
+    assert cm.get("a.ipynb")["content"] == model["content"]
+
+    # Notebooks are read whatever the serializer that wrote them
+    other = MemoryContentsManager()
+    other.fs.files = cm.fs.files
+    assert other.get("a.ipynb")["content"] == model["content"]
+
+
+def test_old_notebooks_are_converted():
+    cm = MemoryContentsManager(notebook_serializer="orjson")
+    nb = {"nbformat": 3, "nbformat_minor": 0, "metadata": {}, "worksheets": []}
+    cm.fs.writenotebook("old.ipynb", json.dumps(nb))
+    assert cm.get("old.ipynb")["content"].nbformat == 4
+
+
+@pytest.mark.parametrize("name", ["pickle", "s3contents.tests.NoSerializer"])
+def test_invalid_serializer(name):
+    with pytest.raises(TraitError):
+        MemoryContentsManager(notebook_serializer=name)
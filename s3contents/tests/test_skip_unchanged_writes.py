@@ -0,0 +1,37 @@
+import pytest
+from fsspec.asyn import sync
+
+from s3contents.tests.utils import clean, make_contents_manager
+
+pytestmark = [pytest.mark.minio]
+
+
+@pytest.fixture
+def contents_manager():
+    cm = make_contents_manager(skip_unchanged_writes=True)
+    yield cm
+    clean(cm)
+
+
+def test_skip_unchanged_writes(contents_manager):
+    cm = contents_manager
+    puts = []
+    s3 = sync(cm.fs.fs.loop, cm.fs.fs.get_s3)
+    s3.meta.events.register(
+        "before-call.s3.PutObject", lambda **kwargs: puts.append(kwargs)
+    )
+
+    model = cm.new_untitled(type="notebook")
+    path = model["path"]
+    assert len(puts) == 1
+
+    # Autosave of an unchanged notebook
+    model = cm.get(path)
+    saved = cm.save(model, path)
+    assert len(puts) == 1
+    assert saved["path"] == path
+
+    # Changed by another client (one PUT): the content is uploaded again
+    cm.fs.fs.pipe_file(cm.fs.path(path), b"{}")
+    cm.save(model, path)
+    assert len(puts) == 3
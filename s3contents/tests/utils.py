@@ -1,3 +1,10 @@
+import os
+import urllib.request
+
+import pytest
+
+from s3contents import S3ContentsManager
+
 try:
     # only available in notebook < 7
     from notebook.services.contents.tests.test_largefilemanager import (
@@ -13,3 +20,56 @@ except ImportError:
 
     class TestLargeFileManager(object):
         pass
+
+
+# S3ContentsManager traits of the minio server running in localhost
+MINIO_CONFIG = dict(
+    access_key_id="access-key",
+    secret_access_key="secret-key",
+    endpoint_url="http://127.0.0.1:9000",
+    bucket="notebooks",
+    signature_version="s3v4",
+)
+
+
+def make_contents_manager(cls=S3ContentsManager, **kwargs):
+    """
+    Contents manager of the minio server running in localhost, `kwargs`
+    override its traits
+    """
+    config = dict(MINIO_CONFIG)
+    config.update(kwargs)
+    return cls(**config)
+
+
+def clean(cm):
+    """Remove everything under the root of `cm`"""
+    for item in cm.fs.ls(""):
+        cm.fs.rm(item)
+    cm.fs.rm(".s3contents")
+    cm.fs.init()
+
+
+def make_gcs_contents_manager(**kwargs):
+    """
+    Contents manager of the fake-gcs-server running in localhost, see `just
+    fake-gcs`, `kwargs` override its traits. Skips the test if it's not running.
+    """
+    import gcsfs
+
+    from s3contents.gcs import GCSContentsManager
+
+    endpoint = os.environ.get("STORAGE_EMULATOR_HOST", "http://localhost:4443")
+    try:
+        urllib.request.urlopen(endpoint + "/storage/v1/b", timeout=1)
+    except OSError:
+        pytest.skip("No fake-gcs-server running at {}".format(endpoint))
+    # Read by gcsfs when the file system is created
+    os.environ["STORAGE_EMULATOR_HOST"] = endpoint
+
+    fs = gcsfs.GCSFileSystem(project="test", token="anon")
+    if not fs.exists("notebooks"):
+        fs.mkdir("notebooks")
+    config = dict(project="test", token="anon", bucket="notebooks")
+    config.update(kwargs)
+    return GCSContentsManager(**config)